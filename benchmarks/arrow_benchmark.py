@@ -0,0 +1,65 @@
+"""Microbenchmark comparing protobuf rows with Arrow record batches: encoding CPU time and bytes on the wire.
+
+Run with: uv run python benchmarks/arrow_benchmark.py --rows 100000
+"""
+
+import time
+from collections.abc import Callable, Iterable
+from functools import partial
+from typing import Annotated
+
+import pyarrow as pa
+import typer
+from google.cloud.bigquery_storage_v1 import types
+
+from bigquery_storage_write_api_examples.arrow_rows import (
+    ArrowRequestBatcher,
+    arrow_schema_for_table,
+)
+from bigquery_storage_write_api_examples.fake_data_generator import BulkFakeDataGenerator
+from bigquery_storage_write_api_examples.request_batcher import RequestBatcher
+from bigquery_storage_write_api_examples.row_encoder import RowEncoder
+from bigquery_storage_write_api_examples.table_registry import MESSAGE_CLASSES
+
+
+def _measure(build: Callable[[], Iterable[types.AppendRowsRequest]]) -> tuple[float, int]:
+    """CPU seconds spent building the requests and their total serialized size"""
+    start = time.process_time()
+    requests = list(build())
+    cpu = time.process_time() - start
+    return cpu, sum(request._pb.ByteSize() for request in requests)
+
+
+def main(
+    rows: Annotated[int, typer.Option(help="Number of rows per entity")] = 100_000,
+    batch_size: Annotated[int, typer.Option(help="Maximum number of rows per request")] = 1_000,
+):
+    faker = BulkFakeDataGenerator(seed=0)
+
+    print(
+        f"{'entity':<12} {'format':<14} {'CPU s':>8} {'rows/s':>12} {'wire MB':>9} {'bytes/row':>10} {'vs proto':>9}"
+    )
+    for entity, message_class in MESSAGE_CLASSES.items():
+        data = faker.generate_fake(entity, rows)
+        proto_batcher = RequestBatcher(RowEncoder.for_message(message_class), max_rows=batch_size)
+        arrow_batcher = ArrowRequestBatcher(arrow_schema_for_table(entity), max_rows=batch_size)
+        # Columnar data that already has the schema, like a Parquet file, skips the row conversion entirely
+        table = pa.Table.from_batches(list(arrow_batcher.record_batches(data)), schema=arrow_batcher.schema)
+
+        cases = {
+            "proto": partial(proto_batcher.requests, data),
+            "arrow rows": partial(arrow_batcher.requests, data),
+            "arrow columnar": partial(arrow_batcher.table_requests, table),
+        }
+        baseline = None
+        for name, build in cases.items():
+            cpu, wire_bytes = _measure(build)
+            baseline = baseline or wire_bytes
+            print(
+                f"{entity:<12} {name:<14} {cpu:>8.3f} {rows / cpu if cpu else float('inf'):>12,.0f} "
+                f"{wire_bytes / 1_000_000:>9.2f} {wire_bytes / rows:>10.1f} {wire_bytes / baseline:>8.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,64 @@
+"""Microbenchmark of gRPC request compression per entity: CPU time spent compressing versus bytes saved on the wire.
+
+Run with: uv run python benchmarks/compression_benchmark.py --rows 100000 --link-mbps 100 --link-mbps 1000
+"""
+
+import time
+from typing import Annotated
+
+import typer
+
+from bigquery_storage_write_api_examples.compression import Compression, compressed_size
+from bigquery_storage_write_api_examples.fake_data_generator import BulkFakeDataGenerator
+from bigquery_storage_write_api_examples.request_batcher import RequestBatcher
+from bigquery_storage_write_api_examples.row_encoder import RowEncoder
+from bigquery_storage_write_api_examples.table_registry import MESSAGE_CLASSES
+
+
+def _measure(payloads: list[bytes], compression: Compression) -> tuple[float, int]:
+    """CPU seconds spent compressing the requests like gRPC does and their total size on the wire"""
+    if compression is Compression.NONE:
+        return 0.0, sum(len(payload) for payload in payloads)
+    start = time.process_time()
+    wire_bytes = sum(compressed_size(payload, compression) for payload in payloads)
+    return time.process_time() - start, wire_bytes
+
+
+def main(
+    rows: Annotated[int, typer.Option(help="Number of rows per entity")] = 100_000,
+    batch_size: Annotated[int, typer.Option(help="Maximum number of rows per request")] = 1_000,
+    link_mbps: Annotated[
+        list[int] | None, typer.Option(help="Link speeds in Mbit/s to compare rows/s at [default: 100, 1000]")
+    ] = None,
+):
+    faker = BulkFakeDataGenerator(seed=0)
+    links = link_mbps or [100, 1_000]
+
+    # Compression runs next to the network (gRPC compresses in its own threads while earlier requests are on the
+    # wire), so the rows per second of a link are bounded by the slower of the two
+    print(
+        f"{'entity':<12} {'codec':<8} {'raw MB':>8} {'wire MB':>8} {'ratio':>6} {'CPU s':>7} {'CPU MB/s':>9} "
+        f"{'pays below':>11} " + " ".join(f"{f'rows/s @{link}M':>15}" for link in links)
+    )
+    for entity, message_class in MESSAGE_CLASSES.items():
+        data = faker.generate_fake(entity, rows)
+        batcher = RequestBatcher(RowEncoder.for_message(message_class), max_rows=batch_size)
+        payloads = [request._pb.SerializeToString() for request in batcher.requests(data)]
+        raw_bytes = sum(len(payload) for payload in payloads)
+
+        for compression in Compression:
+            cpu, wire_bytes = _measure(payloads, compression)
+            # Compression speeds up links slower than the bytes it saves per CPU second
+            break_even = (raw_bytes - wire_bytes) * 8 / cpu / 1_000_000 if cpu else None
+            rates = [rows / max(cpu, wire_bytes * 8 / (link * 1_000_000)) for link in links]
+            print(
+                f"{entity:<12} {compression.value:<8} {raw_bytes / 1_000_000:>8.2f} {wire_bytes / 1_000_000:>8.2f} "
+                f"{wire_bytes / raw_bytes:>6.2f} {cpu:>7.3f} "
+                f"{f'{raw_bytes / cpu / 1_000_000:.1f}' if cpu else '-':>9} "
+                f"{f'{break_even:,.0f} Mbit/s' if break_even else '-':>11} "
+                + " ".join(f"{rate:>15,.0f}" for rate in rates)
+            )
+
+
+if __name__ == "__main__":
+    typer.run(main)
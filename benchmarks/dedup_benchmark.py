@@ -0,0 +1,79 @@
+"""Microbenchmark of the client-side deduplication: keys per second, memory and false positives at millions of keys.
+
+A stream of keys with a share of replays (keys repeated from the recent past) goes through a RotatingBloomFilter
+and an exact set. False positives are new keys the filter drops, misses are recent repeats it lets through.
+
+Run with: uv run python benchmarks/dedup_benchmark.py --keys 5000000 --capacity 1000000 --replay-rate 0.1
+"""
+
+import sys
+import time
+from typing import Annotated
+
+import numpy as np
+import typer
+
+from bigquery_storage_write_api_examples.dedup import DEFAULT_CHUNK_ROWS, RotatingBloomFilter, RowDeduplicator
+
+
+def _keys(count: int, replay_rate: float, replay_distance: int, seed: int) -> list[int]:
+    """Sequential new keys, with ``replay_rate`` of them replaced by one of the last ``replay_distance`` keys"""
+    rng = np.random.default_rng(seed)
+    keys = np.arange(count, dtype=np.int64)
+    replays = np.flatnonzero(rng.random(count) < replay_rate)
+    keys[replays] = np.maximum(0, replays - rng.integers(1, replay_distance + 1, size=len(replays)))
+    return keys.tolist()
+
+
+def main(
+    keys: Annotated[int, typer.Option(help="Number of keys")] = 5_000_000,
+    capacity: Annotated[int, typer.Option(help="Keys the filter remembers at least")] = 1_000_000,
+    false_positive_rate: Annotated[float, typer.Option(help="Target false positive rate")] = 0.001,
+    replay_rate: Annotated[float, typer.Option(help="Share of keys that repeat a recent key")] = 0.1,
+    exact: Annotated[bool, typer.Option(help="Compare with an exact set of every key seen")] = True,
+):
+    stream = _keys(keys, replay_rate, replay_distance=capacity, seed=0)
+    index = RotatingBloomFilter(capacity=capacity, false_positive_rate=false_positive_rate)
+
+    start = time.perf_counter()
+    seen = np.concatenate(
+        [index.add_many(stream[i : i + DEFAULT_CHUNK_ROWS]) for i in range(0, keys, DEFAULT_CHUNK_ROWS)]
+    )
+    elapsed = time.perf_counter() - start
+    print(
+        f"filter: {keys / elapsed:,.0f} keys/s, {index.memory_bytes / 1024**2:.1f} MiB, "
+        f"{index.hash_count} hashes, {index.rotations} rotations"
+    )
+
+    rows = [{"student_id": key} for key in stream[:1_000_000]]
+    deduplicator = RowDeduplicator("student_id", RotatingBloomFilter(capacity, false_positive_rate))
+    start = time.perf_counter()
+    for _ in deduplicator.filter(rows):
+        pass
+    print(f"rows:   {len(rows) / (time.perf_counter() - start):,.0f} rows/s through RowDeduplicator.filter")
+
+    if not exact:
+        return
+    # Every key repeats one at most capacity keys back, the filter should catch all of them
+    known: set[int] = set()
+    repeats = np.empty(keys, dtype=bool)
+    start = time.perf_counter()
+    for i, key in enumerate(stream):
+        repeats[i] = key in known
+        known.add(key)
+    elapsed = time.perf_counter() - start
+    set_bytes = sys.getsizeof(known) + sum(sys.getsizeof(key) for key in known)
+    print(f"set:    {keys / elapsed:,.0f} keys/s, {set_bytes / 1024**2:.1f} MiB")
+
+    new_keys = int((~repeats).sum())
+    false_positives = int((seen & ~repeats).sum())
+    misses = int((~seen & repeats).sum())
+    print(
+        f"false positives: {false_positives:,} of {new_keys:,} new keys ({false_positives / new_keys:.4%}, "
+        f"target {false_positive_rate:.4%}, estimated {index.false_positive_rate():.4%}), "
+        f"missed repeats: {misses:,} of {keys - new_keys:,}"
+    )
+
+
+if __name__ == "__main__":
+    typer.run(main)
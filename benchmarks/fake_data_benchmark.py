@@ -0,0 +1,54 @@
+"""Microbenchmark comparing the row-at-a-time FakeDataGenerator with the column-wise BulkFakeDataGenerator.
+
+Run with: uv run python benchmarks/fake_data_benchmark.py --rows 100000
+"""
+
+import time
+from collections.abc import Callable
+from typing import Annotated
+
+import typer
+from google.protobuf.json_format import ParseDict
+
+from bigquery_storage_write_api_examples.fake_data_generator import (
+    BulkFakeDataGenerator,
+    FakeDataGenerator,
+)
+from bigquery_storage_write_api_examples.row_encoder import RowEncoder
+from bigquery_storage_write_api_examples.table_registry import MESSAGE_CLASSES
+
+
+def _rows_per_second(
+    generate: Callable[[str, int], list[dict]], entity: str, rows: int
+) -> tuple[float, list[dict]]:
+    start = time.perf_counter()
+    data = generate(entity, rows)
+    return rows / (time.perf_counter() - start), data
+
+
+def main(
+    rows: Annotated[int, typer.Option(help="Number of bulk rows per entity")] = 100_000,
+    faker_rows: Annotated[
+        int, typer.Option(help="Number of rows per entity for the (slow) Faker baseline")
+    ] = 1_000,
+):
+    faker = FakeDataGenerator(seed=0)
+    bulk = BulkFakeDataGenerator(seed=0)
+
+    print(f"{'entity':<12} {'Faker rows/s':>14} {'bulk rows/s':>14} {'speedup':>8}")
+    for entity, message_class in MESSAGE_CLASSES.items():
+        before, _ = _rows_per_second(faker.generate_fake, entity, faker_rows)
+        # The vocabulary pools are filled by the first call, they are a one-off cost
+        bulk.generate_fake(entity, 1)
+        after, data = _rows_per_second(bulk.generate_fake, entity, rows)
+
+        encoder = RowEncoder.for_message(message_class)
+        for row in data[:1_000]:
+            if encoder.encode(row) != ParseDict(js_dict=row, message=message_class()).SerializeToString():
+                raise AssertionError(f"🛑 Bulk {entity} rows don't match the {message_class.__name__} schema")
+
+        print(f"{entity:<12} {before:>14,.0f} {after:>14,.0f} {after / before:>7.1f}x")
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,116 @@
+"""Cold start of the CLI: wall time and imports of short-lived commands, each in a fresh interpreter.
+
+Every command runs under ``python -X importtime``, the import tree is parsed from stderr to report the total import
+time, the slowest modules (cumulative, including what they import) and which heavy dependencies got loaded.
+
+Run with: uv run python benchmarks/import_time_benchmark.py --repeat 5 --budget-ms 150
+"""
+
+import shlex
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Annotated
+
+import typer
+
+SCHEMA = Path(__file__).resolve().parent.parent / "misc" / "schemas" / "students.json"
+CLI = "from bigquery_storage_write_api_examples.cli import app; app()"
+# Dependencies a command should only import when it needs them
+HEAVY_MODULES = [
+    "google.cloud.bigquery",
+    "google.cloud.bigquery_storage_v1",
+    "google.protobuf",
+    "grpc",
+    "faker",
+    "numpy",
+    "line_profiler",
+    "pydantic",
+]
+
+
+@dataclass
+class _Import:
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def _parse_importtime(stderr: str) -> list[_Import]:
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append(_Import(name.strip(), int(self_us), int(cumulative_us), depth))
+    return imports
+
+
+def _run(args: list[str]) -> tuple[float, list[_Import]]:
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CLI, *args], capture_output=True, text=True, check=False
+    )
+    elapsed = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise RuntimeError(f"🛑 'examples {shlex.join(args)}' failed:\n{completed.stderr[-2000:]}")
+    return elapsed, _parse_importtime(completed.stderr)
+
+
+def main(
+    command: Annotated[
+        list[str] | None,
+        typer.Option(help="CLI arguments to time, quoted as one string [default: --help and generate-proto]"),
+    ] = None,
+    repeat: Annotated[int, typer.Option(help="Runs per command, the fastest one is reported")] = 5,
+    top: Annotated[int, typer.Option(help="Slowest modules to list per command")] = 10,
+    budget_ms: Annotated[
+        float | None, typer.Option(help="Exit with 1 when a command spends longer importing")
+    ] = None,
+):
+    output_dir = Path(tempfile.mkdtemp(prefix="import_time_"))
+    commands = (
+        [shlex.split(c) for c in command]
+        if command
+        else [
+            ["--help"],
+            ["generate-proto", str(SCHEMA), str(output_dir / "students.proto")],
+        ]
+    )
+
+    over_budget = []
+    for args in commands:
+        runs = [_run(args) for _ in range(repeat)]
+        wall_times = [elapsed for elapsed, _ in runs]
+        # The fastest run has the least noise from the machine, its import tree is the one reported
+        _, imports = min(runs, key=lambda run: sum(i.self_us for i in run[1]))
+        import_ms = sum(i.self_us for i in imports) / 1000
+        modules = {i.module for i in imports}
+        heavy = [name for name in HEAVY_MODULES if name in modules]
+
+        print(f"\n$ examples {shlex.join(args)}")
+        print(
+            f"  wall {min(wall_times) * 1000:.0f} ms (median {statistics.median(wall_times) * 1000:.0f} ms), "
+            f"imports {import_ms:.0f} ms over {len(imports)} modules"
+        )
+        print(f"  heavy dependencies: {', '.join(heavy) or 'none'}")
+        print(f"  {'cumulative ms':>13} {'self ms':>8}  module")
+        # Top level imports only, their cumulative time covers what they import
+        for i in sorted((i for i in imports if i.depth == 0), key=lambda i: -i.cumulative_us)[:top]:
+            print(f"  {i.cumulative_us / 1000:>13.1f} {i.self_us / 1000:>8.1f}  {i.module}")
+        if budget_ms is not None and import_ms > budget_ms:
+            over_budget.append(f"{shlex.join(args)} ({import_ms:.0f} ms)")
+
+    if over_budget:
+        print(f"\n🛑 Over the {budget_ms:.0f} ms import budget: {'; '.join(over_budget)}")
+        raise typer.Exit(code=1)
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,68 @@
+"""Microbenchmark comparing ParseDict + SerializeToString with the compiled RowEncoder.
+
+Run with: uv run python benchmarks/row_encoder_benchmark.py --rows 20000
+"""
+
+import time
+from collections.abc import Callable
+from typing import Annotated
+
+import typer
+from google.protobuf.json_format import ParseDict
+
+from bigquery_storage_write_api_examples.entities.classes.classes_pb2 import RawClasses
+from bigquery_storage_write_api_examples.entities.courses.courses_pb2 import RawCourses
+from bigquery_storage_write_api_examples.entities.enrollments.enrollments_pb2 import (
+    RawEnrollments,
+)
+from bigquery_storage_write_api_examples.entities.students.students_pb2 import (
+    RawStudents,
+)
+from bigquery_storage_write_api_examples.fake_data_generator import FakeDataGenerator
+from bigquery_storage_write_api_examples.row_encoder import RowEncoder
+
+
+def _rows_per_second(
+    encode: Callable[[dict], bytes], rows: list[dict], repeat: int
+) -> tuple[float, list[bytes]]:
+    best = float("inf")
+    encoded: list[bytes] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        encoded = [encode(row) for row in rows]
+        best = min(best, time.perf_counter() - start)
+    return len(rows) / best, encoded
+
+
+def main(
+    rows: Annotated[int, typer.Option(help="Number of rows per entity")] = 10_000,
+    repeat: Annotated[int, typer.Option(help="Number of timed runs, the best one is reported")] = 3,
+):
+    faker = FakeDataGenerator()
+    entities = {
+        "students": (RawStudents, faker.generate_fake_students),
+        "courses": (RawCourses, faker.generate_fake_courses),
+        "enrollments": (RawEnrollments, faker.generate_fake_enrollments),
+        "classes": (RawClasses, faker.generate_fake_classes),
+    }
+
+    print(f"{'entity':<12} {'ParseDict rows/s':>18} {'RowEncoder rows/s':>18} {'speedup':>8}")
+    for entity, (message_class, generate) in entities.items():
+        data = generate(rows)
+        encoder = RowEncoder.for_message(message_class)
+
+        def parse_dict(row: dict, message_class=message_class) -> bytes:
+            return ParseDict(
+                js_dict=row, message=message_class(), ignore_unknown_fields=True
+            ).SerializeToString()
+
+        before, expected = _rows_per_second(parse_dict, data, repeat)
+        after, actual = _rows_per_second(encoder.encode, data, repeat)
+        if expected != actual:
+            raise AssertionError(f"🛑 RowEncoder output differs from ParseDict for {entity}")
+
+        print(f"{entity:<12} {before:>18,.0f} {after:>18,.0f} {after / before:>7.1f}x")
+
+
+if __name__ == "__main__":
+    typer.run(main)
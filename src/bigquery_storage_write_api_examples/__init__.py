@@ -1,7 +1,17 @@
-from pydantic import BaseModel, ConfigDict
+import importlib
 
+# Attributes of the package and the module they live in, imported on first access so that importing a submodule
+# (e.g. the CLI for a command that needs no config) doesn't pay for pydantic
+_LAZY_ATTRIBUTES = {
+    "Config": "bigquery_storage_write_api_examples.config",
+}
 
-class Config(BaseModel):
-    model_config = ConfigDict(extra="forbid")
-    gcp_project_id: str
-    gcp_dataset_id: str
+__all__ = list(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name: str):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name]), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,245 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Protocol
+
+from google.api_core.exceptions import AlreadyExists, GoogleAPICallError
+from google.cloud.bigquery_storage_v1 import types
+from google.cloud.bigquery_storage_v1.writer import AppendRowsFuture, AppendRowsStream
+
+from bigquery_storage_write_api_examples.compression import Compression, WireSizeEstimator
+from bigquery_storage_write_api_examples.metrics import StreamMetrics
+from bigquery_storage_write_api_examples.profiling import Stage, StageProfiler, timed
+from bigquery_storage_write_api_examples.request_batcher import request_row_count
+
+DEFAULT_MAX_IN_FLIGHT = 8
+
+# AppendRowsFuture.result() polls with the long running operation defaults of google-api-core, which sleep
+# for about a second before the first re-check. Poll done() with a short, growing interval instead.
+_MIN_POLL_INTERVAL = 0.00005
+_MAX_POLL_INTERVAL = 0.002
+
+
+def _wait_until_done(future: AppendRowsFuture | Future):
+    delay = _MIN_POLL_INTERVAL
+    while not future.done():
+        time.sleep(delay)
+        delay = min(delay * 2, _MAX_POLL_INTERVAL)
+
+
+def wait_for_ack(future: AppendRowsFuture | Future) -> types.AppendRowsResponse:
+    """Block until an append is acknowledged and return its response, raising the append error if it failed"""
+    _wait_until_done(future)
+    return future.result()
+
+
+@dataclass(slots=True)
+class PendingAppend:
+    """An AppendRowsRequest that was sent and is waiting for its acknowledgement"""
+
+    offset: int | None
+    row_count: int
+    # AppendRowsFuture or Future for the PipelinedAppendSender, asyncio.Future for the AsyncWriter
+    future: AppendRowsFuture | Future | asyncio.Future
+    sent_at: float = field(default_factory=time.perf_counter)
+    # When the response arrived, stamped by the PipelinedAppendSender even before it processes the acknowledgement
+    acked_at: float | None = None
+
+    @property
+    def end_offset(self) -> int | None:
+        """Offset right after the last row of this append"""
+        return None if self.offset is None else self.offset + self.row_count
+
+    @property
+    def latency(self) -> float | None:
+        """Seconds between sending the request and receiving its acknowledgement"""
+        return None if self.acked_at is None else self.acked_at - self.sent_at
+
+    def stamp_ack(self) -> float:
+        """Record the time of the acknowledgement, unless it's recorded already, and return it"""
+        if self.acked_at is None:
+            self.acked_at = time.perf_counter()
+        return self.acked_at
+
+
+AckCallback = Callable[[PendingAppend, types.AppendRowsResponse], None]
+
+
+def already_written_response(
+    append: PendingAppend, error: GoogleAPICallError
+) -> types.AppendRowsResponse | None:
+    """The response to treat as an acknowledgement when an append failed because its rows are already there
+
+    An ALREADY_EXISTS error for an append with an offset means a previous attempt (e.g. a run that crashed
+    before recording its acknowledgement) wrote the rows at that offset, so the append did succeed.
+
+    Returns:
+        types.AppendRowsResponse | None: The error response of the append, None if the error is a real failure
+    """
+    if append.offset is None or not isinstance(error, AlreadyExists):
+        return None
+    return (
+        error.response if isinstance(error.response, types.AppendRowsResponse) else types.AppendRowsResponse()
+    )
+
+
+def row_error_count(error: GoogleAPICallError) -> int:
+    """Number of row errors in the response of a failed append, 0 when the whole request failed"""
+    response = error.response
+    return len(response.row_errors) if isinstance(response, types.AppendRowsResponse) else 0
+
+
+class _AckStamper:
+    """
+    Stamps the acknowledgement time of appends from a daemon thread as soon as their future is done.
+
+    AppendRowsFuture.add_done_callback starts a thread per future that polls every second or so, responses on a
+    stream arrive in request order though, so one thread waits for the oldest append at a time. It exits when no
+    append is left and the next one starts it again.
+    """
+
+    def __init__(self):
+        self._appends: deque[PendingAppend] = deque()
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    def watch(self, append: PendingAppend):
+        with self._lock:
+            self._appends.append(append)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._stamp_all, name="ack-stamper", daemon=True)
+                self._thread.start()
+
+    def _stamp_all(self):
+        while True:
+            with self._lock:
+                if not self._appends:
+                    self._thread = None
+                    return
+                append = self._appends[0]
+            _wait_until_done(append.future)
+            append.stamp_ack()
+            with self._lock:
+                self._appends.popleft()
+
+
+class RequestStream(Protocol):
+    """Sends AppendRowsRequests and returns a future per request, like the AppendRowsStream"""
+
+    def send(self, request: types.AppendRowsRequest) -> AppendRowsFuture | Future: ...
+
+
+class PipelinedAppendSender:
+    """
+    Sends AppendRowsRequests on one AppendRowsStream while keeping up to ``max_in_flight`` of them unacknowledged.
+
+    Responses on a stream arrive in request order, so acknowledgements are processed oldest first. When the window
+    is full, ``send`` blocks on the oldest request. A failed append is raised from ``send`` or ``drain`` in the
+    order the requests were sent, after logging the offset and row errors it belongs to.
+
+    Works for every stream type: requests with an offset (committed, pending and buffered streams) advance
+    ``acked_offset``, requests without one (the default stream) only count towards ``acked_rows``. An append with
+    an offset that fails with ALREADY_EXISTS counts as acknowledged, its rows were written by an earlier attempt.
+
+    With ``metrics`` every request is recorded when it's sent, acknowledged or failed, see StreamMetrics. Pass the
+    ``compression`` of the stream's channel to record the compressed size of the requests as well. With a
+    ``profiler`` the send and await ack stages are timed.
+    """
+
+    def __init__(
+        self,
+        append_rows_stream: AppendRowsStream | RequestStream,
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+        on_ack: AckCallback | None = None,
+        metrics: StreamMetrics | None = None,
+        profiler: StageProfiler | None = None,
+        compression: Compression = Compression.NONE,
+    ):
+        if max_in_flight < 1:
+            raise ValueError("🛑 max_in_flight must be positive")
+        self.logger = logging.getLogger(__name__)
+        self.append_rows_stream = append_rows_stream
+        self.max_in_flight = max_in_flight
+        self.on_ack = on_ack
+        self.metrics = metrics
+        self.wire_size = WireSizeEstimator(compression)
+        # Wrapped once with the profiler, an unprofiled sender calls the methods themselves
+        self._timed_send = timed(profiler, Stage.SEND, self._send)
+        self._timed_complete_oldest = timed(profiler, Stage.AWAIT_ACK, self._complete_oldest)
+
+        self.acked_rows = 0
+        # Offset right after the last acknowledged row, this is where a resumed stream continues
+        self.acked_offset: int | None = None
+        self._in_flight: deque[PendingAppend] = deque()
+        # Acknowledgements are only processed on the next send or drain, the latency ends when the response arrives
+        self._ack_stamper = _AckStamper()
+
+    @property
+    def in_flight(self) -> int:
+        """Number of requests waiting for an acknowledgement"""
+        return len(self._in_flight)
+
+    def send(self, request: types.AppendRowsRequest) -> PendingAppend:
+        """Send a request, first waiting for the oldest in-flight request if the window is full"""
+        return self._timed_send(request)
+
+    def _send(self, request: types.AppendRowsRequest) -> PendingAppend:
+        self._process_completed()
+        while len(self._in_flight) >= self.max_in_flight:
+            self._timed_complete_oldest()
+
+        offset = request.offset if request._pb.HasField("offset") else None
+        row_count = request_row_count(request)
+        sent_at = time.perf_counter()
+        future = self.append_rows_stream.send(request)
+        append = PendingAppend(offset, row_count, future, sent_at)
+        self._ack_stamper.watch(append)
+        self._in_flight.append(append)
+        if self.metrics is not None:
+            byte_count = request._pb.ByteSize()
+            self.metrics.sent(row_count, byte_count, self.wire_size.wire_size(request, byte_count))
+        return append
+
+    def drain(self):
+        """Wait until every in-flight request is acknowledged"""
+        while self._in_flight:
+            self._timed_complete_oldest()
+
+    def _process_completed(self):
+        # Handle acknowledgements that already arrived without blocking, so callbacks run promptly
+        while self._in_flight and self._in_flight[0].future.done():
+            self._timed_complete_oldest()
+
+    def _complete_oldest(self):
+        append = self._in_flight.popleft()
+        try:
+            response = wait_for_ack(append.future)
+        except GoogleAPICallError as e:
+            response = already_written_response(append, e)
+            if response is not None:
+                self.logger.debug(f"♻️ Rows at offset {append.offset} were already written, skipping them")
+                if self.metrics is not None:
+                    self.metrics.retried(append.row_count)
+            else:
+                if self.metrics is not None:
+                    self.metrics.failed(append.row_count, row_error_count(e))
+                self.logger.error(
+                    f"🚨 Append at offset {append.offset} with {append.row_count} rows failed: {e.message}"
+                )
+                if e.response is not None:
+                    self.logger.error(f"🚨 Response for offset {append.offset}: {e.response}")
+                raise
+        acked_at = append.stamp_ack()
+        if self.metrics is not None:
+            self.metrics.acked(append.row_count, acked_at - append.sent_at)
+
+        self.acked_rows += append.row_count
+        if append.end_offset is not None:
+            self.acked_offset = append.end_offset
+        if self.on_ack is not None:
+            self.on_ack(append, response)
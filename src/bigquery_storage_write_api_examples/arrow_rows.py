@@ -0,0 +1,253 @@
+from collections.abc import Callable, Iterable, Iterator
+from datetime import date, datetime, time
+from decimal import Decimal
+from pathlib import Path
+from typing import Any
+
+from google.cloud.bigquery_storage_v1 import types
+
+from bigquery_storage_write_api_examples.profiling import Stage, StageProfiler, iterate, timed
+from bigquery_storage_write_api_examples.request_batcher import (
+    DEFAULT_MAX_REQUEST_BYTES,
+    DEFAULT_MAX_ROWS_PER_REQUEST,
+    BatchSizer,
+)
+from bigquery_storage_write_api_examples.schema_descriptor import SCHEMAS_DIR, load_table_schema
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError(
+            "🛑 Arrow rows (row_format: arrow) require pyarrow, install the 'arrow' extra of this package"
+        )
+
+
+def arrow_schema(bigquery_schema: list[dict]) -> "pa.Schema":
+    """Convert a BigQuery schema JSON into the Arrow schema the Storage Write API expects for it
+
+    Timestamps are microseconds in UTC, datetimes microseconds without a time zone, NUMERIC is decimal128(38, 9)
+    and BIGNUMERIC decimal256(76, 38). REQUIRED fields are not nullable, REPEATED fields are lists.
+    """
+    _require_pyarrow()
+    return pa.schema([_arrow_field(field) for field in bigquery_schema])
+
+
+def arrow_schema_for_table(table_id: str, schemas_dir: str | Path = SCHEMAS_DIR) -> "pa.Schema":
+    """Arrow schema of a table from its schema JSON in ``misc/schemas``"""
+    return arrow_schema(load_table_schema(table_id, schemas_dir))
+
+
+def _arrow_field(field: dict) -> "pa.Field":
+    mode = field.get("mode", "NULLABLE").upper()
+    field_type = _arrow_type(field)
+    if mode == "REPEATED":
+        # Repeated fields can't be NULL, an absent value is an empty list
+        return pa.field(field["name"], pa.list_(pa.field("item", field_type, nullable=False)), nullable=False)
+    return pa.field(field["name"], field_type, nullable=mode != "REQUIRED")
+
+
+def _arrow_type(field: dict) -> "pa.DataType":
+    match field["type"].upper():
+        case "STRING" | "JSON" | "GEOGRAPHY":
+            return pa.string()
+        case "BYTES":
+            return pa.binary()
+        case "INTEGER" | "INT64":
+            return pa.int64()
+        case "FLOAT" | "FLOAT64":
+            return pa.float64()
+        case "BOOLEAN" | "BOOL":
+            return pa.bool_()
+        case "NUMERIC":
+            return pa.decimal128(38, 9)
+        case "BIGNUMERIC":
+            return pa.decimal256(76, 38)
+        case "DATE":
+            return pa.date32()
+        case "TIME":
+            return pa.time64("us")
+        case "DATETIME":
+            return pa.timestamp("us")
+        case "TIMESTAMP":
+            return pa.timestamp("us", tz="UTC")
+        case "RECORD" | "STRUCT":
+            return pa.struct([_arrow_field(subfield) for subfield in field["fields"]])
+    raise ValueError(f"🛑 Unsupported BigQuery type {field['type']} of field {field['name']}")
+
+
+def arrow_writer_schema(schema: "pa.Schema") -> types.AppendRowsRequest.ArrowData:
+    """ArrowData with only the writer schema, for the request template of an AppendRowsStream"""
+    return types.AppendRowsRequest.ArrowData(
+        writer_schema=types.ArrowSchema(serialized_schema=schema.serialize().to_pybytes())
+    )
+
+
+def build_arrow_request(record_batch: "pa.RecordBatch", offset: int | None = None) -> types.AppendRowsRequest:
+    """Wrap a record batch in an AppendRowsRequest, serialized as an Arrow IPC message without the schema
+
+    Args:
+        record_batch (pa.RecordBatch): Rows with the writer schema of the stream
+        offset (int | None): Offset of the first row in the stream, ``None`` to append without offset checks
+    """
+    request = types.AppendRowsRequest()
+    rows = request._pb.arrow_rows.rows
+    rows.serialized_record_batch = record_batch.serialize().to_pybytes()
+    rows.row_count = record_batch.num_rows
+    if offset is not None:
+        request.offset = offset
+    return request
+
+
+def _identity(value: Any) -> Any:
+    return value
+
+
+class ArrowRowConverter:
+    """
+    Converts row dictionaries in the form the RowEncoder takes into values pyarrow accepts for the Arrow schema.
+
+    Dates, times and datetimes are ISO 8601 strings in the protobuf rows and become ``date``, ``time`` and
+    ``datetime`` objects, NUMERIC strings become ``Decimal``. Timestamps in microseconds are taken as they are.
+    Only the fields that need it are touched, the converter is compiled once per schema.
+    """
+
+    def __init__(self, schema: "pa.Schema"):
+        _require_pyarrow()
+        self.schema = schema
+        self._convert = _struct_converter(list(schema))
+
+    def convert(self, row: dict) -> dict:
+        return self._convert(row)
+
+
+def _struct_converter(fields: list) -> Callable[[dict], dict]:
+    converters = [(field.name, _value_converter(field.type)) for field in fields]
+    converters = [(name, convert) for name, convert in converters if convert is not _identity]
+    if not converters:
+        return _identity
+
+    def convert(row: dict) -> dict:
+        row = dict(row)
+        for name, convert_value in converters:
+            value = row.get(name)
+            if value is not None:
+                row[name] = convert_value(value)
+        return row
+
+    return convert
+
+
+def _value_converter(arrow_type: "pa.DataType") -> Callable[[Any], Any]:
+    if pa.types.is_struct(arrow_type):
+        return _struct_converter([arrow_type.field(i) for i in range(arrow_type.num_fields)])
+    if pa.types.is_list(arrow_type):
+        convert_item = _value_converter(arrow_type.value_type)
+        if convert_item is _identity:
+            return _identity
+        return lambda values: [convert_item(value) for value in values]
+    if pa.types.is_date32(arrow_type):
+        return _parse(date)
+    if pa.types.is_time64(arrow_type):
+        return _parse(time)
+    if pa.types.is_timestamp(arrow_type) and arrow_type.tz is None:
+        return _parse(datetime)
+    if pa.types.is_decimal(arrow_type):
+        return lambda value: Decimal(value) if isinstance(value, str) else value
+    return _identity
+
+
+def _parse(value_type: type) -> Callable[[Any], Any]:
+    def parse(value):
+        return value_type.fromisoformat(value) if isinstance(value, str) else value
+
+    return parse
+
+
+class ArrowRequestBatcher:
+    """
+    Packs rows into AppendRowsRequests with Arrow record batches, the Arrow counterpart of the RequestBatcher.
+
+    Row dictionaries are converted column-wise by pyarrow, record batches and tables (e.g. from Parquet files)
+    are only sliced and serialized, with no per-row work at all. Requests are cut at ``max_rows`` rows and split
+    further while their serialized batch is larger than ``max_bytes``. A ``batch_sizer`` replaces ``max_rows``
+    like for the RequestBatcher, and so does a ``profiler``.
+    """
+
+    def __init__(
+        self,
+        schema: "pa.Schema",
+        max_rows: int = DEFAULT_MAX_ROWS_PER_REQUEST,
+        max_bytes: int = DEFAULT_MAX_REQUEST_BYTES,
+        batch_sizer: BatchSizer | None = None,
+        profiler: StageProfiler | None = None,
+    ):
+        _require_pyarrow()
+        if max_rows < 1 or max_bytes < 1:
+            raise ValueError("🛑 max_rows and max_bytes must be positive")
+        self.schema = schema
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.batch_sizer = batch_sizer
+        self.converter = ArrowRowConverter(schema)
+        self.profiler = profiler
+        self._build_request = timed(profiler, Stage.BUILD_REQUEST, build_arrow_request)
+
+    def _max_rows(self) -> int:
+        return self.max_rows if self.batch_sizer is None else self.batch_sizer.rows_per_request
+
+    def record_batches(self, rows: Iterable[dict]) -> Iterator["pa.RecordBatch"]:
+        """Convert rows into record batches of at most ``max_rows`` rows, lazily"""
+        batch: list[dict] = []
+        convert = self.converter.convert
+        max_rows = self._max_rows()
+        for row in rows:
+            batch.append(convert(row))
+            if len(batch) >= max_rows:
+                yield pa.RecordBatch.from_pylist(batch, schema=self.schema)
+                batch = []
+                max_rows = self._max_rows()
+        if batch:
+            yield pa.RecordBatch.from_pylist(batch, schema=self.schema)
+
+    def requests(self, rows: Iterable[dict], offset: int | None = None) -> Iterator[types.AppendRowsRequest]:
+        """Convert rows and yield AppendRowsRequests, offsets work like in ``RequestBatcher.requests``"""
+        rows = iterate(self.profiler, Stage.GENERATE, rows)
+        return self._requests(iterate(self.profiler, Stage.ENCODE, self.record_batches(rows)), offset)
+
+    def table_requests(
+        self, table: "pa.Table | pa.RecordBatch", offset: int | None = None
+    ) -> Iterator[types.AppendRowsRequest]:
+        """Yield AppendRowsRequests for columnar data that already has the Arrow schema"""
+        if isinstance(table, pa.RecordBatch):
+            table = pa.Table.from_batches([table])
+        return self._requests(iter(table.cast(self.schema).to_batches(max_chunksize=self.max_rows)), offset)
+
+    def _requests(
+        self, record_batches: Iterable["pa.RecordBatch"], offset: int | None
+    ) -> Iterator[types.AppendRowsRequest]:
+        for record_batch in record_batches:
+            for request in self._fitting_requests(record_batch, offset):
+                yield request
+                if offset is not None:
+                    offset += request._pb.arrow_rows.rows.row_count
+
+    def _fitting_requests(
+        self, record_batch: "pa.RecordBatch", offset: int | None
+    ) -> Iterator[types.AppendRowsRequest]:
+        request = self._build_request(record_batch, offset)
+        size = len(request._pb.arrow_rows.rows.serialized_record_batch)
+        if size <= self.max_bytes:
+            if self.batch_sizer is not None:
+                self.batch_sizer.record_request(record_batch.num_rows, size)
+            yield request
+            return
+        if record_batch.num_rows == 1:
+            raise ValueError(f"🛑 Row of {size} bytes exceeds the request limit of {self.max_bytes} bytes")
+        half = record_batch.num_rows // 2
+        yield from self._fitting_requests(record_batch.slice(0, half), offset)
+        yield from self._fitting_requests(record_batch.slice(half), None if offset is None else offset + half)
@@ -0,0 +1,349 @@
+import asyncio
+import logging
+from collections import deque
+from collections.abc import AsyncIterator, Iterable
+from typing import Self
+
+from google.api_core import exceptions
+from google.api_core.exceptions import GoogleAPICallError
+from google.cloud.bigquery_storage_v1 import types
+from google.cloud.bigquery_storage_v1.services.big_query_write import (
+    BigQueryWriteAsyncClient,
+)
+from google.protobuf.descriptor import Descriptor
+from google.protobuf.descriptor_pb2 import DescriptorProto
+
+from bigquery_storage_write_api_examples.append_sender import (
+    DEFAULT_MAX_IN_FLIGHT,
+    AckCallback,
+    PendingAppend,
+    already_written_response,
+    row_error_count,
+)
+from bigquery_storage_write_api_examples.compression import Compression, WireSizeEstimator
+from bigquery_storage_write_api_examples.metrics import StreamMetrics, WriterMetrics
+from bigquery_storage_write_api_examples.request_batcher import (
+    DEFAULT_MAX_REQUEST_BYTES,
+    DEFAULT_MAX_ROWS_PER_REQUEST,
+    RequestBatcher,
+    build_request,
+    build_request_from_proto_rows,
+    request_row_count,
+)
+from bigquery_storage_write_api_examples.row_encoder import RowEncoder
+from bigquery_storage_write_api_examples.write_client import create_async_write_client
+from bigquery_storage_write_api_examples.write_session import WRITE_STREAM_TYPES, StreamType
+
+_END_OF_REQUESTS = None
+
+
+class AsyncWriter:
+    """
+    Writes rows to one write stream of a table from asyncio code, for any stream type.
+
+    The asyncio counterpart of WriteSession and PipelinedAppendSender: ``append`` encodes and batches the rows and
+    sends the requests on a single AppendRows call, keeping up to ``max_in_flight`` of them unacknowledged.
+    When the window is full, ``append`` waits for the oldest acknowledgement, so a fast producer is slowed down
+    instead of buffering requests without bound. Failed appends are raised from ``append`` or ``drain`` in the
+    order they were sent.
+
+    ``compression`` compresses the requests on the channel of a client created by the writer, and is what the sizes
+    recorded in ``metrics`` are estimated for.
+
+    Use it as an async context manager, the stream is finalized on a clean exit:
+
+        async with AsyncWriter(table_path, RawStudents.DESCRIPTOR) as writer:
+            await writer.append(students)
+    """
+
+    def __init__(
+        self,
+        table_path: str,
+        descriptor: Descriptor,
+        stream_type: StreamType = StreamType.DEFAULT,
+        write_client: BigQueryWriteAsyncClient | None = None,
+        max_rows_per_request: int = DEFAULT_MAX_ROWS_PER_REQUEST,
+        max_request_bytes: int = DEFAULT_MAX_REQUEST_BYTES,
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+        on_ack: AckCallback | None = None,
+        endpoint: str | None = None,
+        metrics: WriterMetrics | None = None,
+        compression: Compression = Compression.NONE,
+    ):
+        if max_in_flight < 1:
+            raise ValueError("🛑 max_in_flight must be positive")
+        self.logger = logging.getLogger(__name__)
+        self.table_path = table_path
+        self.descriptor = descriptor
+        self.stream_type = stream_type
+        self.write_client = write_client
+        self.endpoint = endpoint
+        self.max_in_flight = max_in_flight
+        self.on_ack = on_ack
+        self.writer_metrics = metrics
+        self.metrics: StreamMetrics | None = None
+        self.compression = compression
+        self.wire_size = WireSizeEstimator(compression)
+        self.batcher = RequestBatcher(
+            RowEncoder.for_descriptor(descriptor), max_rows=max_rows_per_request, max_bytes=max_request_bytes
+        )
+
+        self.stream_name: str | None = None
+        self.next_offset: int | None = None
+        self.acked_rows = 0
+        # Offset right after the last acknowledged row, this is where a resumed stream continues
+        self.acked_offset: int | None = None
+        self.closed = False
+
+        self._requests: asyncio.Queue[types.AppendRowsRequest | None] = asyncio.Queue()
+        # Appends in the order they were sent, popped by the response reader when their response arrives ...
+        self._unanswered: deque[PendingAppend] = deque()
+        # ... and by the writer once their acknowledgement has been processed
+        self._in_flight: deque[PendingAppend] = deque()
+        self._reader: asyncio.Task | None = None
+        self._rpc_error: Exception | None = None
+
+    async def __aenter__(self) -> Self:
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        # Don't finalize a stream that failed, so it can be inspected or resumed
+        await self.close(finalize=exc_type is None)
+
+    @property
+    def in_flight(self) -> int:
+        """Number of requests waiting for an acknowledgement"""
+        return len(self._in_flight)
+
+    async def open(self):
+        """Create the write stream, the AppendRows call itself is opened by the first append"""
+        if self.write_client is None:
+            self.write_client = create_async_write_client(self.endpoint, compression=self.compression)
+        if self.stream_type is StreamType.DEFAULT:
+            self.stream_name = f"{self.table_path}/streams/_default"
+            # The default stream doesn't support offsets
+            self.next_offset = None
+        else:
+            write_stream = types.WriteStream(type_=WRITE_STREAM_TYPES[self.stream_type])
+            write_stream = await self.write_client.create_write_stream(
+                parent=self.table_path, write_stream=write_stream
+            )
+            self.stream_name = write_stream.name
+            # The first request must always have an offset of 0
+            self.next_offset = 0
+        if self.writer_metrics is not None:
+            self.metrics = self.writer_metrics.stream(self.table_path, self.stream_name)
+        self.logger.debug(f"🌊 Opened {self.stream_type.value} stream '{self.stream_name}'")
+
+    async def append(self, rows: Iterable[dict]) -> list[PendingAppend]:
+        """Encode rows and send them in one or more requests, waiting only while the in-flight window is full
+
+        Returns:
+            list[PendingAppend]: The sent appends, await their ``future`` to wait for the acknowledgement
+        """
+        return [await self.append_serialized(batch) for batch in self.batcher.batches(rows)]
+
+    async def append_serialized(self, serialized_rows: list[bytes]) -> PendingAppend:
+        """Send one request with rows that are already serialized"""
+        await self._wait_for_window()
+        # No await between assigning the offset and queueing the request, so concurrent appends keep the order
+        request = build_request(serialized_rows, self.next_offset)
+        if self.next_offset is not None:
+            # Offset must equal the number of rows that were previously sent
+            self.next_offset += len(serialized_rows)
+        return self._send(request)
+
+    async def append_proto_rows(self, proto_rows: bytes | memoryview) -> PendingAppend:
+        """Send one request with rows in the ``ProtoRows`` wire format, e.g. a slice of a RowCorpus"""
+        await self._wait_for_window()
+        request = build_request_from_proto_rows(proto_rows, self.next_offset)
+        if self.next_offset is not None:
+            self.next_offset += request_row_count(request)
+        return self._send(request)
+
+    async def send(self, request: types.AppendRowsRequest) -> PendingAppend:
+        """Send a prepared request, its offset (if any) must continue where the previous request ended"""
+        await self._wait_for_window()
+        if self.next_offset is not None and request._pb.HasField("offset"):
+            self.next_offset = request.offset + request_row_count(request)
+        return self._send(request)
+
+    async def drain(self):
+        """Wait until every in-flight request is acknowledged"""
+        while self._in_flight:
+            await self._complete_oldest()
+
+    async def flush(self, offset: int | None = None) -> int:
+        """Make the rows of a BUFFERED stream visible up to and including ``offset``
+
+        Args:
+            offset (int | None): Last row to flush, by default every row that was sent (waiting for the acks)
+
+        Returns:
+            int: The flushed offset, -1 when there is nothing to flush
+        """
+        if self.stream_type is not StreamType.BUFFERED:
+            raise ValueError(
+                f"🛑 Only BUFFERED streams can be flushed, this is a {self.stream_type.value} stream"
+            )
+        if offset is None:
+            await self.drain()
+            if not self.acked_offset:
+                return -1
+            offset = self.acked_offset - 1
+        write_client, stream_name = self._opened()
+        request = types.FlushRowsRequest(write_stream=stream_name, offset=offset)
+        response = await write_client.flush_rows(request)
+        return response.offset
+
+    async def close(self, finalize: bool = True) -> int | None:
+        """Wait for the in-flight requests, end the AppendRows call and finalize the stream
+
+        Returns:
+            int | None: Row count of the finalized stream, None for the default stream or when not finalizing
+        """
+        if self.closed:
+            return None
+        self.closed = True
+        try:
+            await self.drain()
+        finally:
+            await self._end_call()
+            for append in self._in_flight:
+                # Appends after a failure fail as well, mark their errors as retrieved
+                if append.future.done():
+                    append.future.exception()
+
+        if not finalize or self.stream_type is StreamType.DEFAULT:
+            return None
+        write_client, stream_name = self._opened()
+        response = await write_client.finalize_write_stream(name=stream_name)
+        self.logger.debug(f"🏁 Finalized stream '{stream_name}' with {response.row_count} rows")
+        return response.row_count
+
+    @staticmethod
+    async def commit(
+        write_client: BigQueryWriteAsyncClient, table_path: str, writers: list["AsyncWriter"]
+    ) -> types.BatchCommitWriteStreamsResponse:
+        """Atomically commit finalized PENDING streams of one table"""
+        request = types.BatchCommitWriteStreamsRequest(
+            parent=table_path, write_streams=[writer.stream_name for writer in writers]
+        )
+        response = await write_client.batch_commit_write_streams(request)
+        if response.stream_errors:
+            raise RuntimeError(f"🛑 Committing the streams failed: {list(response.stream_errors)}")
+        return response
+
+    def _opened(self) -> tuple[BigQueryWriteAsyncClient, str]:
+        """The client and the name of the write stream, raises if the writer wasn't opened"""
+        if self.write_client is None or self.stream_name is None:
+            raise RuntimeError("🛑 The writer is not opened")
+        return self.write_client, self.stream_name
+
+    async def _wait_for_window(self):
+        if self.closed:
+            raise RuntimeError("🛑 The writer is closed")
+        self._opened()
+        # Handle acknowledgements that already arrived without waiting, so callbacks run promptly
+        while self._in_flight and self._in_flight[0].future.done():
+            await self._complete_oldest()
+        while len(self._in_flight) >= self.max_in_flight:
+            await self._complete_oldest()
+
+    def _send(self, request: types.AppendRowsRequest) -> PendingAppend:
+        if self._rpc_error is not None:
+            raise self._rpc_error
+        if self._reader is None:
+            self._start_call(request)
+        offset = request.offset if request._pb.HasField("offset") else None
+        append = PendingAppend(offset, request_row_count(request), asyncio.get_running_loop().create_future())
+        self._unanswered.append(append)
+        self._in_flight.append(append)
+        if self.metrics is not None:
+            byte_count = request._pb.ByteSize()
+            self.metrics.sent(append.row_count, byte_count, self.wire_size.wire_size(request, byte_count))
+        self._requests.put_nowait(request)
+        return append
+
+    def _start_call(self, request: types.AppendRowsRequest):
+        # Like the AppendRowsStream, only the first request of the call carries the stream name and writer schema
+        proto_descriptor = DescriptorProto()
+        self.descriptor.CopyToProto(proto_descriptor)
+        _, stream_name = self._opened()
+        request.write_stream = stream_name
+        request.proto_rows.writer_schema = types.ProtoSchema(proto_descriptor=proto_descriptor)
+        self._reader = asyncio.create_task(self._read_responses(), name=f"append-rows-{self.stream_name}")
+
+    async def _request_iterator(self) -> AsyncIterator[types.AppendRowsRequest]:
+        while (request := await self._requests.get()) is not _END_OF_REQUESTS:
+            yield request
+
+    async def _read_responses(self):
+        try:
+            call = await self.write_client.append_rows(
+                requests=self._request_iterator(),
+                # This header is required so that the BigQuery Storage API knows which region to route to
+                metadata=(("x-goog-request-params", f"write_stream={self.stream_name}"),),
+            )
+            # There is one response per request, in the order the requests were sent
+            async for response in call:
+                append = self._unanswered.popleft()
+                # The latency ends here, the writer may only process the acknowledgement later
+                append.stamp_ack()
+                if response.error.code:
+                    append.future.set_exception(
+                        exceptions.from_grpc_status(
+                            response.error.code, response.error.message, response=response
+                        )
+                    )
+                else:
+                    append.future.set_result(response)
+        except Exception as e:  # noqa: BLE001
+            # Any failure of the call fails the appends waiting for a response and is raised by the next send
+            self._rpc_error = e
+        finally:
+            # Appends without a response can't succeed anymore
+            while self._unanswered:
+                append = self._unanswered.popleft()
+                append.future.set_exception(
+                    self._rpc_error
+                    or exceptions.Aborted("The AppendRows call ended before the append was acknowledged")
+                )
+
+    async def _complete_oldest(self):
+        append = self._in_flight.popleft()
+        try:
+            response = await append.future
+        except GoogleAPICallError as e:
+            response = already_written_response(append, e)
+            if response is not None:
+                self.logger.debug(f"♻️ Rows at offset {append.offset} were already written, skipping them")
+                if self.metrics is not None:
+                    self.metrics.retried(append.row_count)
+            else:
+                if self.metrics is not None:
+                    self.metrics.failed(append.row_count, row_error_count(e))
+                self.logger.error(
+                    f"🚨 Append at offset {append.offset} with {append.row_count} rows failed: {e.message}"
+                )
+                if e.response is not None:
+                    self.logger.error(f"🚨 Response for offset {append.offset}: {e.response}")
+                raise
+        acked_at = append.stamp_ack()
+        if self.metrics is not None:
+            self.metrics.acked(append.row_count, acked_at - append.sent_at)
+
+        self.acked_rows += append.row_count
+        if append.end_offset is not None:
+            self.acked_offset = append.end_offset
+        if self.on_ack is not None:
+            self.on_ack(append, response)
+
+    async def _end_call(self):
+        if self._reader is None:
+            return
+        # Ending the request iterator half-closes the call, the server then ends the response stream
+        self._requests.put_nowait(_END_OF_REQUESTS)
+        await self._reader
+        self._reader = None
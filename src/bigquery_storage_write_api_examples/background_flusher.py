@@ -0,0 +1,246 @@
+import bisect
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Self
+
+from google.cloud.bigquery_storage_v1 import BigQueryWriteClient, types
+
+from bigquery_storage_write_api_examples import Config
+from bigquery_storage_write_api_examples.append_sender import PendingAppend
+from bigquery_storage_write_api_examples.metrics import StreamMetrics
+
+# Number of recent visibility latencies the percentiles of ``summary`` are computed from
+_LATENCY_SAMPLES = 10_000
+
+
+@dataclass(frozen=True)
+class FlushPolicy:
+    """When a BackgroundFlusher makes acknowledged rows visible, whichever condition is met first"""
+
+    # Flush once this many acknowledged rows are waiting, 1 flushes every acknowledged request right away
+    every_rows: int | None = None
+    # Flush once the oldest waiting acknowledgement is this old, bounds the delay the flusher adds
+    every_ms: float | None = None
+
+    def __post_init__(self):
+        if self.every_rows is not None and self.every_rows < 1:
+            raise ValueError("🛑 every_rows must be positive")
+        if self.every_ms is not None and self.every_ms <= 0:
+            raise ValueError("🛑 every_ms must be positive")
+
+
+@dataclass(slots=True)
+class _Waiting:
+    end_offset: int
+    sent_at: float
+    acked_at: float
+
+
+class BackgroundFlusher:
+    """
+    Advances the flush offset of a BUFFERED stream from a background thread, so appends keep flowing while rows are
+    made visible.
+
+    Feed it the acknowledgements of the stream through ``on_ack`` (an AckCallback). Only acknowledged rows are
+    flushed, one FlushRows call makes every row up to the last acknowledgement visible. When to flush is decided by
+    the FlushPolicy and by deadlines: ``visible_by`` asks for the rows before an offset to be visible at a given
+    time, the flusher waits as long as it can (the deadline minus the recent FlushRows latency) to cover as many
+    rows as possible with one call.
+
+    Fewer flushes mean fewer RPCs but staler rows. To see the trade-off the flusher measures the visibility latency
+    of every append, from sending it to the flush that made it visible, see ``summary`` and ``metrics``.
+
+    Use it as a context manager or call ``start`` and ``close``, which flushes the remaining acknowledged rows.
+    Without a ``policy`` every acknowledged request is flushed right away. A failed flush stops the flusher and is
+    raised from the next ``on_ack``, ``visible_by`` or ``visible_within`` and from ``close``.
+    """
+
+    def __init__(
+        self,
+        write_client: BigQueryWriteClient,
+        stream_name: str,
+        policy: FlushPolicy | None = None,
+        metrics: StreamMetrics | None = None,
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.write_client = write_client
+        self.stream_name = stream_name
+        self.policy = policy if policy is not None else FlushPolicy(every_rows=1)
+        self.metrics = metrics
+
+        # Offset right after the last acknowledged row, and right after the last visible row
+        self.acked_offset = 0
+        self.flushed_offset = 0
+        self.flushes = 0
+        self.deadline_misses = 0
+        self.error: Exception | None = None
+
+        self._condition = threading.Condition()
+        self._waiting: deque[_Waiting] = deque()
+        # Requested visibility as (deadline, end offset), earliest deadline first
+        self._deadlines: list[tuple[float, int]] = []
+        # Smoothed duration of a FlushRows call, flushes for a deadline start this much earlier
+        self._flush_latency = 0.0
+        self._visibility_latencies: deque[float] = deque(maxlen=_LATENCY_SAMPLES)
+        self._stopping = False
+        self._flush_on_stop = True
+        self._thread: threading.Thread | None = None
+
+    def __enter__(self) -> Self:
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Rows of a failed write aren't flushed, so the stream can be inspected or resumed
+        self.close(flush=exc_type is None)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="background-flusher", daemon=True)
+        self._thread.start()
+
+    def on_ack(self, append: PendingAppend, response: types.AppendRowsResponse):
+        """Acknowledgement callback of the sender, see ``AckCallback``"""
+        if self.error is not None:
+            raise self.error
+        if append.end_offset is None:
+            raise ValueError("🛑 Only appends with an offset can be flushed, is this a BUFFERED stream?")
+        with self._condition:
+            self.acked_offset = max(self.acked_offset, append.end_offset)
+            self._waiting.append(
+                _Waiting(append.end_offset, append.sent_at, append.acked_at or time.perf_counter())
+            )
+            self._condition.notify()
+
+    def visible_by(self, end_offset: int, deadline: float):
+        """Make the rows before ``end_offset`` visible by ``deadline``, a ``time.perf_counter()`` timestamp
+
+        Rows that aren't acknowledged at the deadline are flushed as soon as they are, the deadline counts as missed.
+        """
+        if self.error is not None:
+            raise self.error
+        with self._condition:
+            if end_offset > self.flushed_offset:
+                bisect.insort(self._deadlines, (deadline, end_offset))
+                self._condition.notify()
+
+    def visible_within(self, end_offset: int, seconds: float):
+        """Make the rows before ``end_offset`` visible within ``seconds`` from now"""
+        self.visible_by(end_offset, time.perf_counter() + seconds)
+
+    def close(self, flush: bool = True):
+        """Stop the flusher, by default after flushing every acknowledged row (drain the sender first)"""
+        with self._condition:
+            self._flush_on_stop = flush
+            self._stopping = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.error is not None:
+            raise self.error
+
+    def summary(self) -> dict:
+        """Flushes, rows made visible and the visibility latency of the appends so far"""
+        with self._condition:
+            latencies = sorted(self._visibility_latencies)
+            flushes, flushed_offset = self.flushes, self.flushed_offset
+
+        def percentile(fraction: float) -> float | None:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000, 3)
+
+        return {
+            "flushes": flushes,
+            "rows_flushed": flushed_offset,
+            "rows_per_flush": round(flushed_offset / flushes, 1) if flushes else None,
+            "flush_rpc_ms": round(self._flush_latency * 1000, 3),
+            "visibility_p50_ms": percentile(0.5),
+            "visibility_p99_ms": percentile(0.99),
+            "visibility_max_ms": percentile(1.0),
+            "deadline_misses": self.deadline_misses,
+        }
+
+    def _run(self):
+        with self._condition:
+            while True:
+                now = time.perf_counter()
+                if self._flush_due(now):
+                    offset = self.acked_offset
+                    self._condition.release()
+                    try:
+                        self._flush(offset)
+                    except Exception as e:  # noqa: BLE001
+                        # Nobody waits on this thread, the error is raised to the writer by its next call
+                        self.logger.error(
+                            f"🚨 Flushing '{self.stream_name}' up to offset {offset} failed: {e}"
+                        )
+                        self.error = e
+                        return
+                    finally:
+                        self._condition.acquire()
+                    continue
+                if self._stopping:
+                    return
+                self._condition.wait(self._seconds_until_due(now))
+
+    def _flush_due(self, now: float) -> bool:
+        unflushed_rows = self.acked_offset - self.flushed_offset
+        if unflushed_rows <= 0:
+            return False
+        if self._stopping:
+            return self._flush_on_stop
+        policy = self.policy
+        if policy.every_rows is not None and unflushed_rows >= policy.every_rows:
+            return True
+        if policy.every_ms is not None and now - self._waiting[0].acked_at >= policy.every_ms / 1000:
+            return True
+        return bool(self._deadlines) and self._deadlines[0][0] - self._flush_latency <= now
+
+    def _seconds_until_due(self, now: float) -> float | None:
+        if self.acked_offset <= self.flushed_offset:
+            # Nothing to flush, an acknowledgement or a new deadline wakes the flusher up
+            return None
+        due = []
+        if self.policy.every_ms is not None:
+            due.append(self._waiting[0].acked_at + self.policy.every_ms / 1000)
+        if self._deadlines:
+            due.append(self._deadlines[0][0] - self._flush_latency)
+        return max(0.0, min(due) - now) if due else None
+
+    def _flush(self, offset: int):
+        started = time.perf_counter()
+        # The offset of FlushRows is the last row to make visible
+        self.write_client.flush_rows(types.FlushRowsRequest(write_stream=self.stream_name, offset=offset - 1))
+        visible_at = time.perf_counter()
+
+        with self._condition:
+            rows = offset - self.flushed_offset
+            self.flushed_offset = offset
+            self.flushes += 1
+            elapsed = visible_at - started
+            self._flush_latency += (elapsed - self._flush_latency) * (1.0 if self.flushes == 1 else 0.3)
+            while self._waiting and self._waiting[0].end_offset <= offset:
+                latency = visible_at - self._waiting.popleft().sent_at
+                self._visibility_latencies.append(latency)
+                if self.metrics is not None:
+                    self.metrics.visible(latency)
+            # Deadlines of rows that aren't acknowledged yet stay, they are flushed as soon as the rows are
+            remaining = []
+            for deadline, end_offset in self._deadlines:
+                if end_offset > offset:
+                    remaining.append((deadline, end_offset))
+                elif visible_at > deadline:
+                    self.deadline_misses += 1
+            self._deadlines = remaining
+        if self.metrics is not None:
+            self.metrics.flushed(rows)
+        self.logger.debug(f"🚿 Flushed {rows} rows of '{self.stream_name}' up to offset {offset}")
+
+
+def configured_flush_policy(config: Config) -> FlushPolicy:
+    """Return the flush policy set by ``flush_every_rows`` and ``flush_interval_ms`` in the config"""
+    return FlushPolicy(every_rows=config.flush_every_rows, every_ms=config.flush_interval_ms)
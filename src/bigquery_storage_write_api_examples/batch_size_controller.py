@@ -0,0 +1,183 @@
+import logging
+import threading
+import time
+from enum import Enum
+
+from google.cloud.bigquery_storage_v1 import types
+
+from bigquery_storage_write_api_examples import Config
+from bigquery_storage_write_api_examples.append_sender import PendingAppend
+from bigquery_storage_write_api_examples.request_batcher import DEFAULT_MAX_REQUEST_BYTES
+
+DEFAULT_TARGET_LATENCY = 0.5
+DEFAULT_MAX_ADAPTIVE_ROWS = 100_000
+
+# Requests are kept this far below the byte limit, so a batch of wider than average rows still fits
+_BYTES_HEADROOM = 0.9
+# Largest change of the batch size in one adjustment, in either direction
+_MAX_STEP = 2.0
+# Throughput changes smaller than this are noise, not a reason to change direction
+_THROUGHPUT_TOLERANCE = 0.02
+
+
+class BatchGoal(Enum):
+    # Keep the acknowledgement latency at the target
+    LATENCY = "latency"
+    # Find the batch size with the most rows per second, with acknowledgements no slower than the target
+    THROUGHPUT = "throughput"
+
+
+class BatchSizeController:
+    """
+    Adjusts the rows per request of a RequestBatcher or ArrowRequestBatcher at runtime.
+
+    The batcher reports the rows and encoded bytes of every request it cuts, the sender reports every
+    acknowledgement through ``on_ack``. Every ``adjust_every`` acknowledgements the batch size is scaled:
+
+        - LATENCY: by the ratio of the target latency to the smoothed ack latency, so bigger batches while the
+          server answers quickly and smaller ones when it slows down
+        - THROUGHPUT: hill climbing on acknowledged rows per second, keeping the direction while throughput
+          improves and reversing it when it drops. Acks slower than the target always shrink the batches.
+
+    Batches never exceed what fits in ``max_bytes`` at the observed bytes per row, nor ``max_rows``. Requests that
+    were already cut when the size changed (buffered in a pipeline or in flight) keep their old size, their acks
+    are left out of the measurements of the new size.
+    """
+
+    def __init__(
+        self,
+        initial_rows: int = 500,
+        goal: BatchGoal = BatchGoal.LATENCY,
+        target_latency: float = DEFAULT_TARGET_LATENCY,
+        min_rows: int = 1,
+        max_rows: int = DEFAULT_MAX_ADAPTIVE_ROWS,
+        max_bytes: int = DEFAULT_MAX_REQUEST_BYTES,
+        adjust_every: int = 4,
+        smoothing: float = 0.3,
+    ):
+        if not 1 <= min_rows <= max_rows:
+            raise ValueError("🛑 min_rows must be positive and at most max_rows")
+        if target_latency <= 0 or adjust_every < 1 or not 0 < smoothing <= 1:
+            raise ValueError(
+                "🛑 target_latency, adjust_every and smoothing must be positive, smoothing at most 1"
+            )
+        self.logger = logging.getLogger(__name__)
+        self.goal = goal
+        self.target_latency = target_latency
+        self.min_rows = min_rows
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.adjust_every = adjust_every
+        self.smoothing = smoothing
+        self.rows_per_request = min(max(initial_rows, min_rows), max_rows)
+
+        # Exponentially weighted moving averages of what the batcher and the sender observed
+        self.bytes_per_row: float | None = None
+        self.latency: float | None = None
+        self.throughput: float | None = None
+        self.adjustments = 0
+
+        self._lock = threading.Lock()
+        self._requests_cut = 0
+        self._requests_acked = 0
+        # Acks up to this count belong to requests cut before the last adjustment
+        self._settled_after = 0
+        self._window_rows = 0
+        self._window_acks = 0
+        self._window_start = time.perf_counter()
+        self._previous_throughput: float | None = None
+        self._direction = _MAX_STEP**0.5
+
+    def record_request(self, row_count: int, byte_count: int):
+        """Called by the batcher for every request it cuts"""
+        if row_count < 1:
+            return
+        with self._lock:
+            self._requests_cut += 1
+            self.bytes_per_row = self._smooth(self.bytes_per_row, byte_count / row_count)
+
+    def on_ack(self, append: PendingAppend, response: types.AppendRowsResponse):
+        """Acknowledgement callback of the sender, see ``AckCallback``"""
+        with self._lock:
+            self._requests_acked += 1
+            if self._requests_acked <= self._settled_after:
+                self._window_start = time.perf_counter()
+                return
+            if append.latency is not None:
+                self.latency = self._smooth(self.latency, append.latency)
+            self._window_rows += append.row_count
+            self._window_acks += 1
+            if self._window_acks >= self.adjust_every:
+                self._adjust()
+
+    def summary(self) -> dict:
+        """Current batch size and the observations it is based on"""
+        with self._lock:
+            return {
+                "goal": self.goal.value,
+                "rows_per_request": self.rows_per_request,
+                "bytes_per_row": round(self.bytes_per_row, 1) if self.bytes_per_row else None,
+                "ack_latency_ms": round(self.latency * 1000, 3) if self.latency is not None else None,
+                "rows_per_second": round(self.throughput, 1) if self.throughput is not None else None,
+                "adjustments": self.adjustments,
+            }
+
+    def _adjust(self):
+        now = time.perf_counter()
+        elapsed = now - self._window_start
+        throughput = self._window_rows / elapsed if elapsed > 0 else None
+        self._window_rows, self._window_acks, self._window_start = 0, 0, now
+        if throughput is not None:
+            self.throughput = throughput
+
+        if self.goal is BatchGoal.LATENCY or (
+            self.latency is not None and self.latency > self.target_latency
+        ):
+            # Latency isn't proportional to the batch size (round trips, queueing), half steps in log scale
+            # settle instead of oscillating around the target
+            factor = (self.target_latency / self.latency) ** 0.5 if self.latency else 1.0
+        elif throughput is None:
+            factor = 1.0
+        else:
+            previous = self._previous_throughput
+            if previous is not None and throughput < previous * (1 - _THROUGHPUT_TOLERANCE):
+                # The last step made it worse, go back the other way
+                self._direction = 1 / self._direction
+            factor = self._direction
+        self._previous_throughput = throughput
+
+        factor = min(max(factor, 1 / _MAX_STEP), _MAX_STEP)
+        rows = min(max(round(self.rows_per_request * factor), self.min_rows), self._byte_limited_rows())
+        if rows != self.rows_per_request:
+            self.logger.debug(
+                f"🎛️ Rows per request {self.rows_per_request} → {rows} "
+                f"(ack latency {self.latency * 1000 if self.latency else 0:.1f} ms, "
+                f"{self.throughput or 0:,.0f} rows/s)"
+            )
+            self.rows_per_request = rows
+            self.adjustments += 1
+            self._settled_after = self._requests_cut
+            # The next measurements are of the new size only
+            self.latency = None
+
+    def _byte_limited_rows(self) -> int:
+        if not self.bytes_per_row:
+            return self.max_rows
+        return max(
+            self.min_rows, min(self.max_rows, int(self.max_bytes * _BYTES_HEADROOM / self.bytes_per_row))
+        )
+
+    def _smooth(self, average: float | None, value: float) -> float:
+        return value if average is None else average + self.smoothing * (value - average)
+
+
+def configured_batch_size_controller(config: Config, initial_rows: int) -> BatchSizeController | None:
+    """Return a controller for ``adaptive_batching`` in the config, None when batch sizes are fixed"""
+    if config.adaptive_batching == "off":
+        return None
+    return BatchSizeController(
+        initial_rows=initial_rows,
+        goal=BatchGoal(config.adaptive_batching),
+        target_latency=config.target_ack_latency_ms / 1000,
+        max_bytes=config.max_request_bytes,
+    )
@@ -0,0 +1,274 @@
+import itertools
+import logging
+import os
+import platform
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+
+from google.cloud.bigquery_storage_v1 import BigQueryWriteClient, types
+
+from bigquery_storage_write_api_examples.append_sender import PendingAppend
+from bigquery_storage_write_api_examples.fake_data_generator import (
+    BulkFakeDataGenerator,
+    FakeDataGenerator,
+)
+from bigquery_storage_write_api_examples.local_write_server import LocalWriteServer
+from bigquery_storage_write_api_examples.request_batcher import serialized_row_size
+from bigquery_storage_write_api_examples.row_corpus import CorpusBatch, RowCorpus
+from bigquery_storage_write_api_examples.row_encoder import RowEncoder
+from bigquery_storage_write_api_examples.table_registry import message_class
+from bigquery_storage_write_api_examples.write_client import create_write_client
+from bigquery_storage_write_api_examples.write_session import StreamType, WriteSession
+
+
+@dataclass(frozen=True)
+class BenchmarkCase:
+    stream_type: StreamType
+    batch_size: int
+    row_count: int
+    # Number of streams written in parallel, each from its own thread and connection
+    concurrency: int
+
+
+@dataclass
+class StageResult:
+    """Throughput and per-batch latency of one stage of a benchmark case"""
+
+    rows: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+    latencies: list[float] = field(default_factory=list)
+
+    def summary(self) -> dict:
+        p50, p95, p99 = percentiles(self.latencies, (50, 95, 99))
+        return {
+            "rows": self.rows,
+            "bytes": self.bytes,
+            "seconds": round(self.seconds, 6),
+            "rows_per_second": round(self.rows / self.seconds, 1) if self.seconds else None,
+            "mb_per_second": round(self.bytes / self.seconds / 1_000_000, 3) if self.seconds else None,
+            "p50_ms": p50,
+            "p95_ms": p95,
+            "p99_ms": p99,
+        }
+
+
+def percentiles(latencies: list[float], percents: tuple[int, ...]) -> list[float | None]:
+    """Nearest-rank percentiles in milliseconds"""
+    if not latencies:
+        return [None] * len(percents)
+    ordered = sorted(latencies)
+    return [
+        round(ordered[min(len(ordered) - 1, max(0, -(-percent * len(ordered) // 100) - 1))] * 1000, 3)
+        for percent in percents
+    ]
+
+
+class Benchmark:
+    """
+    Runs every stream type over a grid of batch sizes, row counts and concurrency levels and measures three stages:
+
+        - generation: building the fake rows with the (Bulk)FakeDataGenerator, per batch
+        - encoding: serializing the rows with the RowEncoder, per batch
+        - sending: appending the batches until the last acknowledgement (and commit), latency per acknowledgement
+
+    Generation and encoding don't depend on the stream type or concurrency, so they run once per batch size and
+    row count and their rows are reused by the cases that share them. With a RowCorpus they are skipped, the
+    pre-encoded rows of the corpus are replayed instead, and the row counts are the size of the corpus.
+
+    By default the writes go to an in-process LocalWriteServer, so no credentials are needed. It shares the GIL with
+    the writers, pass the endpoint of a server started with ``examples serve`` to keep it out of the measurement.
+    """
+
+    def __init__(
+        self,
+        table_id: str = "students",
+        stream_types: list[StreamType] | None = None,
+        batch_sizes: list[int] | None = None,
+        row_counts: list[int] | None = None,
+        concurrency_levels: list[int] | None = None,
+        max_in_flight: int = 8,
+        endpoint: str | None = None,
+        latency_ms: float = 0,
+        seed: int = 0,
+        bulk_fake_data: bool = False,
+        corpus: RowCorpus | None = None,
+    ):
+        self.logger = logging.getLogger(__name__)
+        if corpus is not None:
+            table_id = corpus.table_id
+            row_counts = [corpus.row_count]
+        self.table_id = table_id
+        self.descriptor = message_class(table_id).DESCRIPTOR
+        self.table_path = BigQueryWriteClient.table_path("bench", "bench", table_id)
+        self.cases = [
+            BenchmarkCase(*values)
+            for values in itertools.product(
+                stream_types or list(StreamType),
+                batch_sizes or [100, 1_000],
+                row_counts or [10_000],
+                concurrency_levels or [1, 4],
+            )
+        ]
+        self.max_in_flight = max_in_flight
+        self.endpoint = endpoint
+        self.latency_ms = latency_ms
+        self.seed = seed
+        self.bulk_fake_data = bulk_fake_data
+        self.corpus = corpus
+
+    def run(self) -> dict:
+        """Run every case and return the results, ready to be dumped as JSON"""
+        server = None
+        endpoint = self.endpoint
+        if endpoint is None:
+            # Rows are still decoded by the server, it's part of the work a real append costs
+            server = LocalWriteServer(latency_ms=self.latency_ms)
+            server.start()
+            endpoint = server.endpoint
+        try:
+            results = self._run_cases(endpoint)
+        finally:
+            if server is not None:
+                server.stop()
+        return {
+            "environment": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "endpoint": self.endpoint or "in-process",
+                "server_latency_ms": self.latency_ms if self.endpoint is None else None,
+                "max_in_flight": self.max_in_flight,
+                "table": self.table_id,
+                "bulk_fake_data": self.bulk_fake_data,
+                "corpus": str(self.corpus.path) if self.corpus is not None else None,
+            },
+            "results": results,
+        }
+
+    def _run_cases(self, endpoint: str) -> list[dict]:
+        results = []
+        prepared: dict[tuple[int, int], tuple[StageResult, StageResult, list[list[bytes] | CorpusBatch]]] = {}
+        for case in self.cases:
+            key = (case.batch_size, case.row_count)
+            if key not in prepared:
+                if self.corpus is not None:
+                    prepared[key] = StageResult(), StageResult(), list(self.corpus.batches(case.batch_size))
+                else:
+                    prepared[key] = self._generate_and_encode(case.batch_size, case.row_count)
+            generation, encoding, batches = prepared[key]
+
+            sending = self._send(case, batches, endpoint)
+            result = {
+                **asdict(case),
+                "stream_type": case.stream_type.value,
+                "generation": generation.summary(),
+                "encoding": encoding.summary(),
+                "sending": sending.summary(),
+            }
+            self.logger.info(
+                f"⏱️ {case.stream_type.value:<9} batch={case.batch_size:<6} rows={case.row_count:<8} "
+                f"concurrency={case.concurrency:<3} "
+                f"generation={result['generation']['rows_per_second']} rows/s "
+                f"encoding={result['encoding']['rows_per_second']} rows/s "
+                f"sending={result['sending']['rows_per_second']} rows/s "
+                f"({result['sending']['mb_per_second']} MB/s, p99 ack {result['sending']['p99_ms']} ms)"
+            )
+            results.append(result)
+        return results
+
+    def _generate_and_encode(
+        self, batch_size: int, row_count: int
+    ) -> tuple[StageResult, StageResult, list[list[bytes] | CorpusBatch]]:
+        generator_class = BulkFakeDataGenerator if self.bulk_fake_data else FakeDataGenerator
+        faker = generator_class(seed=self.seed)
+        encode = RowEncoder.for_descriptor(self.descriptor).encode
+        generation, encoding = StageResult(), StageResult()
+        # Typed like the batches replayed from a corpus, the send stage takes both
+        batches: list[list[bytes] | CorpusBatch] = []
+        for start in range(0, row_count, batch_size):
+            size = min(batch_size, row_count - start)
+            started = time.perf_counter()
+            rows = faker.generate_fake(self.table_id, size)
+            generated = time.perf_counter()
+            batch = [encode(row) for row in rows]
+            encoded = time.perf_counter()
+
+            batch_bytes = sum(serialized_row_size(row) for row in batch)
+            for stage, seconds in ((generation, generated - started), (encoding, encoded - generated)):
+                stage.rows += size
+                stage.bytes += batch_bytes
+                stage.seconds += seconds
+                stage.latencies.append(seconds)
+            batches.append(batch)
+        return generation, encoding, batches
+
+    def _send(
+        self, case: BenchmarkCase, batches: list[list[bytes] | CorpusBatch], endpoint: str
+    ) -> StageResult:
+        sending = StageResult()
+        lock = threading.Lock()
+
+        def on_ack(append: PendingAppend, response: types.AppendRowsResponse):
+            if append.latency is None:
+                return
+            with lock:
+                sending.latencies.append(append.latency)
+
+        # Every stream gets its own connection, the streams are created before the clock starts
+        sessions = [
+            WriteSession(
+                create_write_client(endpoint, dedicated_connection=True),
+                self.table_path,
+                case.stream_type,
+                self.descriptor,
+                max_in_flight=self.max_in_flight,
+                on_ack=on_ack,
+            )
+            for _ in range(case.concurrency)
+        ]
+        errors: list[Exception] = []
+
+        def write(session: WriteSession, session_batches: list[list[bytes] | CorpusBatch]):
+            try:
+                for batch in session_batches:
+                    if isinstance(batch, CorpusBatch):
+                        session.append_proto_rows(batch.proto_rows)
+                    else:
+                        session.append(batch)
+                if case.stream_type is StreamType.BUFFERED:
+                    session.flush()
+                session.close()
+            except Exception as e:  # noqa: BLE001
+                # Re-raised on the main thread once every session is done
+                errors.append(e)
+
+        try:
+            threads = [
+                threading.Thread(target=write, args=(session, batches[index :: case.concurrency]))
+                for index, session in enumerate(sessions)
+            ]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            if errors:
+                raise errors[0]
+            if case.stream_type is StreamType.PENDING:
+                WriteSession.commit(sessions[0].write_client, self.table_path, sessions)
+        finally:
+            # The dedicated connections of the sessions
+            for session in sessions:
+                session.write_client.transport.close()
+        sending.seconds = time.perf_counter() - started
+
+        for batch in batches:
+            if isinstance(batch, CorpusBatch):
+                sending.rows += batch.row_count
+                sending.bytes += len(batch.proto_rows)
+            else:
+                sending.rows += len(batch)
+                sending.bytes += sum(serialized_row_size(row) for row in batch)
+        return sending
@@ -0,0 +1,134 @@
+import json
+import logging
+import os
+import threading
+from dataclasses import asdict, dataclass
+from enum import Enum
+from pathlib import Path
+from typing import Self
+
+from google.cloud.bigquery_storage_v1 import types
+
+from bigquery_storage_write_api_examples.append_sender import AckCallback, PendingAppend
+
+
+class CheckpointState(Enum):
+    # Rows are still being appended, the stream can be resumed at the checkpointed offset
+    OPEN = "open"
+    # A PENDING stream was finalized but not committed yet, only the commit is left
+    FINALIZED = "finalized"
+    # Every row is written and visible
+    DONE = "done"
+
+
+@dataclass
+class Checkpoint:
+    """Progress of one write of a source into one write stream"""
+
+    # Identifies the source being written, e.g. the table and file of a load
+    key: str
+    table_path: str
+    stream_name: str
+    stream_type: str
+    # Offset right after the last acknowledged row, a resumed stream continues here
+    offset: int = 0
+    state: CheckpointState = CheckpointState.OPEN
+    # Identifies how the source was cut into requests, see CheckpointLog
+    fingerprint: str | None = None
+
+
+class CheckpointLog:
+    """
+    Durable record of the acknowledged offset of write streams, to resume a write after a crash.
+
+    Checkpoints are appended to a JSON lines file as acknowledgements arrive, the latest line of a key wins. The file
+    is compacted to one line per key when it's opened, and a torn last line from a crash is ignored.
+
+    Offsets are flushed to the OS on every acknowledgement but not synced to disk, a checkpoint can be slightly
+    behind the stream. That's safe: a resumed write re-sends the rows after the checkpoint with their original
+    offsets, and the appends BigQuery already has fail with ALREADY_EXISTS, which counts as acknowledged. This only
+    works if the rows are cut into exactly the same requests as before, which is what the ``fingerprint`` of a
+    checkpoint is for. State changes are synced to disk.
+    """
+
+    def __init__(self, path: str | Path):
+        self.logger = logging.getLogger(__name__)
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._checkpoints = self._read()
+        self._compact()
+        self._file = self.path.open("a")
+
+    def get(self, key: str) -> Checkpoint | None:
+        """Latest checkpoint of a key, None if it was never written"""
+        with self._lock:
+            return self._checkpoints.get(key)
+
+    def record(self, checkpoint: Checkpoint, sync: bool = False):
+        """Append the current state of a checkpoint to the log
+
+        Args:
+            checkpoint (Checkpoint): Checkpoint to record
+            sync (bool): Wait until the line is on disk, not just handed to the OS
+        """
+        line = json.dumps(_to_json(checkpoint)) + "\n"
+        with self._lock:
+            self._checkpoints[checkpoint.key] = checkpoint
+            self._file.write(line)
+            self._file.flush()
+            if sync:
+                os.fsync(self._file.fileno())
+
+    def on_ack(self, checkpoint: Checkpoint) -> AckCallback:
+        """Acknowledgement callback for a WriteSession that moves the checkpoint forward with every ack"""
+
+        def record_ack(append: PendingAppend, response: types.AppendRowsResponse):
+            if append.end_offset is not None and append.end_offset > checkpoint.offset:
+                checkpoint.offset = append.end_offset
+                self.record(checkpoint)
+
+        return record_ack
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _read(self) -> dict[str, Checkpoint]:
+        checkpoints: dict[str, Checkpoint] = {}
+        if not self.path.is_file():
+            return checkpoints
+        with self.path.open("r") as f:
+            for line_number, line in enumerate(f, start=1):
+                try:
+                    checkpoint = _from_json(json.loads(line))
+                except (ValueError, KeyError, TypeError):
+                    self.logger.warning(
+                        f"⚠️ Skipping unreadable line {line_number} of checkpoint log {self.path}"
+                    )
+                    continue
+                checkpoints[checkpoint.key] = checkpoint
+        return checkpoints
+
+    def _compact(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = self.path.with_suffix(f"{self.path.suffix}.{os.getpid()}.tmp")
+        with temporary.open("w") as f:
+            for checkpoint in self._checkpoints.values():
+                f.write(json.dumps(_to_json(checkpoint)) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.path)
+
+
+def _to_json(checkpoint: Checkpoint) -> dict:
+    return {**asdict(checkpoint), "state": checkpoint.state.value}
+
+
+def _from_json(data: dict) -> Checkpoint:
+    return Checkpoint(**{**data, "state": CheckpointState(data["state"])})
@@ -1,29 +1,23 @@
+import importlib
 import json
 import logging
 import os
 import warnings
 from enum import Enum
 from pathlib import Path
-from typing import Annotated
+from typing import TYPE_CHECKING, Annotated
 
 import typer
-import yaml
 
-from bigquery_storage_write_api_examples import Config
-from bigquery_storage_write_api_examples.examples.buffered_type_stream_writer_example import (
-    BufferedTypeStreamWriterExample,
-)
-from bigquery_storage_write_api_examples.examples.committed_type_stream_writer_example import (
-    CommittedTypeStreamWriterExample,
-)
-from bigquery_storage_write_api_examples.examples.default_stream_writer_example import (
-    DefaultStreamWriterExample,
-)
-from bigquery_storage_write_api_examples.examples.pending_type_stream_writer_example import (
-    PendingTypeStreamWriterExample,
-)
-from bigquery_storage_write_api_examples.prepare_bigquery import PrepareBigQueryService
-from bigquery_storage_write_api_examples.proto_file import ProtoFileGenerator
+# Only the option types are imported up front, every command imports what it uses so that a short-lived command
+# like generate-proto doesn't load the BigQuery clients, protobuf descriptors or Faker.
+# See benchmarks/import_time_benchmark.py.
+from bigquery_storage_write_api_examples.compression import Compression
+from bigquery_storage_write_api_examples.file_format import FileFormat
+from bigquery_storage_write_api_examples.stream_type import StreamType
+
+if TYPE_CHECKING:
+    from bigquery_storage_write_api_examples import Config
 
 logger = logging.getLogger("bigquery_storage_write_api_examples")
 logger.setLevel(logging.INFO)
@@ -40,6 +34,32 @@ class Examples(Enum):
     PENDING_TYPE_STREAM_WRITER = "pending-type-stream-writer"
     COMMITTED_TYPE_STREAM_WRITER = "committed-type-stream-writer"
     BUFFERED_TYPE_STREAM_WRITER = "buffered-type-stream-writer"
+    SHARDED_COMMITTED_TYPE_STREAM_WRITER = "sharded-committed-type-stream-writer"
+    ASYNC_STREAM_WRITER = "async-stream-writer"
+    MULTI_TABLE_DEFAULT_STREAM_WRITER = "multi-table-default-stream-writer"
+
+
+# Module and class of every example, imported when it runs
+EXAMPLE_CLASSES = {
+    Examples.DEFAULT_STREAM_WRITER: "default_stream_writer_example:DefaultStreamWriterExample",
+    Examples.PENDING_TYPE_STREAM_WRITER: "pending_type_stream_writer_example:PendingTypeStreamWriterExample",
+    Examples.COMMITTED_TYPE_STREAM_WRITER: "committed_type_stream_writer_example:CommittedTypeStreamWriterExample",
+    Examples.BUFFERED_TYPE_STREAM_WRITER: "buffered_type_stream_writer_example:BufferedTypeStreamWriterExample",
+    Examples.SHARDED_COMMITTED_TYPE_STREAM_WRITER: (
+        "sharded_committed_type_stream_writer_example:ShardedCommittedTypeStreamWriterExample"
+    ),
+    Examples.ASYNC_STREAM_WRITER: "async_stream_writer_example:AsyncStreamWriterExample",
+    Examples.MULTI_TABLE_DEFAULT_STREAM_WRITER: (
+        "multi_table_default_stream_writer_example:MultiTableDefaultStreamWriterExample"
+    ),
+}
+
+
+class ProfilingMode(Enum):
+    OFF = "off"
+    STAGES = "stages"
+    CPROFILE = "cprofile"
+    LINE = "line"
 
 
 app = typer.Typer(
@@ -59,18 +79,34 @@ app = typer.Typer(
 def _run(
     example: Annotated[Examples, typer.Argument(help="Example name")],
     path_to_config: Annotated[str, typer.Option(help="Path to config file")] = "conf.yaml",
+    profiling: Annotated[
+        ProfilingMode | None, typer.Option(help="Time the pipeline stages, overrides profiling in the config")
+    ] = None,
 ):
+    from bigquery_storage_write_api_examples.metrics import REGISTRY, PrometheusEndpoint
+
     logger.info(f"👯 Running example: {example}")
     config_ = _load_config(path_to_config)
-    match example:
-        case Examples.DEFAULT_STREAM_WRITER:
-            DefaultStreamWriterExample(config_).run()
-        case Examples.PENDING_TYPE_STREAM_WRITER:
-            PendingTypeStreamWriterExample(config_).run()
-        case Examples.COMMITTED_TYPE_STREAM_WRITER:
-            CommittedTypeStreamWriterExample(config_).run()
-        case Examples.BUFFERED_TYPE_STREAM_WRITER:
-            BufferedTypeStreamWriterExample(config_).run()
+    if profiling is not None:
+        config_ = config_.model_copy(update={"profiling": profiling.value})
+    if config_.metrics == "prometheus":
+        # Scrapable while the example runs, the final values are logged when it's done
+        with PrometheusEndpoint(REGISTRY, port=config_.metrics_port, host=config_.metrics_host):
+            _run_example(example, config_)
+    else:
+        _run_example(example, config_)
+    _log_metrics(config_)
+
+
+def _run_example(example: Examples, config_: "Config"):
+    example_class(example)(config_).run()
+
+
+def example_class(example: Examples) -> type:
+    """Import the class of ``example``"""
+    module_name, class_name = EXAMPLE_CLASSES[example].split(":")
+    module = importlib.import_module(f"bigquery_storage_write_api_examples.examples.{module_name}")
+    return getattr(module, class_name)
 
 
 @app.command(
@@ -80,12 +116,298 @@ def _run(
 )
 def bigquery_init(
     path_to_config: Annotated[str, typer.Option(help="Path to config file")] = "conf.yaml",
+    concurrency: Annotated[int, typer.Option(help="Tables checked or created at the same time")] = 8,
+    diff: Annotated[
+        bool, typer.Option(help="Update the schema of existing tables that differ from misc/schemas")
+    ] = False,
+    cache: Annotated[
+        bool, typer.Option(help="Skip the tables whose schema file is unchanged since the last run")
+    ] = True,
 ):
+    from bigquery_storage_write_api_examples.prepare_bigquery import PrepareBigQueryService, TableState
+
     config_ = _load_config(path_to_config)
-    PrepareBigQueryService(config_).prepare()
+    results = PrepareBigQueryService(config_, concurrency=concurrency).prepare(diff=diff, use_cache=cache)
+    failed = [table for table, state in results.items() if state is TableState.FAILED]
+    if failed:
+        logger.error(f"🛑 Preparing {', '.join(failed)} failed")
+        raise typer.Exit(code=1)
     logger.info("✅ BigQuery infrastructure prepared!")
 
 
+@app.command(
+    name="load",
+    help="📂 Stream the rows of an NDJSON, CSV or Parquet file into a table",
+    no_args_is_help=True,
+)
+def load(
+    table: Annotated[str, typer.Argument(help="Table (entity) to write, e.g. students")],
+    file: Annotated[str, typer.Argument(help="File to load")],
+    stream_type: Annotated[StreamType, typer.Option(help="Stream type to write with")] = StreamType.DEFAULT,
+    file_format: Annotated[
+        FileFormat | None, typer.Option("--format", help="File format, guessed from the extension by default")
+    ] = None,
+    checkpoint_file: Annotated[
+        str | None,
+        typer.Option(help="JSON lines log of the acknowledged offsets, to resume an interrupted load"),
+    ] = None,
+    resume: Annotated[
+        bool, typer.Option(help="Continue the interrupted load of the file from --checkpoint-file")
+    ] = False,
+    path_to_config: Annotated[str, typer.Option(help="Path to config file")] = "conf.yaml",
+):
+    from google.cloud.bigquery_storage_v1 import BigQueryWriteClient
+
+    from bigquery_storage_write_api_examples.compression import configured_compression
+    from bigquery_storage_write_api_examples.file_loader import FileLoader
+    from bigquery_storage_write_api_examples.metrics import configured_metrics
+    from bigquery_storage_write_api_examples.request_batcher import DEFAULT_MAX_ROWS_PER_REQUEST
+    from bigquery_storage_write_api_examples.table_registry import configured_message_class
+
+    config_ = _load_config(path_to_config)
+    FileLoader(
+        BigQueryWriteClient.table_path(config_.gcp_project_id, config_.gcp_dataset_id, table),
+        configured_message_class(config_, table).DESCRIPTOR,
+        stream_type=stream_type,
+        max_rows_per_request=config_.max_rows_per_request or DEFAULT_MAX_ROWS_PER_REQUEST,
+        max_request_bytes=config_.max_request_bytes,
+        max_in_flight=config_.max_in_flight_requests,
+        endpoint=config_.write_api_endpoint,
+        checkpoint_path=checkpoint_file,
+        metrics=configured_metrics(config_),
+        compression=configured_compression(config_),
+    ).load(file, file_format, resume=resume)
+    _log_metrics(config_)
+
+
+@app.command(
+    name="serve",
+    help="🧪 Run a local stand-in for the BigQuery Storage Write API, see write_api_endpoint in the config",
+    no_args_is_help=False,
+)
+def serve(
+    port: Annotated[int, typer.Option(help="Port to listen on")] = 50051,
+    host: Annotated[str, typer.Option(help="Host to listen on")] = "localhost",
+    latency_ms: Annotated[float, typer.Option(help="Delay of every acknowledgement in milliseconds")] = 0,
+    max_bytes_per_second: Annotated[
+        float | None, typer.Option(help="Bandwidth of every connection, unlimited by default")
+    ] = None,
+    error_rate: Annotated[float, typer.Option(help="Fraction of appends answered with an error")] = 0.0,
+    error_code: Annotated[str, typer.Option(help="gRPC status code of the injected errors")] = "INTERNAL",
+    decode_rows: Annotated[bool, typer.Option(help="Decode the rows with the writer schema")] = True,
+):
+    import grpc
+
+    from bigquery_storage_write_api_examples.local_write_server import LocalWriteServer
+
+    server = LocalWriteServer(
+        host=host,
+        port=port,
+        latency_ms=latency_ms,
+        max_bytes_per_second=max_bytes_per_second,
+        error_rate=error_rate,
+        error_code=grpc.StatusCode[error_code],
+        decode_rows=decode_rows,
+    )
+    server.start()
+    logger.info(f'🧪 Set write_api_endpoint: "{server.endpoint}" in the config to use it, Ctrl+C to stop')
+    try:
+        server.wait_for_termination()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+@app.command(
+    name="bench",
+    help="⏱️ Benchmark the stream types over a grid of batch sizes, row counts and concurrency levels",
+    no_args_is_help=False,
+)
+def bench(
+    stream_type: Annotated[
+        list[StreamType] | None, typer.Option(help="Stream types to run, all by default")
+    ] = None,
+    batch_size: Annotated[
+        list[int] | None, typer.Option(help="Rows per request [default: 100, 1000]")
+    ] = None,
+    rows: Annotated[list[int] | None, typer.Option(help="Rows per run [default: 10000]")] = None,
+    concurrency: Annotated[list[int] | None, typer.Option(help="Parallel streams [default: 1, 4]")] = None,
+    table: Annotated[str, typer.Option(help="Table (entity) to write")] = "students",
+    max_in_flight: Annotated[int, typer.Option(help="Unacknowledged requests per stream")] = 8,
+    endpoint: Annotated[
+        str | None,
+        typer.Option(help="Endpoint of a running 'examples serve', an in-process server by default"),
+    ] = None,
+    latency_ms: Annotated[float, typer.Option(help="Acknowledgement delay of the in-process server")] = 0,
+    output: Annotated[str, typer.Option(help="Path of the JSON results")] = "bench.json",
+    bulk_fake_data: Annotated[
+        bool, typer.Option(help="Generate the rows with the vectorized BulkFakeDataGenerator")
+    ] = False,
+    corpus: Annotated[
+        str | None,
+        typer.Option(
+            help="Replay the rows of a corpus file (see 'examples corpus') instead of generating them"
+        ),
+    ] = None,
+):
+    from bigquery_storage_write_api_examples.bench import Benchmark
+    from bigquery_storage_write_api_examples.row_corpus import RowCorpus
+
+    row_corpus = RowCorpus(corpus) if corpus is not None else None
+    benchmark = Benchmark(
+        table_id=table,
+        stream_types=stream_type,
+        batch_sizes=batch_size,
+        row_counts=rows,
+        concurrency_levels=concurrency,
+        max_in_flight=max_in_flight,
+        endpoint=endpoint,
+        latency_ms=latency_ms,
+        bulk_fake_data=bulk_fake_data,
+        corpus=row_corpus,
+    )
+    try:
+        results = benchmark.run()
+    finally:
+        if row_corpus is not None:
+            row_corpus.close()
+
+    Path(output).parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    logger.info(f"✅ Benchmark results written to {output}")
+
+
+@app.command(
+    name="loadgen",
+    help="🚦 Write sustained load at a target rate or as fast as possible, reporting throughput and latency over time",
+    no_args_is_help=False,
+)
+def loadgen(
+    table: Annotated[str, typer.Argument(help="Table (entity) to write")] = "students",
+    stream_type: Annotated[StreamType, typer.Option(help="Stream type to write with")] = StreamType.DEFAULT,
+    rate: Annotated[
+        float | None,
+        typer.Option(help="Target rows per second over all streams, as fast as possible by default"),
+    ] = None,
+    duration: Annotated[
+        float | None, typer.Option(help="Seconds to run [default: 60 unless --rows is given]")
+    ] = None,
+    rows: Annotated[
+        int | None, typer.Option(help="Rows to write, stops early at the end of --duration")
+    ] = None,
+    batch_size: Annotated[int, typer.Option(help="Rows per request")] = 500,
+    streams: Annotated[
+        int, typer.Option(help="Parallel streams, each with its own thread and connection")
+    ] = 1,
+    burst: Annotated[
+        int | None,
+        typer.Option(help="Rows per stream sent at once before the rate applies [default: one batch]"),
+    ] = None,
+    report_interval: Annotated[
+        float, typer.Option(help="Seconds between throughput and latency reports")
+    ] = 1.0,
+    in_process_server: Annotated[
+        bool, typer.Option(help="Write to an in-process stand-in server instead of write_api_endpoint")
+    ] = False,
+    latency_ms: Annotated[float, typer.Option(help="Acknowledgement delay of the in-process server")] = 0,
+    corpus: Annotated[
+        str | None,
+        typer.Option(help="Replay the rows of a corpus file (see 'examples corpus') instead of fake rows"),
+    ] = None,
+    compression: Annotated[
+        Compression | None, typer.Option(help="Request compression, overrides compression in the config")
+    ] = None,
+    output: Annotated[str | None, typer.Option(help="Path of the JSON report")] = None,
+    path_to_config: Annotated[str, typer.Option(help="Path to config file")] = "conf.yaml",
+):
+    from google.cloud.bigquery_storage_v1 import BigQueryWriteClient
+
+    from bigquery_storage_write_api_examples.compression import configured_compression
+    from bigquery_storage_write_api_examples.load_generator import LoadGenerator
+    from bigquery_storage_write_api_examples.local_write_server import LocalWriteServer
+    from bigquery_storage_write_api_examples.metrics import REGISTRY, PrometheusEndpoint, configured_metrics
+    from bigquery_storage_write_api_examples.row_corpus import RowCorpus
+    from bigquery_storage_write_api_examples.table_registry import configured_message_class
+
+    config_ = _load_config(path_to_config)
+    if duration is None and rows is None:
+        duration = 60
+    row_corpus = RowCorpus(corpus) if corpus is not None else None
+    server = LocalWriteServer(latency_ms=latency_ms) if in_process_server else None
+    if server is not None:
+        server.start()
+    try:
+        generator = LoadGenerator(
+            BigQueryWriteClient.table_path(config_.gcp_project_id, config_.gcp_dataset_id, table),
+            configured_message_class(config_, table).DESCRIPTOR,
+            stream_type=stream_type,
+            rows_per_second=rate,
+            duration=duration,
+            row_count=rows,
+            batch_size=batch_size,
+            streams=streams,
+            burst=burst,
+            max_in_flight=config_.max_in_flight_requests,
+            report_interval=report_interval,
+            endpoint=server.endpoint if server is not None else config_.write_api_endpoint,
+            metrics=configured_metrics(config_),
+            compression=compression or configured_compression(config_),
+            corpus=row_corpus,
+        )
+        if config_.metrics == "prometheus":
+            with PrometheusEndpoint(REGISTRY, port=config_.metrics_port, host=config_.metrics_host):
+                report = generator.run()
+        else:
+            report = generator.run()
+    finally:
+        if server is not None:
+            server.stop()
+        if row_corpus is not None:
+            row_corpus.close()
+    _log_metrics(config_)
+
+    if output is not None:
+        Path(output).parent.mkdir(parents=True, exist_ok=True)
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"✅ Load report written to {output}")
+
+
+@app.command(
+    name="corpus",
+    help="💾 Pre-generate and encode fake rows into corpus files, to replay them with 'examples bench --corpus'",
+    no_args_is_help=False,
+)
+def corpus(
+    rows: Annotated[int, typer.Option(help="Rows per table")] = 1_000_000,
+    table: Annotated[
+        list[str] | None, typer.Option(help="Tables (entities) to generate, all by default")
+    ] = None,
+    output_dir: Annotated[str, typer.Option(help="Directory of the <table>.corpus files")] = "corpus",
+    bulk_fake_data: Annotated[
+        bool, typer.Option(help="Generate the rows with the vectorized BulkFakeDataGenerator")
+    ] = True,
+    seed: Annotated[int, typer.Option(help="Seed of the fake data, the same seed gives the same rows")] = 0,
+):
+    from bigquery_storage_write_api_examples.fake_data_generator import (
+        BulkFakeDataGenerator,
+        FakeDataGenerator,
+    )
+    from bigquery_storage_write_api_examples.row_corpus import write_corpus
+    from bigquery_storage_write_api_examples.row_encoder import RowEncoder
+    from bigquery_storage_write_api_examples.table_registry import MESSAGE_CLASSES, message_class
+
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    generator_class = BulkFakeDataGenerator if bulk_fake_data else FakeDataGenerator
+    for table_id in table or list(MESSAGE_CLASSES):
+        encode = RowEncoder.for_message(message_class(table_id)).encode
+        rows_iter = generator_class(seed=seed).iter_fake(table_id, rows)
+        path = Path(output_dir) / f"{table_id}.corpus"
+        logger.info(f"💾 Writing {rows} {table_id} rows to {path}")
+        write_corpus(path, table_id, (encode(row) for row in rows_iter))
+    logger.info("✅ Corpus files written!")
+
+
 @app.command(
     name="generate-proto",
     help="📊 Generate proto file from bigquery schema",
@@ -95,6 +417,8 @@ def generate_proto(
     path_to_bigquery_schema: Annotated[str, typer.Argument(help="Path to bigquery schema file")],
     output_file: Annotated[str, typer.Argument(help="Path to output proto file")],
 ):
+    from bigquery_storage_write_api_examples.proto_file import ProtoFileGenerator
+
     logger.info(f"📊 Generating proto file from bigquery schema: {path_to_bigquery_schema}")
     logger.info(f"📊 Output file: {output_file}")
 
@@ -113,7 +437,19 @@ def generate_proto(
     logger.info("✅ Proto file generated!")
 
 
-def _load_config(path_to_config: str) -> Config:
+def _log_metrics(config_: "Config"):
+    if config_.metrics == "prometheus":
+        from bigquery_storage_write_api_examples.metrics import REGISTRY
+
+        for stream in REGISTRY.snapshot():
+            logger.info(f"📈 {json.dumps(stream)}")
+
+
+def _load_config(path_to_config: str) -> "Config":
+    import yaml
+
+    from bigquery_storage_write_api_examples import Config
+
     _path_to_config = Path(path_to_config).resolve()
     if not _path_to_config.exists():
         raise FileNotFoundError(
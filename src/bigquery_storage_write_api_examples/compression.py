@@ -0,0 +1,88 @@
+import zlib
+from enum import Enum
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    # The CLI reads Compression off its options, keep the module cheap to import
+    import grpc
+    from google.cloud.bigquery_storage_v1 import types
+
+    from bigquery_storage_write_api_examples import Config
+
+# Measure the compressed size of one request in this many, the others are estimated from the measured ratio
+DEFAULT_SAMPLE_EVERY = 16
+
+
+class Compression(Enum):
+    # Messages go out as serialized, the default of BigQueryWriteClient
+    NONE = "none"
+    # zlib streams, cheaper framing than gzip with the same ratio
+    DEFLATE = "deflate"
+    GZIP = "gzip"
+
+    @property
+    def grpc(self) -> "grpc.Compression":
+        import grpc
+
+        return {
+            Compression.NONE: grpc.Compression.NoCompression,
+            Compression.DEFLATE: grpc.Compression.Deflate,
+            Compression.GZIP: grpc.Compression.Gzip,
+        }[self]
+
+
+# zlib window bits of the formats gRPC writes: a zlib stream for deflate, a gzip member for gzip
+_WBITS = {Compression.DEFLATE: zlib.MAX_WBITS, Compression.GZIP: zlib.MAX_WBITS | 16}
+
+
+def compressed_size(payload: bytes, compression: Compression) -> int:
+    """Bytes ``payload`` takes on the wire with ``compression``, as gRPC compresses messages
+
+    gRPC compresses at zlib's default level and sends a message as is when compressing doesn't make it smaller.
+    """
+    if compression is Compression.NONE:
+        return len(payload)
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, _WBITS[compression])
+    return min(len(payload), len(compressor.compress(payload)) + len(compressor.flush()))
+
+
+class WireSizeEstimator:
+    """
+    Estimates the compressed size of the requests a sender writes to a compressed channel.
+
+    gRPC compresses inside the channel and doesn't report the result, so the estimator compresses a copy of one
+    request in ``sample_every`` itself and applies the ratio seen so far to the others. Compressing every request
+    again would double the CPU cost of compression, a sample is enough for rows of the same table.
+    """
+
+    def __init__(self, compression: Compression, sample_every: int = DEFAULT_SAMPLE_EVERY):
+        if sample_every < 1:
+            raise ValueError("🛑 sample_every must be positive")
+        self.compression = compression
+        self.sample_every = sample_every
+        self._requests = 0
+        self._sampled_bytes = 0
+        self._sampled_wire_bytes = 0
+
+    @property
+    def ratio(self) -> float:
+        """Compressed over raw bytes of the sampled requests, 1.0 before the first sample"""
+        return self._sampled_wire_bytes / self._sampled_bytes if self._sampled_bytes else 1.0
+
+    def wire_size(self, request: "types.AppendRowsRequest", byte_count: int) -> int:
+        """Bytes ``request`` of ``byte_count`` serialized bytes takes on the wire"""
+        if self.compression is Compression.NONE:
+            return byte_count
+        sampled = self._requests % self.sample_every == 0
+        self._requests += 1
+        if not sampled:
+            return round(byte_count * self.ratio)
+        wire_bytes = compressed_size(request._pb.SerializeToString(), self.compression)
+        self._sampled_bytes += byte_count
+        self._sampled_wire_bytes += wire_bytes
+        return wire_bytes
+
+
+def configured_compression(config: "Config") -> Compression:
+    """Return the channel compression set by ``compression`` in the config"""
+    return Compression(config.compression)
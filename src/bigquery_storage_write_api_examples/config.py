@@ -0,0 +1,70 @@
+from typing import Literal
+
+from pydantic import BaseModel, ConfigDict, NonNegativeInt, PositiveFloat, PositiveInt
+
+
+class Config(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    gcp_project_id: str
+    gcp_dataset_id: str
+    # Batching limits for AppendRows requests, when max_rows_per_request is unset every example uses its own default.
+    # Requests are capped at 10 MB by BigQuery, the byte limit keeps headroom for the schema and stream name.
+    max_rows_per_request: PositiveInt | None = None
+    max_request_bytes: PositiveInt = 9 * 1024 * 1024
+    # Number of AppendRows requests a writer keeps in flight on one stream before waiting for acknowledgements
+    max_in_flight_requests: PositiveInt = 8
+    # Number of parallel COMMITTED streams (each on its own connection) used by the sharded writer
+    committed_stream_shards: PositiveInt = 4
+    # Number of processes that build and serialize rows into shared memory for the default stream writer,
+    # 0 keeps the serialization in the sending process
+    encoder_processes: NonNegativeInt = 0
+    # host:port of a Write API compatible server without TLS, e.g. the local stand-in server (examples serve),
+    # to run the examples offline. Unset for BigQuery.
+    write_api_endpoint: str | None = None
+    # Number of connections the multi-table writer multiplexes the default streams of all tables over
+    default_stream_connections: PositiveInt = 2
+    # How the default, committed, pending and buffered examples serialize rows: protobuf messages or Arrow record
+    # batches built from the schema JSON in misc/schemas (needs pyarrow)
+    row_format: Literal["proto", "arrow"] = "proto"
+    # Where the writers get the protobuf message of a table from: the compiled *_pb2 modules, the schema JSON in
+    # misc/schemas or the schema of the live BigQuery table. Runtime messages are cached in .cache/descriptors.
+    descriptor_source: Literal["compiled", "schema", "table"] = "compiled"
+    # Adapt the rows per request of the default, committed, pending and buffered examples at runtime: off, latency
+    # (keep acknowledgements at target_ack_latency_ms) or throughput (most rows/s with acks under the target).
+    # max_rows_per_request is then the starting point, max_request_bytes still caps every request.
+    adaptive_batching: Literal["off", "latency", "throughput"] = "off"
+    target_ack_latency_ms: PositiveFloat = 500
+    # Record rows, bytes, in-flight requests, ack latency, retries and row errors of every stream: off, prometheus
+    # (served at http://localhost:<metrics_port>/metrics while the example runs) or otel (the OpenTelemetry
+    # MeterProvider of the application, no-op without an SDK, needs the otel extra)
+    metrics: Literal["off", "prometheus", "otel"] = "off"
+    metrics_port: NonNegativeInt = 9464
+    # Interface the Prometheus endpoint listens on, e.g. 0.0.0.0 to be scraped from other hosts
+    metrics_host: str = "127.0.0.1"
+    # Time the stages of the default, committed, pending and buffered examples (generate, encode, build request,
+    # send, await ack) and log a flame-style summary: off, stages, cprofile (plus the functions inside the stages)
+    # or line (line by line with line_profiler, a dev dependency). The summary and profiles are also written to
+    # profile_output when it's set, e.g. stages.folded for flamegraph.pl or speedscope.
+    profiling: Literal["off", "stages", "cprofile", "line"] = "off"
+    profile_output: str | None = None
+    # When the buffered example makes acknowledged rows visible, from a background thread while appends continue:
+    # once flush_every_rows rows are waiting and/or once the oldest waiting ack is flush_interval_ms old.
+    # Fewer flushes mean fewer FlushRows calls but staler rows, the example logs the visibility latency.
+    flush_every_rows: PositiveInt | None = 1
+    flush_interval_ms: PositiveFloat | None = None
+    # gRPC compression of the AppendRows requests: none, deflate or gzip. Costs CPU on the writer and saves bandwidth,
+    # worth it when egress is the bottleneck, see benchmarks/compression_benchmark.py for the trade-off per table.
+    # The metrics record the serialized and the (estimated) compressed bytes of every request.
+    compression: Literal["none", "deflate", "gzip"] = "none"
+    # Directory of the corpus files written by 'examples corpus'. When set, the default, committed, pending and
+    # buffered examples replay the pre-encoded rows of <corpus_dir>/<table>.corpus instead of generating fake rows,
+    # so a run measures the send path alone and reruns send the same dataset. Needs row_format: proto.
+    corpus_dir: str | None = None
+    # Drop the rows of the default stream example whose dedup_key column (e.g. student_id) was already written,
+    # before they are encoded. Repeats are looked up in rotating Bloom filters that remember at least the last
+    # dedup_capacity keys (and dedup_window_seconds, when set) in about 2.8 MB per million keys at a 0.1% false
+    # positive rate. A false positive drops a new row, the example logs the estimated count.
+    dedup_key: str | None = None
+    dedup_capacity: PositiveInt = 1_000_000
+    dedup_false_positive_rate: PositiveFloat = 0.001
+    dedup_window_seconds: PositiveFloat | None = None
@@ -0,0 +1,243 @@
+import itertools
+import math
+import time
+from collections import deque
+from collections.abc import Hashable, Iterable, Iterator, Sequence
+
+import numpy as np
+
+from bigquery_storage_write_api_examples import Config
+
+DEFAULT_CAPACITY = 1_000_000
+DEFAULT_FALSE_POSITIVE_RATE = 0.001
+DEFAULT_GENERATIONS = 4
+# Keys hashed and looked up at once, numpy does the bit arithmetic of a whole chunk in a few calls
+DEFAULT_CHUNK_ROWS = 4_096
+
+# Seeds the second hash of the double hashing, any odd 64-bit constant
+_SECOND_HASH_SEED = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _mix(hashes: np.ndarray) -> np.ndarray:
+    """splitmix64 finalizer, spreads Python's hashes (the value itself for small ints) over all 64 bits"""
+    hashes = hashes ^ (hashes >> np.uint64(30))
+    hashes = hashes * np.uint64(0xBF58476D1CE4E5B9)
+    hashes = hashes ^ (hashes >> np.uint64(27))
+    hashes = hashes * np.uint64(0x94D049BB133111EB)
+    return hashes ^ (hashes >> np.uint64(31))
+
+
+class _Generation:
+    __slots__ = ("bits", "created_at", "keys")
+
+    def __init__(self, bits: np.ndarray, created_at: float):
+        self.bits = bits
+        self.keys = 0
+        self.created_at = created_at
+
+
+class RotatingBloomFilter:
+    """
+    Remembers the most recent keys in a fixed amount of memory, to tell whether a key was probably seen before.
+
+    The keys are spread over ``generations`` Bloom filters. New keys go into the newest one and once it holds
+    ``capacity / (generations - 1)`` keys, or is older than ``window_seconds / (generations - 1)``, the oldest
+    filter is dropped and a new one started. A key that shows up again is added to the newest filter too, so keys
+    expire about least recently seen first: at least the last ``capacity`` keys (or ``window_seconds``) are
+    remembered, a little more right before a rotation.
+
+    A Bloom filter never misses a key it holds but claims a new key is known with a small probability, the filters
+    are sized so that this false positive rate stays under ``false_positive_rate`` when they are full. Keys are
+    hashed with Python's ``hash``, the filter only lives as long as the process.
+    """
+
+    def __init__(
+        self,
+        capacity: int = DEFAULT_CAPACITY,
+        false_positive_rate: float = DEFAULT_FALSE_POSITIVE_RATE,
+        generations: int = DEFAULT_GENERATIONS,
+        window_seconds: float | None = None,
+    ):
+        if capacity < 1:
+            raise ValueError("🛑 capacity must be positive")
+        if not 0 < false_positive_rate < 1:
+            raise ValueError("🛑 false_positive_rate must be between 0 and 1")
+        if generations < 2:
+            raise ValueError("🛑 At least 2 generations are needed to expire keys")
+        if window_seconds is not None and window_seconds <= 0:
+            raise ValueError("🛑 window_seconds must be positive")
+        self.capacity = capacity
+        self.target_false_positive_rate = false_positive_rate
+        self.generations = generations
+        self.window_seconds = window_seconds
+        self.generation_capacity = math.ceil(capacity / (generations - 1))
+
+        # A key is looked up in every generation, each gets a share of the false positive rate
+        rate = false_positive_rate / generations
+        bit_count = math.ceil(-self.generation_capacity * math.log(rate) / math.log(2) ** 2)
+        self.bit_count = math.ceil(bit_count / 8) * 8
+        self.hash_count = max(1, round(self.bit_count / self.generation_capacity * math.log(2)))
+        self.rotations = 0
+        self._generations: deque[_Generation] = deque([self._new_generation(time.monotonic())])
+
+    @property
+    def memory_bytes(self) -> int:
+        """Bytes the bits of the generations take at most, once the filter rotated"""
+        return self.generations * self.bit_count // 8
+
+    @property
+    def key_count(self) -> int:
+        """Keys held by the current generations, keys seen again in several of them count once per generation"""
+        return sum(generation.keys for generation in self._generations)
+
+    def false_positive_rate(self) -> float:
+        """Estimated probability that a new key is reported as seen, given how full the generations are"""
+        miss = 1.0
+        for generation in self._generations:
+            fill = 1 - math.exp(-self.hash_count * generation.keys / self.bit_count)
+            miss *= 1 - fill**self.hash_count
+        return 1 - miss
+
+    def add_many(self, keys: Sequence[Hashable], now: float | None = None) -> np.ndarray:
+        """Add ``keys`` and return for each whether it was probably seen before, also earlier in ``keys``
+
+        Args:
+            keys (Sequence[Hashable]): Keys to look up and add, in order
+            now (float | None): ``time.monotonic()`` timestamp for the window, the current time by default
+
+        Returns:
+            np.ndarray: One boolean per key, True for repeats
+        """
+        now = time.monotonic() if now is None else now
+        seen = np.empty(len(keys), dtype=bool)
+        start = 0
+        while start < len(keys):
+            self._rotate_if_due(now)
+            # Never overfill the newest generation, the rest of the keys go into the next one
+            end = min(len(keys), start + self.generation_capacity - self._generations[-1].keys)
+            seen[start:end] = self._add_chunk(keys[start:end])
+            start = end
+        return seen
+
+    def _add_chunk(self, keys: Sequence[Hashable]) -> np.ndarray:
+        hashes = np.fromiter((hash(key) for key in keys), dtype=np.int64, count=len(keys)).view(np.uint64)
+        first = _mix(hashes)
+        second = _mix(first ^ _SECOND_HASH_SEED) | np.uint64(1)
+        # Double hashing: bit i of a key is first + i * second, one row of hash_count bits per key
+        positions = first[:, None] + np.arange(self.hash_count, dtype=np.uint64)[None, :] * second[:, None]
+        positions %= np.uint64(self.bit_count)
+        byte_index = positions >> np.uint64(3)
+        bit_mask = np.left_shift(1, positions & np.uint64(7)).astype(np.uint8)
+
+        newest = self._generations[-1]
+        in_newest = np.all(newest.bits[byte_index] & bit_mask, axis=1)
+        seen = in_newest.copy()
+        for generation in itertools.islice(self._generations, len(self._generations) - 1):
+            seen |= np.all(generation.bits[byte_index] & bit_mask, axis=1)
+
+        # Repeats within the chunk, 64-bit hash collisions of different keys count as repeats
+        _, first_index = np.unique(first, return_index=True)
+        repeated = np.ones(len(keys), dtype=bool)
+        repeated[first_index] = False
+        seen |= repeated
+
+        # New keys and keys seen in an older generation only (refreshed, so they don't expire with it)
+        added = ~in_newest & ~repeated
+        np.bitwise_or.at(newest.bits, byte_index[added].ravel(), bit_mask[added].ravel())
+        newest.keys += int(added.sum())
+        return seen
+
+    def _rotate_if_due(self, now: float):
+        if self._generations[-1].keys >= self.generation_capacity:
+            self._rotate(now)
+            return
+        if self.window_seconds is None:
+            return
+        lifetime = self.window_seconds / (self.generations - 1)
+        # Every lifetime that passed rotates out a generation, after an idle gap all of them may have expired
+        due = min(self.generations, int((now - self._generations[-1].created_at) // lifetime))
+        for _ in range(due):
+            self._rotate(now)
+
+    def _rotate(self, now: float):
+        if len(self._generations) < self.generations:
+            self._generations.append(self._new_generation(now))
+        else:
+            # The oldest generation is forgotten, its bits are reused for the new one
+            oldest = self._generations.popleft()
+            oldest.bits.fill(0)
+            oldest.keys = 0
+            oldest.created_at = now
+            self._generations.append(oldest)
+        self.rotations += 1
+
+    def _new_generation(self, now: float) -> _Generation:
+        return _Generation(np.zeros(self.bit_count // 8, dtype=np.uint8), now)
+
+
+class RowDeduplicator:
+    """
+    Drops the rows whose ``key`` column was already written, before they are encoded.
+
+    Writes to the default stream are at-least-once: rows that are produced again (a replayed source, a retried
+    batch) end up in the table twice. The deduplicator puts a filter between the rows and the batcher, repeats
+    are looked up in a RotatingBloomFilter and dropped. It only catches repeats of the rows it sees, not a request
+    that the sender retried after it was written.
+
+    The filter trades exactness for memory: a small fraction of new rows (see ``summary``) is taken for a repeat
+    and dropped, and keys older than its capacity or window are forgotten. Rows without a key are always written.
+    """
+
+    def __init__(
+        self,
+        key: str,
+        index: RotatingBloomFilter | None = None,
+        chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    ):
+        if chunk_rows < 1:
+            raise ValueError("🛑 chunk_rows must be positive")
+        self.key = key
+        self.index = index or RotatingBloomFilter()
+        self.chunk_rows = chunk_rows
+        self.rows = 0
+        self.dropped_rows = 0
+        # Sum of the estimated false positive rate over the rows looked up, the expected number of new rows dropped
+        self._expected_false_positives = 0.0
+
+    def filter(self, rows: Iterable[dict]) -> Iterator[dict]:
+        """Yield the rows whose key wasn't seen before, in order"""
+        for chunk in itertools.batched(rows, self.chunk_rows):
+            keyed = [row for row in chunk if row.get(self.key) is not None]
+            self._expected_false_positives += self.index.false_positive_rate() * len(keyed)
+            repeats = iter(self.index.add_many([row[self.key] for row in keyed]))
+            self.rows += len(chunk)
+            for row in chunk:
+                if row.get(self.key) is not None and next(repeats):
+                    self.dropped_rows += 1
+                    continue
+                yield row
+
+    def summary(self) -> dict:
+        """Rows looked up and dropped, the estimated false positives and the memory of the filter"""
+        return {
+            "key": self.key,
+            "rows": self.rows,
+            "dropped_rows": self.dropped_rows,
+            "false_positive_rate": round(self.index.false_positive_rate(), 6),
+            "expected_false_positives": round(self._expected_false_positives, 1),
+            "remembered_keys": self.index.key_count,
+            "rotations": self.index.rotations,
+            "memory_mb": round(self.index.memory_bytes / 1024**2, 2),
+        }
+
+
+def configured_deduplicator(config: Config) -> RowDeduplicator | None:
+    """Return the deduplicator set by ``dedup_key`` and the other ``dedup_*`` options in the config, if any"""
+    if config.dedup_key is None:
+        return None
+    index = RotatingBloomFilter(
+        capacity=config.dedup_capacity,
+        false_positive_rate=config.dedup_false_positive_rate,
+        window_seconds=config.dedup_window_seconds,
+    )
+    return RowDeduplicator(config.dedup_key, index)
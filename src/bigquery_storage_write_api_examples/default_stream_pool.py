@@ -0,0 +1,266 @@
+import itertools
+import logging
+import queue
+import threading
+from collections import deque
+from collections.abc import Iterable
+from concurrent.futures import Future
+from typing import Self
+
+from google.api_core import exceptions
+from google.cloud.bigquery_storage_v1 import BigQueryWriteClient, types
+from google.protobuf.descriptor import Descriptor
+from google.protobuf.descriptor_pb2 import DescriptorProto
+
+from bigquery_storage_write_api_examples.append_sender import (
+    DEFAULT_MAX_IN_FLIGHT,
+    AckCallback,
+    PendingAppend,
+    PipelinedAppendSender,
+)
+from bigquery_storage_write_api_examples.compression import Compression
+from bigquery_storage_write_api_examples.request_batcher import (
+    DEFAULT_MAX_REQUEST_BYTES,
+    DEFAULT_MAX_ROWS_PER_REQUEST,
+    RequestBatcher,
+    build_request,
+    build_request_from_proto_rows,
+)
+from bigquery_storage_write_api_examples.row_encoder import RowEncoder
+from bigquery_storage_write_api_examples.write_client import create_write_client
+
+_END_OF_REQUESTS = None
+
+
+class MultiplexedConnection:
+    """
+    One AppendRows call that carries requests for the ``_default`` streams of several tables.
+
+    The AppendRowsStream only accepts the stream of its first request, so this connection drives the bidi call
+    itself. Every request names its stream, and the writer schema is only attached when the destination differs
+    from the previous request on the connection, as the multiplexing rules of the Storage Write API require.
+    """
+
+    def __init__(
+        self, write_client: BigQueryWriteClient, writer_schemas: dict[str, types.ProtoSchema], name: str
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.write_client = write_client
+        self.writer_schemas = writer_schemas
+        self.name = name
+
+        self._lock = threading.Lock()
+        self._requests: queue.SimpleQueue[types.AppendRowsRequest | None] = queue.SimpleQueue()
+        self._unanswered: deque[Future] = deque()
+        self._last_stream_name: str | None = None
+        self._reader: threading.Thread | None = None
+        self._error: Exception | None = None
+        self.closed = False
+
+    def send(self, request: types.AppendRowsRequest) -> Future:
+        """Send a request for one of the registered default streams"""
+        with self._lock:
+            if self.closed:
+                raise RuntimeError(f"🛑 Connection '{self.name}' is closed")
+            if self._error is not None:
+                raise self._error
+            if request.write_stream != self._last_stream_name:
+                request.proto_rows.writer_schema = self.writer_schemas[request.write_stream]
+                self._last_stream_name = request.write_stream
+            future: Future = Future()
+            self._unanswered.append(future)
+            self._requests.put(request)
+            if self._reader is None:
+                self._reader = threading.Thread(
+                    target=self._read_responses, args=(request.write_stream,), name=self.name, daemon=True
+                )
+                self._reader.start()
+            return future
+
+    def close(self):
+        """End the call after the requests that were sent, then wait for their responses"""
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            self._requests.put(_END_OF_REQUESTS)
+        if self._reader is not None:
+            self._reader.join()
+
+    def _read_responses(self, first_stream_name: str):
+        try:
+            responses = self.write_client.append_rows(
+                requests=iter(self._requests.get, _END_OF_REQUESTS),
+                # Routes the call to the region of the first table, every multiplexed table must be in that region
+                metadata=(("x-goog-request-params", f"write_stream={first_stream_name}"),),
+            )
+            # There is one response per request, in the order the requests were sent
+            for response in responses:
+                future = self._unanswered.popleft()
+                if response.error.code:
+                    future.set_exception(
+                        exceptions.from_grpc_status(
+                            response.error.code, response.error.message, response=response
+                        )
+                    )
+                else:
+                    future.set_result(response)
+        except Exception as e:  # noqa: BLE001
+            # Any failure of the call fails the futures still waiting on this connection and is raised by the
+            # next send on it
+            self.logger.error(f"🚨 Connection '{self.name}' failed: {e}")
+            with self._lock:
+                self._error = e
+        finally:
+            with self._lock:
+                # Requests without a response can't succeed anymore
+                while self._unanswered:
+                    self._unanswered.popleft().set_exception(
+                        self._error
+                        or exceptions.Aborted("The AppendRows call ended before the append was acknowledged")
+                    )
+
+
+class _PooledConnection:
+    """A multiplexed connection with its own in-flight window, shared by the tables routed to it"""
+
+    def __init__(self, connection: MultiplexedConnection, max_in_flight: int, on_ack: AckCallback | None):
+        self.connection = connection
+        self.sender = PipelinedAppendSender(connection, max_in_flight=max_in_flight, on_ack=on_ack)
+        # The sender isn't thread-safe, producers of the tables on this connection take turns
+        self.lock = threading.Lock()
+
+
+class DefaultStreamPool:
+    """
+    Writes to the ``_default`` streams of many tables over a small, fixed number of gRPC connections.
+
+    Each connection is a dedicated client with one multiplexed AppendRows call. Tables are assigned to the
+    connections round-robin when they are registered and stay on them, so the requests of a table arrive in order
+    and the writer schema is only re-sent when a connection switches between tables. Adding a table only adds a
+    writer schema, the number of sockets and calls stays at ``connection_count``.
+
+    Use it as a context manager:
+
+        with DefaultStreamPool(connection_count=2) as pool:
+            pool.register(students_table_path, RawStudents.DESCRIPTOR)
+            pool.register(courses_table_path, RawCourses.DESCRIPTOR)
+            pool.append(students_table_path, students)
+            pool.append(courses_table_path, courses)
+    """
+
+    def __init__(
+        self,
+        connection_count: int = 2,
+        max_rows_per_request: int = DEFAULT_MAX_ROWS_PER_REQUEST,
+        max_request_bytes: int = DEFAULT_MAX_REQUEST_BYTES,
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+        on_ack: AckCallback | None = None,
+        endpoint: str | None = None,
+        compression: Compression = Compression.NONE,
+    ):
+        if connection_count < 1:
+            raise ValueError("🛑 connection_count must be positive")
+        self.logger = logging.getLogger(__name__)
+        self.max_rows_per_request = max_rows_per_request
+        self.max_request_bytes = max_request_bytes
+
+        self._writer_schemas: dict[str, types.ProtoSchema] = {}
+        self._batchers: dict[str, RequestBatcher] = {}
+        self._routes: dict[str, _PooledConnection] = {}
+        self._connections = [
+            _PooledConnection(
+                # A client per connection, each with its own socket instead of the shared subchannel
+                MultiplexedConnection(
+                    create_write_client(endpoint, dedicated_connection=True, compression=compression),
+                    self._writer_schemas,
+                    f"default-stream-pool-{i}",
+                ),
+                max_in_flight=max_in_flight,
+                on_ack=on_ack,
+            )
+            for i in range(connection_count)
+        ]
+        self._next_connection = itertools.cycle(self._connections)
+        self._lock = threading.Lock()
+        self.closed = False
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def acked_rows(self) -> int:
+        """Number of acknowledged rows over all tables"""
+        return sum(pooled.sender.acked_rows for pooled in self._connections)
+
+    def register(self, table_path: str, descriptor: Descriptor) -> str:
+        """Route the default stream of a table to one of the connections
+
+        Returns:
+            str: Name of the default stream of the table
+        """
+        stream_name = f"{table_path}/streams/_default"
+        with self._lock:
+            if stream_name in self._routes:
+                return stream_name
+            proto_descriptor = DescriptorProto()
+            descriptor.CopyToProto(proto_descriptor)
+            self._writer_schemas[stream_name] = types.ProtoSchema(proto_descriptor=proto_descriptor)
+            self._batchers[stream_name] = RequestBatcher(
+                RowEncoder.for_descriptor(descriptor),
+                max_rows=self.max_rows_per_request,
+                max_bytes=self.max_request_bytes,
+            )
+            self._routes[stream_name] = pooled = next(self._next_connection)
+        self.logger.debug(f"🔀 Routing '{stream_name}' over connection '{pooled.connection.name}'")
+        return stream_name
+
+    def append(self, table_path: str, rows: Iterable[dict]) -> list[PendingAppend]:
+        """Encode rows for a registered table and send them, blocking when the connection's window is full"""
+        stream_name = f"{table_path}/streams/_default"
+        if stream_name not in self._routes:
+            raise ValueError(f"🛑 Table '{table_path}' is not registered")
+        pooled = self._routes[stream_name]
+        appends = []
+        for batch in self._batchers[stream_name].batches(rows):
+            # The default stream doesn't support offsets, so the requests are sent without one
+            request = build_request(batch)
+            request.write_stream = stream_name
+            with pooled.lock:
+                appends.append(pooled.sender.send(request))
+        return appends
+
+    def append_proto_rows(self, table_path: str, proto_rows: bytes | memoryview) -> PendingAppend:
+        """Send rows of a registered table that are in the ``ProtoRows`` wire format, e.g. a slice of a RowCorpus"""
+        stream_name = f"{table_path}/streams/_default"
+        if stream_name not in self._routes:
+            raise ValueError(f"🛑 Table '{table_path}' is not registered")
+        pooled = self._routes[stream_name]
+        request = build_request_from_proto_rows(proto_rows)
+        request.write_stream = stream_name
+        with pooled.lock:
+            return pooled.sender.send(request)
+
+    def drain(self):
+        """Wait until the requests of every table are acknowledged"""
+        for pooled in self._connections:
+            with pooled.lock:
+                pooled.sender.drain()
+
+    def close(self):
+        """Wait for the in-flight requests, end the calls of all connections and close their channels"""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.drain()
+        finally:
+            for pooled in self._connections:
+                try:
+                    pooled.connection.close()
+                finally:
+                    # The pool created the client of every connection, nothing else uses its channel
+                    pooled.connection.write_client.transport.close()
@@ -0,0 +1,77 @@
+import asyncio
+import logging
+import time
+
+from google.cloud.bigquery_storage_v1 import BigQueryWriteClient
+
+from bigquery_storage_write_api_examples import Config
+from bigquery_storage_write_api_examples.async_writer import AsyncWriter
+from bigquery_storage_write_api_examples.compression import configured_compression
+from bigquery_storage_write_api_examples.fake_data_generator import FakeDataGenerator
+from bigquery_storage_write_api_examples.metrics import configured_metrics
+from bigquery_storage_write_api_examples.table_registry import configured_message_class
+from bigquery_storage_write_api_examples.write_session import StreamType
+
+
+class AsyncStreamWriterExample:
+    """
+    This example shows how to write to BigQuery from asyncio code, without running a blocking writer in threads.
+
+    Several producer tasks append students concurrently to one default stream through an AsyncWriter. The writer
+    keeps a bounded number of requests in flight, so the producers are suspended while BigQuery catches up.
+    The AsyncWriter supports the other stream types as well, see its ``stream_type`` argument.
+
+    For more information, see:
+        - https://cloud.google.com/bigquery/docs/write-api-streaming
+    """
+
+    def __init__(self, config: Config):
+        self.logger = logging.getLogger(__name__)
+        self.project_id = config.gcp_project_id
+        self.dataset_id = config.gcp_dataset_id
+        self.table_id = "students"
+        self.message_class = configured_message_class(config, self.table_id)
+        self.max_rows_per_request = config.max_rows_per_request or 1_000
+        self.max_request_bytes = config.max_request_bytes
+        self.max_in_flight_requests = config.max_in_flight_requests
+        self.write_api_endpoint = config.write_api_endpoint
+        self.compression = configured_compression(config)
+        self.metrics = configured_metrics(config)
+        self.producer_count = 4
+
+    def run(self):
+        asyncio.run(self._run())
+
+    async def _run(self):
+        number_of_students = 1_000
+        table_path = BigQueryWriteClient.table_path(self.project_id, self.dataset_id, self.table_id)
+
+        start = time.perf_counter()
+        async with AsyncWriter(
+            table_path,
+            self.message_class.DESCRIPTOR,
+            stream_type=StreamType.DEFAULT,
+            max_rows_per_request=self.max_rows_per_request,
+            max_request_bytes=self.max_request_bytes,
+            max_in_flight=self.max_in_flight_requests,
+            endpoint=self.write_api_endpoint,
+            metrics=self.metrics,
+            compression=self.compression,
+        ) as writer:
+            students_per_producer = number_of_students // self.producer_count
+            await asyncio.gather(
+                *(
+                    self._produce(writer, producer_index, students_per_producer)
+                    for producer_index in range(self.producer_count)
+                )
+            )
+        elapsed = time.perf_counter() - start
+
+        self.logger.info(f"✅ Wrote {writer.acked_rows} students in {elapsed:.2f}s")
+
+    async def _produce(self, writer: AsyncWriter, producer_index: int, number_of_students: int):
+        self.logger.debug(f"✨ Producer {producer_index} is generating {number_of_students} fake students")
+        fake_students = FakeDataGenerator().iter_fake("students", number_of_students)
+        # Returns as soon as the requests are sent, the acknowledgements are awaited when the writer closes
+        appends = await writer.append(fake_students)
+        self.logger.debug(f"🚀 Producer {producer_index} sent {len(appends)} requests")
@@ -1,15 +1,32 @@
 import logging
 
-from google.api_core.exceptions import InvalidArgument
-from google.cloud import bigquery_storage, bigquery_storage_v1
 from google.cloud.bigquery_storage_v1 import types, writer
 from google.protobuf import descriptor_pb2
-from google.protobuf.json_format import ParseDict
-from line_profiler import profile
 
 from bigquery_storage_write_api_examples import Config
-from bigquery_storage_write_api_examples.entities.classes.classes_pb2 import RawClasses
+from bigquery_storage_write_api_examples.append_sender import (
+    PendingAppend,
+    PipelinedAppendSender,
+)
+from bigquery_storage_write_api_examples.arrow_rows import (
+    ArrowRequestBatcher,
+    arrow_schema_for_table,
+    arrow_writer_schema,
+)
+from bigquery_storage_write_api_examples.background_flusher import BackgroundFlusher, configured_flush_policy
+from bigquery_storage_write_api_examples.batch_size_controller import configured_batch_size_controller
+from bigquery_storage_write_api_examples.compression import configured_compression
 from bigquery_storage_write_api_examples.fake_data_generator import FakeDataGenerator
+from bigquery_storage_write_api_examples.metrics import configured_metrics
+from bigquery_storage_write_api_examples.profiling import configured_profiler, log_profile
+from bigquery_storage_write_api_examples.request_batcher import (
+    RequestBatcher,
+    request_row_count,
+)
+from bigquery_storage_write_api_examples.row_corpus import configured_corpus
+from bigquery_storage_write_api_examples.row_encoder import RowEncoder
+from bigquery_storage_write_api_examples.table_registry import configured_message_class
+from bigquery_storage_write_api_examples.write_client import create_write_client
 
 
 class BufferedTypeStreamWriterExample:
@@ -27,12 +44,29 @@ class BufferedTypeStreamWriterExample:
         self.project_id = config.gcp_project_id
         self.dataset_id = config.gcp_dataset_id
         self.table_id = "classes"
+        self.message_class = configured_message_class(config, self.table_id)
+        self.max_rows_per_request = config.max_rows_per_request or 2
+        self.max_request_bytes = config.max_request_bytes
+        self.max_in_flight_requests = config.max_in_flight_requests
+        self.write_api_endpoint = config.write_api_endpoint
+        self.compression = configured_compression(config)
+        self.row_format = config.row_format
+        # Adjusts the rows per request at runtime when adaptive_batching is set in the config
+        self.batch_size_controller = configured_batch_size_controller(config, self.max_rows_per_request)
+        self.metrics = configured_metrics(config)
+        # Times the pipeline stages when profiling is set in the config
+        self.profiler = configured_profiler(config)
+        self.profile_output = config.profile_output
+        # When the background flusher makes acknowledged rows visible
+        self.flush_policy = configured_flush_policy(config)
+        # Replays pre-encoded rows instead of generating them when corpus_dir is set in the config
+        self.corpus = configured_corpus(config, self.table_id)
 
         self._init_stream()
 
     def _init_stream(self):
         # """Create a write stream, write a batch of data and commit the stream for each batch"""
-        self.write_client = bigquery_storage_v1.BigQueryWriteClient()
+        self.write_client = create_write_client(self.write_api_endpoint, compression=self.compression)
         self.table_path = self.write_client.table_path(self.project_id, self.dataset_id, self.table_id)
 
         self.write_stream = types.WriteStream()
@@ -53,39 +87,67 @@ class BufferedTypeStreamWriterExample:
         # protocol buffer representation of your message descriptor.
         self.proto_schema = types.ProtoSchema()
         self.proto_descriptor = descriptor_pb2.DescriptorProto()
-        RawClasses.DESCRIPTOR.CopyToProto(self.proto_descriptor)
+        self.message_class.DESCRIPTOR.CopyToProto(self.proto_descriptor)
         self.proto_schema.proto_descriptor = self.proto_descriptor
         self.proto_data = types.AppendRowsRequest.ProtoData()
         self.proto_data.writer_schema = self.proto_schema
         self.request_template.proto_rows = self.proto_data
 
+        # Compiled once per message type, converts the row dicts straight to serialized protobuf bytes
+        self.row_encoder = RowEncoder.for_message(self.message_class)
+        # Cuts the rows into requests by row count and encoded size, to stay under the AppendRows request limit
+        self.batcher = RequestBatcher(
+            self.row_encoder,
+            max_rows=self.max_rows_per_request,
+            max_bytes=self.max_request_bytes,
+            batch_sizer=self.batch_size_controller,
+            profiler=self.profiler,
+        )
+
+        if self.row_format == "arrow":
+            # Columns of the table's schema JSON as Arrow record batches instead of protobuf rows,
+            # the writer schema of the first request becomes the Arrow schema
+            arrow_schema = arrow_schema_for_table(self.table_id)
+            self.request_template.arrow_rows = arrow_writer_schema(arrow_schema)
+            self.batcher = ArrowRequestBatcher(
+                arrow_schema,
+                max_rows=self.max_rows_per_request,
+                max_bytes=self.max_request_bytes,
+                batch_sizer=self.batch_size_controller,
+                profiler=self.profiler,
+            )
+
         # Some stream types support an unbounded number of requests. Construct an
         # AppendRowsStream to send an arbitrary number of requests to a stream.
         self.append_rows_stream = writer.AppendRowsStream(self.write_client, self.request_template)
-
-    def _request(self, classes: list[dict], offset: int) -> types.AppendRowsRequest:
-        request = types.AppendRowsRequest()
-        request.offset = offset
-        proto_data = types.AppendRowsRequest.ProtoData()
-
-        proto_rows = types.ProtoRows()
-
-        for class_ in classes:
-            raw_class = ParseDict(js_dict=class_, message=RawClasses(), ignore_unknown_fields=True)
-            proto_rows.serialized_rows.append(raw_class.SerializeToString())
-
-        proto_data.rows = proto_rows
-        request.proto_rows = proto_data
-        return request
+        stream_metrics = self.metrics.stream(self.table_path, self.stream_name) if self.metrics else None
+        # Keeps several requests in flight instead of waiting for each response before sending the next one
+        self.sender = PipelinedAppendSender(
+            self.append_rows_stream,
+            max_in_flight=self.max_in_flight_requests,
+            on_ack=self._on_ack,
+            metrics=stream_metrics,
+            profiler=self.profiler,
+            compression=self.compression,
+        )
+        # Flushes acknowledged rows from a background thread by the flush policy, appends don't wait for it
+        self.flusher = BackgroundFlusher(
+            self.write_client, self.stream_name, self.flush_policy, metrics=stream_metrics
+        )
 
     def run(self):
-        self.logger.info("📚 Generating fake classes data")
-        number_of_batches = 3
-        number_of_classes = 2
-
-        faker = FakeDataGenerator()
-        batches = [faker.generate_fake_classes(number_of_classes) for _ in range(number_of_batches)]
-        self.logger.debug(f"📦 Generated {len(batches)} batches with {number_of_classes} classes each")
+        if self.corpus is not None:
+            self.logger.info(f"💾 Replaying {self.corpus.row_count} classes from '{self.corpus.path}'")
+            # The rows are sliced out of the mapped file, already encoded
+            requests = self.corpus.requests(self.max_rows_per_request, self.max_request_bytes, offset=0)
+        else:
+            self.logger.info("📚 Generating fake classes data")
+            number_of_classes = 6
+
+            faker = FakeDataGenerator()
+            # Generated lazily, only the rows of the request being built are in memory
+            classes = faker.iter_fake("classes", number_of_classes)
+            requests = self.batcher.requests(classes, offset=0)
 
         # Set an offset to allow resuming this stream if the connection breaks.
         # Keep track of which requests the server has acknowledged and resume the
@@ -93,25 +155,34 @@ class BufferedTypeStreamWriterExample:
         # processed a message with that offset, it will return an ALREADY_EXISTS
         # error, which can be safely ignored.
         #
-        # The first request must always have an offset of 0.
-        offset = 0
-
-        # For illustration purposes, we'll send one enrollment at a time.
-        # In a real scenario, you can send a batch of enrollments at once if needed.
-        for batch_index, batch in enumerate(batches):
-            request = self._request(batch, offset)
-            self._write_batch(request=request, batch_index=batch_index, batch_size=len(batch))
-
-            request = bigquery_storage.FlushRowsRequest(write_stream=self.stream_name, offset=offset)
-            self.append_rows_stream._client.flush_rows(request=request)
-
-            # Offset must equal the number of rows that were previously sent.
-            offset += len(batch)
+        # The first request must always have an offset of 0, the batcher sets the offset of every
+        # following request to the number of rows that were previously sent.
+        #
+        # Flushing makes the rows up to the flush offset visible in the table. Rows can only be flushed once they
+        # are acknowledged, the flusher does that in the background as the acknowledgements arrive.
+        self.flusher.start()
+        for batch_index, request in enumerate(requests):
+            batch_size = request_row_count(request)
+            self._write_batch(request=request, batch_index=batch_index, batch_size=batch_size)
+
+            # Whatever the flush policy, make the rows sent so far visible within a second,
+            # so they show up in the table during the pause. Only acknowledged rows can be flushed and the sender
+            # processes acknowledgements when it sends or drains, so wait for them first.
+            self.sender.drain()
+            self.flusher.visible_within(request.offset + batch_size, seconds=1.0)
 
             # The input() is used to pause the execution of the script to allow you to see the data in the table.
             input("Press Enter to continue...")
 
-        # Send another batch.
+        # Wait for the requests that are still in flight, then flush the rest of the rows
+        self.sender.drain()
+        if self.corpus is not None:
+            self.corpus.close()
+        self.flusher.close()
+        self.logger.info(f"🚿 Background flushing: {self.flusher.summary()}")
+        if self.batch_size_controller is not None:
+            self.logger.info(f"🎛️ Adaptive batching: {self.batch_size_controller.summary()}")
+
         # Shutdown background threads and close the streaming connection.
         self.logger.info("⏹️ Closing append rows stream")
         self.append_rows_stream.close()
@@ -121,19 +192,17 @@ class BufferedTypeStreamWriterExample:
 
         # No need to commit the stream, it will be committed automatically
         self.logger.info(f"✅ Writes to stream: '{self.write_stream.name}' have been committed")
+        log_profile(self.profiler, self.profile_output)
 
-    @profile
     def _write_batch(
         self, request: types.AppendRowsRequest, batch_index: int, batch_size: int
-    ) -> types.AppendRowsResponse:
-        response_future = self.append_rows_stream.send(request)
+    ) -> PendingAppend:
         self.logger.info(f"🎓 Sending batch {batch_index} with {batch_size} classes")
-        try:
-            result = response_future.result()
-            self.logger.info(f"🎓 Result for batch {batch_index} is {result}")
-        except InvalidArgument as e:
-            self.logger.error(f"🚨 Error for batch {batch_index}: {e.message}")
-            self.logger.error(f"🚨 Response for batch {batch_index}: {e.response}")
-            raise e
-
-        return result
+        # The sender logs the error and row errors of a failed append before raising it
+        return self.sender.send(request)
+
+    def _on_ack(self, append: PendingAppend, response: types.AppendRowsResponse):
+        self.logger.info(f"🎓 Result for the batch at offset {append.offset} is {response}")
+        self.flusher.on_ack(append, response)
+        if self.batch_size_controller is not None:
+            self.batch_size_controller.on_ack(append, response)
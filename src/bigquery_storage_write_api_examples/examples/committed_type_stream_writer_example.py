@@ -1,17 +1,31 @@
 import logging
 
-from google.api_core.exceptions import InvalidArgument
-from google.cloud import bigquery_storage_v1
 from google.cloud.bigquery_storage_v1 import types, writer
 from google.protobuf import descriptor_pb2
-from google.protobuf.json_format import ParseDict
-from line_profiler import profile
 
 from bigquery_storage_write_api_examples import Config
-from bigquery_storage_write_api_examples.entities.enrollments.enrollments_pb2 import (
-    RawEnrollments,
+from bigquery_storage_write_api_examples.append_sender import (
+    PendingAppend,
+    PipelinedAppendSender,
 )
+from bigquery_storage_write_api_examples.arrow_rows import (
+    ArrowRequestBatcher,
+    arrow_schema_for_table,
+    arrow_writer_schema,
+)
+from bigquery_storage_write_api_examples.batch_size_controller import configured_batch_size_controller
+from bigquery_storage_write_api_examples.compression import configured_compression
 from bigquery_storage_write_api_examples.fake_data_generator import FakeDataGenerator
+from bigquery_storage_write_api_examples.metrics import configured_metrics
+from bigquery_storage_write_api_examples.profiling import configured_profiler, log_profile
+from bigquery_storage_write_api_examples.request_batcher import (
+    RequestBatcher,
+    request_row_count,
+)
+from bigquery_storage_write_api_examples.row_corpus import configured_corpus
+from bigquery_storage_write_api_examples.row_encoder import RowEncoder
+from bigquery_storage_write_api_examples.table_registry import configured_message_class
+from bigquery_storage_write_api_examples.write_client import create_write_client
 
 
 class CommittedTypeStreamWriterExample:
@@ -29,12 +43,27 @@ class CommittedTypeStreamWriterExample:
         self.project_id = config.gcp_project_id
         self.dataset_id = config.gcp_dataset_id
         self.table_id = "enrollments"
+        self.message_class = configured_message_class(config, self.table_id)
+        self.max_rows_per_request = config.max_rows_per_request or 1
+        self.max_request_bytes = config.max_request_bytes
+        self.max_in_flight_requests = config.max_in_flight_requests
+        self.write_api_endpoint = config.write_api_endpoint
+        self.compression = configured_compression(config)
+        self.row_format = config.row_format
+        # Adjusts the rows per request at runtime when adaptive_batching is set in the config
+        self.batch_size_controller = configured_batch_size_controller(config, self.max_rows_per_request)
+        self.metrics = configured_metrics(config)
+        # Times the pipeline stages when profiling is set in the config
+        self.profiler = configured_profiler(config)
+        self.profile_output = config.profile_output
+        # Replays pre-encoded rows instead of generating them when corpus_dir is set in the config
+        self.corpus = configured_corpus(config, self.table_id)
 
         self._init_stream()
 
     def _init_stream(self):
         # """Create a write stream, write data which will be available immediately in the table"""
-        self.write_client = bigquery_storage_v1.BigQueryWriteClient()
+        self.write_client = create_write_client(self.write_api_endpoint, compression=self.compression)
         self.table_path = self.write_client.table_path(self.project_id, self.dataset_id, self.table_id)
 
         write_stream = types.WriteStream()
@@ -57,37 +86,62 @@ class CommittedTypeStreamWriterExample:
         # protocol buffer representation of your message descriptor.
         self.proto_schema = types.ProtoSchema()
         self.proto_descriptor = descriptor_pb2.DescriptorProto()
-        RawEnrollments.DESCRIPTOR.CopyToProto(self.proto_descriptor)
+        self.message_class.DESCRIPTOR.CopyToProto(self.proto_descriptor)
         self.proto_schema.proto_descriptor = self.proto_descriptor
         self.proto_data = types.AppendRowsRequest.ProtoData()
         self.proto_data.writer_schema = self.proto_schema
         self.request_template.proto_rows = self.proto_data
 
+        # Compiled once per message type, converts the row dicts straight to serialized protobuf bytes
+        self.row_encoder = RowEncoder.for_message(self.message_class)
+        # Cuts the rows into requests by row count and encoded size, to stay under the AppendRows request limit
+        self.batcher = RequestBatcher(
+            self.row_encoder,
+            max_rows=self.max_rows_per_request,
+            max_bytes=self.max_request_bytes,
+            batch_sizer=self.batch_size_controller,
+            profiler=self.profiler,
+        )
+
+        if self.row_format == "arrow":
+            # Columns of the table's schema JSON as Arrow record batches instead of protobuf rows,
+            # the writer schema of the first request becomes the Arrow schema
+            arrow_schema = arrow_schema_for_table(self.table_id)
+            self.request_template.arrow_rows = arrow_writer_schema(arrow_schema)
+            self.batcher = ArrowRequestBatcher(
+                arrow_schema,
+                max_rows=self.max_rows_per_request,
+                max_bytes=self.max_request_bytes,
+                batch_sizer=self.batch_size_controller,
+                profiler=self.profiler,
+            )
+
         # Some stream types support an unbounded number of requests. Construct an
         # AppendRowsStream to send an arbitrary number of requests to a stream.
         self.append_rows_stream = writer.AppendRowsStream(self.write_client, self.request_template)
-
-    def _request(self, enrollment: dict, offset: int) -> types.AppendRowsRequest:
-        request = types.AppendRowsRequest()
-        request.offset = offset
-        proto_data = types.AppendRowsRequest.ProtoData()
-
-        proto_rows = types.ProtoRows()
-
-        raw_enrollment = ParseDict(js_dict=enrollment, message=RawEnrollments(), ignore_unknown_fields=True)
-        proto_rows.serialized_rows.append(raw_enrollment.SerializeToString())
-
-        proto_data.rows = proto_rows
-        request.proto_rows = proto_data
-        return request
+        # Keeps several requests in flight instead of waiting for each response before sending the next one
+        self.sender = PipelinedAppendSender(
+            self.append_rows_stream,
+            max_in_flight=self.max_in_flight_requests,
+            on_ack=self._on_ack,
+            metrics=self.metrics.stream(self.table_path, self.stream_name) if self.metrics else None,
+            profiler=self.profiler,
+            compression=self.compression,
+        )
 
     def run(self):
-        self.logger.info("📚 Generating fake enrollments data")
-        number_of_enrollments = 5
-
-        faker = FakeDataGenerator()
-        enrollments = faker.generate_fake_enrollments(number_of_enrollments)
-        self.logger.debug(f"📦 Generated {number_of_enrollments} enrollments")
+        if self.corpus is not None:
+            self.logger.info(f"💾 Replaying {self.corpus.row_count} enrollments from '{self.corpus.path}'")
+            # The rows are sliced out of the mapped file, already encoded
+            requests = self.corpus.requests(self.max_rows_per_request, self.max_request_bytes, offset=0)
+        else:
+            self.logger.info("📚 Generating fake enrollments data")
+            number_of_enrollments = 5
+
+            faker = FakeDataGenerator()
+            # Generated lazily, only the rows of the request being built are in memory
+            enrollments = faker.iter_fake("enrollments", number_of_enrollments)
+            requests = self.batcher.requests(enrollments, offset=0)
 
         # Set an offset to allow resuming this stream if the connection breaks.
         # Keep track of which requests the server has acknowledged and resume the
@@ -95,21 +149,26 @@ class CommittedTypeStreamWriterExample:
         # processed a message with that offset, it will return an ALREADY_EXISTS
         # error, which can be safely ignored.
         #
-        # The first request must always have an offset of 0.
-        offset = 0
-
-        # For illustration purposes, we'll send one enrollment at a time.
-        # In a real scenario, you can send a batch of enrollments at once if needed.
-        for enrollment in enrollments:
-            request = self._request(enrollment, offset)
-            self._write_enrollment(request=request, enrollment_id=enrollment["enrollment_id"])
-            # Offset must equal the number of rows that were previously sent.
-            offset += 1
+        # The first request must always have an offset of 0, the batcher sets the offset of every
+        # following request to the number of rows that were previously sent.
+        #
+        # For illustration purposes, we'll send one enrollment at a time by default.
+        # In a real scenario, you can send a batch of enrollments at once by setting max_rows_per_request.
+        for batch_index, request in enumerate(requests):
+            self._write_enrollments(
+                request=request, batch_index=batch_index, batch_size=request_row_count(request)
+            )
 
             # The input() is used to pause the execution of the script to allow you to see the data in the table.
             input("Press Enter to continue...")
 
-        # Send another batch.
+        # Wait for the requests that are still in flight.
+        self.sender.drain()
+        if self.corpus is not None:
+            self.corpus.close()
+        if self.batch_size_controller is not None:
+            self.logger.info(f"🎛️ Adaptive batching: {self.batch_size_controller.summary()}")
+
         # Shutdown background threads and close the streaming connection.
         self.logger.info("⏹️ Closing append rows stream")
         self.append_rows_stream.close()
@@ -121,21 +180,16 @@ class CommittedTypeStreamWriterExample:
 
         # No need to commit the stream, it will be committed automatically
         self.logger.info(f"✅ Writes to stream: '{self.write_stream.name}' have been committed")
-
-        self.append_rows_stream.close()
-
-    @profile
-    def _write_enrollment(
-        self, request: types.AppendRowsRequest, enrollment_id: int
-    ) -> types.AppendRowsResponse:
-        response_future = self.append_rows_stream.send(request)
-        self.logger.info(f"🎓 Sending enrollment {enrollment_id}")
-        try:
-            result = response_future.result()
-            self.logger.info(f"🎓 Result for enrollment {enrollment_id} is {result}")
-        except InvalidArgument as e:
-            self.logger.error(f"🚨 Error {enrollment_id}: {e.message}")
-            self.logger.error(f"🚨 Response {enrollment_id}: {e.response}")
-            raise e
-
-        return result
+        log_profile(self.profiler, self.profile_output)
+
+    def _write_enrollments(
+        self, request: types.AppendRowsRequest, batch_index: int, batch_size: int
+    ) -> PendingAppend:
+        self.logger.info(f"🎓 Sending batch {batch_index} with {batch_size} enrollments")
+        # The sender logs the error and row errors of a failed append before raising it
+        return self.sender.send(request)
+
+    def _on_ack(self, append: PendingAppend, response: types.AppendRowsResponse):
+        self.logger.info(f"🎓 Result for the batch at offset {append.offset} is {response}")
+        if self.batch_size_controller is not None:
+            self.batch_size_controller.on_ack(append, response)
@@ -1,22 +1,43 @@
 import logging
+from collections.abc import Iterable
 
-from google.cloud.bigquery_storage_v1 import BigQueryWriteClient
 from google.cloud.bigquery_storage_v1.types import (
     AppendRowsRequest,
     AppendRowsResponse,
-    ProtoRows,
     ProtoSchema,
 )
 from google.cloud.bigquery_storage_v1.writer import AppendRowsStream
 from google.protobuf.descriptor_pb2 import DescriptorProto
-from google.protobuf.json_format import ParseDict
-from line_profiler import profile
 
 from bigquery_storage_write_api_examples import Config
-from bigquery_storage_write_api_examples.entities.students.students_pb2 import (
-    RawStudents,
+from bigquery_storage_write_api_examples.append_sender import (
+    PendingAppend,
+    PipelinedAppendSender,
 )
+from bigquery_storage_write_api_examples.arrow_rows import (
+    ArrowRequestBatcher,
+    arrow_schema_for_table,
+    arrow_writer_schema,
+)
+from bigquery_storage_write_api_examples.batch_size_controller import configured_batch_size_controller
+from bigquery_storage_write_api_examples.compression import configured_compression
+from bigquery_storage_write_api_examples.dedup import configured_deduplicator
 from bigquery_storage_write_api_examples.fake_data_generator import FakeDataGenerator
+from bigquery_storage_write_api_examples.metrics import configured_metrics
+from bigquery_storage_write_api_examples.parallel_encoder import (
+    FakeRowSource,
+    SharedMemoryEncoderPool,
+)
+from bigquery_storage_write_api_examples.pipeline import WritePipeline
+from bigquery_storage_write_api_examples.profiling import configured_profiler, log_profile
+from bigquery_storage_write_api_examples.request_batcher import (
+    RequestBatcher,
+    request_row_count,
+)
+from bigquery_storage_write_api_examples.row_corpus import configured_corpus
+from bigquery_storage_write_api_examples.row_encoder import RowEncoder
+from bigquery_storage_write_api_examples.table_registry import configured_message_class
+from bigquery_storage_write_api_examples.write_client import create_write_client
 
 
 class DefaultStreamWriterExample:
@@ -25,17 +46,54 @@ class DefaultStreamWriterExample:
         self.project_id = config.gcp_project_id
         self.dataset_id = config.gcp_dataset_id
         self.table_id = "students"
+        self.message_class = configured_message_class(config, self.table_id)
+        self.max_rows_per_request = config.max_rows_per_request or 1_000
+        self.max_request_bytes = config.max_request_bytes
+        self.max_in_flight_requests = config.max_in_flight_requests
+        self.write_api_endpoint = config.write_api_endpoint
+        self.compression = configured_compression(config)
+        self.row_format = config.row_format
+        # Adjusts the rows per request at runtime when adaptive_batching is set in the config
+        self.batch_size_controller = configured_batch_size_controller(config, self.max_rows_per_request)
+        self.metrics = configured_metrics(config)
+        # Times the pipeline stages when profiling is set in the config
+        self.profiler = configured_profiler(config)
+        self.profile_output = config.profile_output
+        self.encoder_processes = config.encoder_processes
+        if self.encoder_processes and self.row_format == "arrow":
+            raise ValueError("🛑 The encoder processes only produce protobuf rows, set row_format: proto")
+        # Drops repeated students before they are encoded when dedup_key is set in the config
+        self.deduplicator = configured_deduplicator(config)
+        if self.encoder_processes and self.deduplicator is not None:
+            raise ValueError(
+                "🛑 The encoder processes generate the rows themselves, they can't be deduplicated"
+            )
+        # Replays pre-encoded rows instead of generating them when corpus_dir is set in the config
+        self.corpus = configured_corpus(config, self.table_id)
+        if self.corpus is not None and (self.encoder_processes or self.deduplicator is not None):
+            self.corpus.close()
+            raise ValueError("🛑 A corpus is replayed as encoded, unset encoder_processes and dedup_key")
         self._init_stream()
 
     def _init_stream(self):
-        self.write_client = BigQueryWriteClient()
+        self.write_client = create_write_client(self.write_api_endpoint, compression=self.compression)
         self.table_path = self.write_client.table_path(self.project_id, self.dataset_id, self.table_id)
         self.stream_name = self.write_client.write_stream_path(
             self.project_id, self.dataset_id, self.table_id, "_default"
         )
         self.proto_descriptor: DescriptorProto = DescriptorProto()
-        RawStudents.DESCRIPTOR.CopyToProto(self.proto_descriptor)
+        self.message_class.DESCRIPTOR.CopyToProto(self.proto_descriptor)
         self.proto_schema = ProtoSchema(proto_descriptor=self.proto_descriptor)
+        # Compiled once per message type, converts the row dicts straight to serialized protobuf bytes
+        self.row_encoder = RowEncoder.for_message(self.message_class)
+        # Cuts the rows into requests by row count and encoded size, to stay under the AppendRows request limit
+        self.batcher = RequestBatcher(
+            self.row_encoder,
+            max_rows=self.max_rows_per_request,
+            max_bytes=self.max_request_bytes,
+            batch_sizer=self.batch_size_controller,
+            profiler=self.profiler,
+        )
         self.proto_data: AppendRowsRequest.ProtoData = AppendRowsRequest.ProtoData()
         self.proto_data.writer_schema = self.proto_schema
 
@@ -43,44 +101,88 @@ class DefaultStreamWriterExample:
         self.request_template.write_stream = self.stream_name
         self.request_template.proto_rows = self.proto_data
 
-        self.append_rows_stream: AppendRowsStream = AppendRowsStream(self.write_client, self.request_template)
-
-    def _request(self, students: list[dict]) -> AppendRowsRequest:
-        request = AppendRowsRequest()
-        proto_data = AppendRowsRequest.ProtoData()
-
-        proto_rows = ProtoRows()
-
-        for student in students:
-            raw_student = ParseDict(js_dict=student, message=RawStudents(), ignore_unknown_fields=True)
-            proto_rows.serialized_rows.append(raw_student.SerializeToString())
+        if self.row_format == "arrow":
+            # Columns of the table's schema JSON as Arrow record batches instead of protobuf rows,
+            # the writer schema of the first request becomes the Arrow schema
+            arrow_schema = arrow_schema_for_table(self.table_id)
+            self.request_template.arrow_rows = arrow_writer_schema(arrow_schema)
+            self.batcher = ArrowRequestBatcher(
+                arrow_schema,
+                max_rows=self.max_rows_per_request,
+                max_bytes=self.max_request_bytes,
+                batch_sizer=self.batch_size_controller,
+                profiler=self.profiler,
+            )
 
-        proto_data.rows = proto_rows
-        request.proto_rows = proto_data
-        return request
+        self.append_rows_stream: AppendRowsStream = AppendRowsStream(self.write_client, self.request_template)
+        # Keeps several requests in flight instead of waiting for each response before sending the next one
+        self.sender = PipelinedAppendSender(
+            self.append_rows_stream,
+            max_in_flight=self.max_in_flight_requests,
+            on_ack=self._on_ack,
+            metrics=self.metrics.stream(self.table_path, self.stream_name) if self.metrics else None,
+            profiler=self.profiler,
+            compression=self.compression,
+        )
 
     def run(self):
-        self.logger.info("✨ Generating fake students data")
         number_of_students = 1_000
-        fake_students = FakeDataGenerator().generate_fake_students(number_of_students)
-
-        self.logger.debug(f"🎓 Generated {len(fake_students)} fake students")
-
-        self.logger.debug("📦 Generating request")
-        request = self._request(fake_students)
-
-        self.logger.debug("🚀 Sending request")
-        response = self._write_students(request)
-
-        self.logger.debug(f"🎓 Result: {response}")
-
+        if self.corpus is not None:
+            self.logger.info(f"💾 Replaying {self.corpus.row_count} students from '{self.corpus.path}'")
+            # The rows are sliced out of the mapped file, already encoded, nothing is left to pipeline
+            self._write_requests(self.corpus.requests(self.max_rows_per_request, self.max_request_bytes))
+        elif self.encoder_processes:
+            self._run_with_encoder_pool(number_of_students)
+        else:
+            self.logger.info("✨ Streaming fake students data")
+            fake_students = FakeDataGenerator().iter_fake(self.table_id, number_of_students)
+            if self.deduplicator is not None:
+                fake_students = self.deduplicator.filter(fake_students)
+
+            # The students are generated, encoded and batched in a background thread while this one sends them,
+            # with only a few requests buffered in between.
+            # The default stream doesn't support offsets, so the requests are sent without one
+            WritePipeline(self.batcher, self._write_students).run(fake_students)
+
+        # Wait for the requests that are still in flight
+        self.sender.drain()
+        if self.corpus is not None:
+            self.corpus.close()
+        if self.batch_size_controller is not None:
+            self.logger.info(f"🎛️ Adaptive batching: {self.batch_size_controller.summary()}")
+        if self.deduplicator is not None:
+            self.logger.info(f"🧹 Deduplication: {self.deduplicator.summary()}")
+
+        log_profile(self.profiler, self.profile_output)
         self.logger.debug("✅ Data is written to BigQuery table")
 
-    @profile
-    def _write_students(self, request: AppendRowsRequest) -> AppendRowsResponse:
+    def _run_with_encoder_pool(self, number_of_students: int):
+        self.logger.info(f"✨ Generating fake students data in {self.encoder_processes} processes")
+        # The workers generate and serialize the students, this process only sends the requests
+        with SharedMemoryEncoderPool(
+            FakeRowSource(self.table_id, number_of_students),
+            self.table_id,
+            processes=self.encoder_processes,
+            slot_bytes=self.max_request_bytes,
+            max_rows_per_slot=self.max_rows_per_request,
+        ) as pool:
+            self._write_requests(pool.requests())
+
+    def _write_requests(self, requests: Iterable[AppendRowsRequest]):
+        for request_index, request in enumerate(requests):
+            self.logger.debug(
+                f"🚀 Sending request {request_index} with {request_row_count(request)} students"
+            )
+            self._write_students(request)
+
+    def _write_students(self, request: AppendRowsRequest) -> PendingAppend:
         self.logger.debug("Sending a request to BigQuery")
-        response_future = self.append_rows_stream.send(request)
-        # if this doesn't raise an exception, all rows are considered successful
-        result = response_future.result()
-        self.logger.debug(f"🎓 Result: {result}")
-        return result
+        # Only blocks when max_in_flight_requests are waiting for a response,
+        # failed appends are raised here or from drain() in the order they were sent
+        return self.sender.send(request)
+
+    def _on_ack(self, append: PendingAppend, response: AppendRowsResponse):
+        # if the sender doesn't raise an exception, all rows are considered successful
+        self.logger.debug(f"🎓 Result for {append.row_count} students: {response}")
+        if self.batch_size_controller is not None:
+            self.batch_size_controller.on_ack(append, response)
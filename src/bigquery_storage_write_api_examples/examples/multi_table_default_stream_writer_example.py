@@ -0,0 +1,75 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from google.cloud.bigquery_storage_v1 import BigQueryWriteClient
+
+from bigquery_storage_write_api_examples import Config
+from bigquery_storage_write_api_examples.compression import configured_compression
+from bigquery_storage_write_api_examples.default_stream_pool import DefaultStreamPool
+from bigquery_storage_write_api_examples.fake_data_generator import FakeDataGenerator
+from bigquery_storage_write_api_examples.table_registry import configured_message_class
+
+
+class MultiTableDefaultStreamWriterExample:
+    """
+    This example shows how to write to the default streams of several tables at the same time over a few connections.
+
+    Instead of a client and an AppendRowsStream per table, all tables share a DefaultStreamPool. The pool multiplexes
+    the default streams over ``default_stream_connections`` connections, so adding tables doesn't add sockets.
+
+    For more information, see:
+        - https://cloud.google.com/bigquery/docs/write-api-best-practices#connection_pool_management
+    """
+
+    def __init__(self, config: Config):
+        self.logger = logging.getLogger(__name__)
+        self.project_id = config.gcp_project_id
+        self.dataset_id = config.gcp_dataset_id
+        self.table_ids = ["students", "courses", "enrollments", "classes"]
+        self.message_classes = {
+            table_id: configured_message_class(config, table_id) for table_id in self.table_ids
+        }
+        self.connection_count = config.default_stream_connections
+        self.max_rows_per_request = config.max_rows_per_request or 500
+        self.max_request_bytes = config.max_request_bytes
+        self.max_in_flight_requests = config.max_in_flight_requests
+        self.write_api_endpoint = config.write_api_endpoint
+        self.compression = configured_compression(config)
+
+    def run(self):
+        number_of_rows = 1_000
+
+        start = time.perf_counter()
+        with DefaultStreamPool(
+            connection_count=self.connection_count,
+            max_rows_per_request=self.max_rows_per_request,
+            max_request_bytes=self.max_request_bytes,
+            max_in_flight=self.max_in_flight_requests,
+            endpoint=self.write_api_endpoint,
+            compression=self.compression,
+        ) as pool:
+            for table_id in self.table_ids:
+                table_path = BigQueryWriteClient.table_path(self.project_id, self.dataset_id, table_id)
+                pool.register(table_path, self.message_classes[table_id].DESCRIPTOR)
+
+            self.logger.info(
+                f"🚀 Writing {number_of_rows} rows to each of {len(self.table_ids)} tables "
+                f"over {self.connection_count} connections"
+            )
+            # One producer per table, like independent services sharing the pool
+            with ThreadPoolExecutor(max_workers=len(self.table_ids)) as executor:
+                for future in [
+                    executor.submit(self._write_table, pool, table_id, number_of_rows)
+                    for table_id in self.table_ids
+                ]:
+                    future.result()
+        elapsed = time.perf_counter() - start
+
+        self.logger.info(f"✅ Wrote {pool.acked_rows} rows in {elapsed:.2f}s")
+
+    def _write_table(self, pool: DefaultStreamPool, table_id: str, number_of_rows: int):
+        rows = FakeDataGenerator().iter_fake(table_id, number_of_rows)
+        table_path = BigQueryWriteClient.table_path(self.project_id, self.dataset_id, table_id)
+        appends = pool.append(table_path, rows)
+        self.logger.debug(f"🎓 Sent {number_of_rows} {table_id} rows in {len(appends)} requests")
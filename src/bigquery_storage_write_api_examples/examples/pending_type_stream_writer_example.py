@@ -1,14 +1,31 @@
 import logging
 
-from google.cloud import bigquery_storage_v1
 from google.cloud.bigquery_storage_v1 import types, writer
 from google.protobuf import descriptor_pb2
-from google.protobuf.json_format import ParseDict
-from line_profiler import profile
 
 from bigquery_storage_write_api_examples import Config
-from bigquery_storage_write_api_examples.entities.courses.courses_pb2 import RawCourses
+from bigquery_storage_write_api_examples.append_sender import (
+    PendingAppend,
+    PipelinedAppendSender,
+)
+from bigquery_storage_write_api_examples.arrow_rows import (
+    ArrowRequestBatcher,
+    arrow_schema_for_table,
+    arrow_writer_schema,
+)
+from bigquery_storage_write_api_examples.batch_size_controller import configured_batch_size_controller
+from bigquery_storage_write_api_examples.compression import configured_compression
 from bigquery_storage_write_api_examples.fake_data_generator import FakeDataGenerator
+from bigquery_storage_write_api_examples.metrics import configured_metrics
+from bigquery_storage_write_api_examples.profiling import configured_profiler, log_profile
+from bigquery_storage_write_api_examples.request_batcher import (
+    RequestBatcher,
+    request_row_count,
+)
+from bigquery_storage_write_api_examples.row_corpus import configured_corpus
+from bigquery_storage_write_api_examples.row_encoder import RowEncoder
+from bigquery_storage_write_api_examples.table_registry import configured_message_class
+from bigquery_storage_write_api_examples.write_client import create_write_client
 
 
 class PendingTypeStreamWriterExample:
@@ -27,12 +44,27 @@ class PendingTypeStreamWriterExample:
         self.project_id = config.gcp_project_id
         self.dataset_id = config.gcp_dataset_id
         self.table_id = "courses"
+        self.message_class = configured_message_class(config, self.table_id)
+        self.max_rows_per_request = config.max_rows_per_request or 500
+        self.max_request_bytes = config.max_request_bytes
+        self.max_in_flight_requests = config.max_in_flight_requests
+        self.write_api_endpoint = config.write_api_endpoint
+        self.compression = configured_compression(config)
+        self.row_format = config.row_format
+        # Adjusts the rows per request at runtime when adaptive_batching is set in the config
+        self.batch_size_controller = configured_batch_size_controller(config, self.max_rows_per_request)
+        self.metrics = configured_metrics(config)
+        # Times the pipeline stages when profiling is set in the config
+        self.profiler = configured_profiler(config)
+        self.profile_output = config.profile_output
+        # Replays pre-encoded rows instead of generating them when corpus_dir is set in the config
+        self.corpus = configured_corpus(config, self.table_id)
 
         self._init_stream()
 
     def _init_stream(self):
         # """Create a write stream, write some data, and commit the stream."""
-        self.write_client = bigquery_storage_v1.BigQueryWriteClient()
+        self.write_client = create_write_client(self.write_api_endpoint, compression=self.compression)
         self.table_path = self.write_client.table_path(self.project_id, self.dataset_id, self.table_id)
 
         self.write_stream = types.WriteStream()
@@ -56,41 +88,63 @@ class PendingTypeStreamWriterExample:
         # protocol buffer representation of your message descriptor.
         self.proto_schema = types.ProtoSchema()
         self.proto_descriptor = descriptor_pb2.DescriptorProto()
-        RawCourses.DESCRIPTOR.CopyToProto(self.proto_descriptor)
+        self.message_class.DESCRIPTOR.CopyToProto(self.proto_descriptor)
         self.proto_schema.proto_descriptor = self.proto_descriptor
         self.proto_data = types.AppendRowsRequest.ProtoData()
         self.proto_data.writer_schema = self.proto_schema
         self.request_template.proto_rows = self.proto_data
 
+        # Compiled once per message type, converts the row dicts straight to serialized protobuf bytes
+        self.row_encoder = RowEncoder.for_message(self.message_class)
+        # Cuts the rows into requests by row count and encoded size, to stay under the AppendRows request limit
+        self.batcher = RequestBatcher(
+            self.row_encoder,
+            max_rows=self.max_rows_per_request,
+            max_bytes=self.max_request_bytes,
+            batch_sizer=self.batch_size_controller,
+            profiler=self.profiler,
+        )
+
+        if self.row_format == "arrow":
+            # Columns of the table's schema JSON as Arrow record batches instead of protobuf rows,
+            # the writer schema of the first request becomes the Arrow schema
+            arrow_schema = arrow_schema_for_table(self.table_id)
+            self.request_template.arrow_rows = arrow_writer_schema(arrow_schema)
+            self.batcher = ArrowRequestBatcher(
+                arrow_schema,
+                max_rows=self.max_rows_per_request,
+                max_bytes=self.max_request_bytes,
+                batch_sizer=self.batch_size_controller,
+                profiler=self.profiler,
+            )
+
         # Some stream types support an unbounded number of requests. Construct an
         # AppendRowsStream to send an arbitrary number of requests to a stream.
         self.append_rows_stream = writer.AppendRowsStream(self.write_client, self.request_template)
-
-    def _request(self, courses: list[dict], offset: int) -> types.AppendRowsRequest:
-        request = types.AppendRowsRequest()
-        request.offset = offset
-        proto_data = types.AppendRowsRequest.ProtoData()
-
-        proto_rows = types.ProtoRows()
-
-        for course in courses:
-            raw_course = ParseDict(js_dict=course, message=RawCourses(), ignore_unknown_fields=True)
-            proto_rows.serialized_rows.append(raw_course.SerializeToString())
-
-        proto_data.rows = proto_rows
-        request.proto_rows = proto_data
-        return request
+        # Keeps several requests in flight instead of waiting for each response before sending the next one
+        self.sender = PipelinedAppendSender(
+            self.append_rows_stream,
+            max_in_flight=self.max_in_flight_requests,
+            on_ack=self._on_ack,
+            metrics=self.metrics.stream(self.table_path, self.stream_name) if self.metrics else None,
+            profiler=self.profiler,
+            compression=self.compression,
+        )
 
     def run(self):
-        self.logger.info("📚 Generating fake courses data")
-        number_of_batches = 2
-        number_of_courses = 500
-
-        faker = FakeDataGenerator()
+        if self.corpus is not None:
+            self.logger.info(f"💾 Replaying {self.corpus.row_count} courses from '{self.corpus.path}'")
+            # The rows are sliced out of the mapped file, already encoded
+            requests = self.corpus.requests(self.max_rows_per_request, self.max_request_bytes, offset=0)
+        else:
+            self.logger.info("📚 Generating fake courses data")
+            number_of_courses = 1_000
 
-        batches = [faker.generate_fake_courses(number_of_courses) for _ in range(number_of_batches)]
+            faker = FakeDataGenerator()
 
-        self.logger.debug(f"📦 Generated {len(batches)} batches with {number_of_courses} courses each")
+            # Generated lazily, only the rows of the request being built are in memory
+            courses = faker.iter_fake("courses", number_of_courses)
+            requests = self.batcher.requests(courses, offset=0)
 
         # Set an offset to allow resuming this stream if the connection breaks.
         # Keep track of which requests the server has acknowledged and resume the
@@ -98,19 +152,23 @@ class PendingTypeStreamWriterExample:
         # processed a message with that offset, it will return an ALREADY_EXISTS
         # error, which can be safely ignored.
         #
-        # The first request must always have an offset of 0.
-        offset = 0
-
-        for batch_index, batch in enumerate(batches):
-            request = self._request(batch, offset)
-            self._write_courses(request=request, batch_index=batch_index, batch_size=len(batch))
-            # Offset must equal the number of rows that were previously sent.
-            offset += len(batch)
+        # The first request must always have an offset of 0, the batcher sets the offset of every
+        # following request to the number of rows that were previously sent.
+        for batch_index, request in enumerate(requests):
+            self._write_courses(
+                request=request, batch_index=batch_index, batch_size=request_row_count(request)
+            )
 
             # The input() is used to pause the execution of the script to allow you to check the data in the table.
             input("Press Enter to continue...")
 
-        # Send another batch.
+        # Wait for the requests that are still in flight.
+        self.sender.drain()
+        if self.corpus is not None:
+            self.corpus.close()
+        if self.batch_size_controller is not None:
+            self.logger.info(f"🎛️ Adaptive batching: {self.batch_size_controller.summary()}")
+
         # Shutdown background threads and close the streaming connection.
         self.logger.info("⏹️ Closing append rows stream")
         self.append_rows_stream.close()
@@ -128,14 +186,15 @@ class PendingTypeStreamWriterExample:
         self.write_client.batch_commit_write_streams(batch_commit_write_streams_request)
 
         self.logger.info(f"✅ Writes to stream: '{self.write_stream.name}' have been committed")
+        log_profile(self.profiler, self.profile_output)
 
-    @profile
     def _write_courses(
         self, request: types.AppendRowsRequest, batch_index: int, batch_size: int
-    ) -> types.AppendRowsResponse:
-        response_future = self.append_rows_stream.send(request)
+    ) -> PendingAppend:
         self.logger.info(f"🎓 Sending batch {batch_index} with {batch_size} courses")
-        result = response_future.result()
-        self.logger.info(f"🎓 Result for batch {batch_index} is {result}")
+        return self.sender.send(request)
 
-        return result
+    def _on_ack(self, append: PendingAppend, response: types.AppendRowsResponse):
+        self.logger.info(f"🎓 Result for the batch at offset {append.offset} is {response}")
+        if self.batch_size_controller is not None:
+            self.batch_size_controller.on_ack(append, response)
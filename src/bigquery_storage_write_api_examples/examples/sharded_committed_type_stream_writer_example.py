@@ -0,0 +1,71 @@
+import logging
+import time
+
+from google.cloud.bigquery_storage_v1 import BigQueryWriteClient
+
+from bigquery_storage_write_api_examples import Config
+from bigquery_storage_write_api_examples.compression import configured_compression
+from bigquery_storage_write_api_examples.fake_data_generator import FakeDataGenerator
+from bigquery_storage_write_api_examples.sharded_committed_writer import (
+    ShardedCommittedWriter,
+)
+from bigquery_storage_write_api_examples.table_registry import configured_message_class
+
+
+class ShardedCommittedTypeStreamWriterExample:
+    """
+    This example shows how to scale Committed Type Stream writes by spreading the rows over several streams.
+
+    A single stream is limited by its connection, so the writer opens one COMMITTED stream per shard, each on its own
+    connection, and writes to all of them in parallel. Every stream keeps its own offsets and keeps the
+    Exactly-Once delivery semantics of a COMMITTED stream.
+
+    For more information, see:
+        - https://cloud.google.com/bigquery/docs/write-api-best-practices
+    """
+
+    def __init__(self, config: Config):
+        self.logger = logging.getLogger(__name__)
+        self.project_id = config.gcp_project_id
+        self.dataset_id = config.gcp_dataset_id
+        self.table_id = "enrollments"
+        self.message_class = configured_message_class(config, self.table_id)
+        self.shard_count = config.committed_stream_shards
+        self.max_rows_per_request = config.max_rows_per_request or 500
+        self.max_request_bytes = config.max_request_bytes
+        self.max_in_flight_requests = config.max_in_flight_requests
+        self.write_api_endpoint = config.write_api_endpoint
+        self.compression = configured_compression(config)
+
+    def run(self):
+        self.logger.info("📚 Generating fake enrollments data")
+        number_of_enrollments = 10_000
+        enrollments = FakeDataGenerator().iter_fake(self.table_id, number_of_enrollments)
+
+        table_path = BigQueryWriteClient.table_path(self.project_id, self.dataset_id, self.table_id)
+
+        self.logger.info(
+            f"🚀 Writing {number_of_enrollments} enrollments over {self.shard_count} committed streams"
+        )
+        start = time.perf_counter()
+        # Enrollments of the same student always go to the same stream, so they are written in order
+        with ShardedCommittedWriter(
+            table_path,
+            self.message_class.DESCRIPTOR,
+            shard_count=self.shard_count,
+            shard_key="student_id",
+            max_rows_per_request=self.max_rows_per_request,
+            max_request_bytes=self.max_request_bytes,
+            max_in_flight=self.max_in_flight_requests,
+            endpoint=self.write_api_endpoint,
+            compression=self.compression,
+        ) as writer:
+            writer.write(enrollments)
+        elapsed = time.perf_counter() - start
+
+        for stream_name, offset in writer.offsets().items():
+            self.logger.info(f"🎓 Stream '{stream_name}' acknowledged {offset} rows")
+
+        # No need to commit the streams, COMMITTED streams are committed automatically
+        self.logger.info(f"✅ Wrote {number_of_enrollments} enrollments in {elapsed:.2f}s")
+        self.logger.info(f"✅ {number_of_enrollments / elapsed:,.0f} rows/s")
@@ -1,10 +1,58 @@
+from collections.abc import Callable, Iterator
+from datetime import date, datetime
+
+import numpy as np
 from faker import Faker
 
+_MICROSECONDS = 1_000_000
+_ENROLLMENT_STATUSES = np.array(["active", "inactive", "pending", "completed", "cancelled"], dtype=object)
+_DAYS_OF_WEEK = np.array(
+    ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"], dtype=object
+)
+# Faker's time_object() formatted as "%H:%M:00", one value per minute of the day
+_TIMES_OF_DAY = np.array(
+    [f"{hour:02d}:{minute:02d}:00" for hour in range(24) for minute in range(60)], dtype=object
+)
+
 
 class FakeDataGenerator:
-    def __init__(self):
+    def __init__(self, seed: int | None = None):
         self.faker = Faker()
-        pass
+        if seed is not None:
+            # Processes that generate data in parallel need different seeds, or they produce the same rows
+            self.faker.seed_instance(seed)
+
+    def generate_fake(self, entity: str, n: int) -> list[dict]:
+        """Generate fake data for one of the entities in misc/schemas
+
+        Args:
+            entity (str): Entity (table) name, e.g. "students"
+            n (int): Number of fake rows to generate
+        """
+        generators = {
+            "students": self.generate_fake_students,
+            "courses": self.generate_fake_courses,
+            "enrollments": self.generate_fake_enrollments,
+            "classes": self.generate_fake_classes,
+        }
+        if entity not in generators:
+            raise ValueError(f"🛑 No fake data generator for '{entity}', expected one of {list(generators)}")
+        return generators[entity](n)
+
+    def iter_fake(self, entity: str, n: int, chunk_size: int = 1_000) -> Iterator[dict]:
+        """Lazily generate fake data for one of the entities, ``chunk_size`` rows at a time
+
+        Unlike ``generate_fake`` only one chunk of rows is in memory, so ``n`` can be far larger than the memory.
+
+        Args:
+            entity (str): Entity (table) name, e.g. "students"
+            n (int): Number of fake rows to generate
+            chunk_size (int): Number of rows generated per call of the entity's generator
+        """
+        while n > 0:
+            chunk = min(chunk_size, n)
+            yield from self.generate_fake(entity, chunk)
+            n -= chunk
 
     def _generate_fake_student(self) -> dict:
         """Generate fake student data"""
@@ -142,3 +190,259 @@ class FakeDataGenerator:
             n (int): Number of fake classes to generate
         """
         return [self._generate_fake_class() for _ in range(n)]
+
+
+class BulkFakeDataGenerator(FakeDataGenerator):
+    """
+    Generates fake rows a column at a time, for load tests with millions of rows.
+
+    Numbers and timestamps are drawn as NumPy arrays, text values are drawn from pools that Faker fills once
+    per generator (``pool_size`` values each, lazily), then the columns are zipped into rows. The rows have
+    the same fields, types and value ranges as the rows of the FakeDataGenerator, with fewer distinct texts.
+    """
+
+    def __init__(self, seed: int | None = None, pool_size: int = 1_000):
+        super().__init__(seed)
+        self.rng = np.random.default_rng(seed)
+        self.pool_size = pool_size
+        self._pools: dict[str, np.ndarray] = {}
+
+    def _pool(self, name: str, factory: Callable[[], object], size: int | None = None) -> np.ndarray:
+        pool = self._pools.get(name)
+        if pool is None:
+            pool = np.empty(size or self.pool_size, dtype=object)
+            pool[:] = [factory() for _ in range(len(pool))]
+            self._pools[name] = pool
+        return pool
+
+    def _pick(self, values: np.ndarray, shape) -> list:
+        return values[self.rng.integers(0, len(values), shape)].tolist()
+
+    def _choice(self, name: str, factory: Callable[[], object], shape, size: int | None = None) -> list:
+        return self._pick(self._pool(name, factory, size), shape)
+
+    def _ids(self, shape) -> np.ndarray:
+        return self.rng.integers(1, 1_000_000, shape, endpoint=True)
+
+    def _timestamps_this_year(self, shape) -> np.ndarray:
+        """Microseconds since the epoch between the start of the year and now, like date_time_this_year"""
+        now = datetime.now()
+        start = datetime(now.year, 1, 1)
+        return self.rng.integers(
+            int(start.timestamp() * _MICROSECONDS), int(now.timestamp() * _MICROSECONDS), shape
+        )
+
+    def _dates_this_year(self, shape) -> list:
+        now = date.today()
+        start = np.datetime64(date(now.year, 1, 1), "D")
+        days = self.rng.integers(0, (now - date(now.year, 1, 1)).days + 1, shape)
+        return (start + days).astype(str).tolist()
+
+    def _metadata(self, n: int) -> list:
+        # faker.json() is by far the slowest call, a tenth of the pool size is enough variety
+        return self._choice("json", self.faker.json, n, max(self.pool_size // 10, 1))
+
+    def generate_fake_students(self, n: int) -> list[dict]:
+        """Generate fake students data
+
+        Args:
+            n (int): Number of fake students to generate
+        """
+        today = np.datetime64(date.today(), "D")
+        ages_in_days = self.rng.integers(16 * 365, 100 * 365, n, endpoint=True)
+        columns = zip(
+            self._ids(n).tolist(),
+            self._choice("first_names", self.faker.first_name, n),
+            self._choice("last_names", self.faker.last_name, n),
+            (today - ages_in_days).astype(str).tolist(),
+            self.rng.integers(1900, 2025, n, endpoint=True).tolist(),
+            self._choice("emails", self.faker.email, n),
+            self._choice("phones", self.faker.phone_number, n),
+            self._choice("streets", self.faker.street_address, n),
+            self._choice("cities", self.faker.city, n),
+            self._choice("states", self.faker.state, n),
+            self._choice("postcodes", self.faker.postcode, n),
+            self._choice("countries", self.faker.country, n),
+            self._choice("phones", self.faker.phone_number, (n, 3)),
+            self._timestamps_this_year(n).tolist(),
+            self._metadata(n),
+        )
+        return [
+            {
+                "student_id": student_id,
+                "first_name": first_name,
+                "last_name": last_name,
+                "birthdate": birthdate,
+                "year": year,
+                "contact_info": {"email": email, "phone": phone},
+                "address": {
+                    "street": street,
+                    "city": city,
+                    "state": state,
+                    "postal_code": postal_code,
+                    "country": country,
+                },
+                "emergency_contacts": emergency_contacts,
+                "last_login": last_login,
+                "metadata": metadata,
+            }
+            for (
+                student_id,
+                first_name,
+                last_name,
+                birthdate,
+                year,
+                email,
+                phone,
+                street,
+                city,
+                state,
+                postal_code,
+                country,
+                emergency_contacts,
+                last_login,
+                metadata,
+            ) in columns
+        ]
+
+    def generate_fake_courses(self, n: int) -> list[dict]:
+        """Generate fake courses data
+
+        Args:
+            n (int): Number of fake courses to generate
+        """
+        columns = zip(
+            self._ids(n).astype(str).tolist(),
+            self._choice("words", self.faker.word, n),
+            self._choice("sentences", self.faker.sentence, n),
+            self.rng.integers(1, 10, n, endpoint=True).astype(str).tolist(),
+            self.rng.integers(1, 10, n, endpoint=True).tolist(),
+            self._choice("words", self.faker.word, (n, 3)),
+            self._timestamps_this_year(n).tolist(),
+            self._metadata(n),
+        )
+        return [
+            {
+                "course_id": course_id,
+                "course_name": course_name,
+                "description": description,
+                "credits": credits,
+                "duration_weeks": duration_weeks,
+                "required_materials": required_materials,
+                "created_at": created_at,
+                "course_metadata": course_metadata,
+            }
+            for (
+                course_id,
+                course_name,
+                description,
+                credits,
+                duration_weeks,
+                required_materials,
+                created_at,
+                course_metadata,
+            ) in columns
+        ]
+
+    def generate_fake_enrollments(self, n: int) -> list[dict]:
+        """Generate fake enrollments data
+
+        Args:
+            n (int): Number of fake enrollments to generate
+        """
+        enrollment_dates = self._timestamps_this_year(n).astype("datetime64[us]").astype(str).tolist()
+        columns = zip(
+            self._ids(n).astype(str).tolist(),
+            self._ids(n).tolist(),
+            self._ids(n).astype(str).tolist(),
+            enrollment_dates,
+            self._pick(_ENROLLMENT_STATUSES, n),
+            self._ids(n).astype(str).tolist(),
+            self._choice("currency_codes", self.faker.currency_code, n),
+            self._timestamps_this_year(n).tolist(),
+        )
+        return [
+            {
+                "enrollment_id": enrollment_id,
+                "student_id": student_id,
+                "class_id": class_id,
+                "enrollment_date": enrollment_date,
+                "status": status,
+                "fee_payment": [{"amount": amount, "currency": currency, "payment_date": payment_date}],
+            }
+            for (
+                enrollment_id,
+                student_id,
+                class_id,
+                enrollment_date,
+                status,
+                amount,
+                currency,
+                payment_date,
+            ) in columns
+        ]
+
+    def generate_fake_classes(self, n: int) -> list[dict]:
+        """Generate fake class data
+
+        Args:
+            n (int): Number of fake classes to generate
+        """
+        start_dates = self._dates_this_year((n, 3))
+        end_dates = self._dates_this_year((n, 3))
+        days_of_week = self._pick(_DAYS_OF_WEEK, (n, 3, 3))
+        start_times = self._pick(_TIMES_OF_DAY, (n, 3))
+        end_times = self._pick(_TIMES_OF_DAY, (n, 3))
+        session_dates = self._dates_this_year((n, 3))
+        topics = self._choice("words", self.faker.word, (n, 3))
+        columns = zip(
+            self._ids(n).astype(str).tolist(),
+            self._ids(n).astype(str).tolist(),
+            self._ids(n).tolist(),
+            start_dates,
+            end_dates,
+            days_of_week,
+            start_times,
+            end_times,
+            self.rng.integers(1, 100, n, endpoint=True).tolist(),
+            self.rng.integers(1, 20, n, endpoint=True).tolist(),
+            session_dates,
+            topics,
+            self._dates_this_year(n),
+        )
+        return [
+            {
+                "class_id": class_id,
+                "course_id": course_id,
+                "instructor_id": instructor_id,
+                "schedule": [
+                    {
+                        "start_date": start_date[i],
+                        "end_date": end_date[i],
+                        "days_of_week": days[i],
+                        "start_time": start_time[i],
+                        "end_time": end_time[i],
+                    }
+                    for i in range(3)
+                ],
+                "room_number": room_number,
+                "max_capacity": max_capacity,
+                "sessions": [{"session_date": session_date[i], "topic": topic[i]} for i in range(3)],
+                "exam_datetime": exam_datetime,
+            }
+            for (
+                class_id,
+                course_id,
+                instructor_id,
+                start_date,
+                end_date,
+                days,
+                start_time,
+                end_time,
+                room_number,
+                max_capacity,
+                session_date,
+                topic,
+                exam_datetime,
+            ) in columns
+        ]
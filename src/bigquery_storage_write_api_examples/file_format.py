@@ -0,0 +1,24 @@
+from enum import Enum
+from pathlib import Path
+
+
+class FileFormat(Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+    PARQUET = "parquet"
+
+    @classmethod
+    def from_path(cls, path: str | Path) -> "FileFormat":
+        """Guess the format from the file extension"""
+        suffix = Path(path).suffix.lower()
+        formats = {
+            ".ndjson": cls.NDJSON,
+            ".jsonl": cls.NDJSON,
+            ".json": cls.NDJSON,
+            ".csv": cls.CSV,
+            ".parquet": cls.PARQUET,
+            ".pq": cls.PARQUET,
+        }
+        if suffix not in formats:
+            raise ValueError(f"🛑 Can't tell the format of '{path}' from its extension, pass it explicitly")
+        return formats[suffix]
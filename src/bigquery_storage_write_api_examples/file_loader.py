@@ -0,0 +1,335 @@
+import csv
+import itertools
+import json
+import logging
+import time
+from collections.abc import Iterator
+from datetime import UTC, date, datetime
+from datetime import time as time_of_day
+from decimal import Decimal
+from pathlib import Path
+from typing import Any
+
+from google.protobuf.descriptor import Descriptor, FieldDescriptor
+
+from bigquery_storage_write_api_examples.append_sender import DEFAULT_MAX_IN_FLIGHT
+from bigquery_storage_write_api_examples.checkpoint import (
+    Checkpoint,
+    CheckpointLog,
+    CheckpointState,
+)
+from bigquery_storage_write_api_examples.compression import Compression
+from bigquery_storage_write_api_examples.file_format import FileFormat
+from bigquery_storage_write_api_examples.metrics import WriterMetrics
+from bigquery_storage_write_api_examples.pipeline import (
+    DEFAULT_MAX_BUFFERED_REQUESTS,
+    WritePipeline,
+)
+from bigquery_storage_write_api_examples.request_batcher import (
+    DEFAULT_MAX_REQUEST_BYTES,
+    DEFAULT_MAX_ROWS_PER_REQUEST,
+    RequestBatcher,
+)
+from bigquery_storage_write_api_examples.row_encoder import RowEncoder, is_repeated
+from bigquery_storage_write_api_examples.write_client import create_write_client
+from bigquery_storage_write_api_examples.write_session import StreamType, WriteSession
+
+DEFAULT_CHUNK_ROWS = 10_000
+
+_INTEGER_TYPES = {
+    FieldDescriptor.TYPE_INT32,
+    FieldDescriptor.TYPE_INT64,
+    FieldDescriptor.TYPE_UINT32,
+    FieldDescriptor.TYPE_UINT64,
+    FieldDescriptor.TYPE_SINT32,
+    FieldDescriptor.TYPE_SINT64,
+    FieldDescriptor.TYPE_FIXED32,
+    FieldDescriptor.TYPE_FIXED64,
+    FieldDescriptor.TYPE_SFIXED32,
+    FieldDescriptor.TYPE_SFIXED64,
+}
+
+
+class RowMapper:
+    """
+    Maps rows read from a file onto the fields of a message, in the form the RowEncoder accepts.
+
+    Columns without a field are dropped. Nested records and repeated values of flat formats like CSV are expected
+    as JSON in their cell. Timestamps of columnar formats become microseconds since the epoch for integer fields
+    (as the ``Raw*`` messages store them) and ISO 8601 strings for string fields, dates and times become ISO 8601.
+    """
+
+    def __init__(self, descriptor: Descriptor):
+        self.descriptor = descriptor
+        self._fields = {field.name: field for field in descriptor.fields}
+        self._nested: dict[str, RowMapper] = {
+            field.name: RowMapper(field.message_type)
+            for field in descriptor.fields
+            if field.type == FieldDescriptor.TYPE_MESSAGE
+        }
+
+    def map(self, row: dict) -> dict:
+        mapped = {}
+        for name, value in row.items():
+            field = self._fields.get(name)
+            if field is None or value is None:
+                continue
+            mapped[name] = self._convert(field, value)
+        return mapped
+
+    def _convert(self, field: FieldDescriptor, value: Any) -> Any:
+        repeated = is_repeated(field)
+        if isinstance(value, str) and (repeated or field.type == FieldDescriptor.TYPE_MESSAGE):
+            value = json.loads(value)
+        if repeated and isinstance(value, list):
+            return [self._convert_single(field, item) for item in value]
+        return self._convert_single(field, value)
+
+    def _convert_single(self, field: FieldDescriptor, value: Any) -> Any:
+        if field.type == FieldDescriptor.TYPE_MESSAGE:
+            return self._nested[field.name].map(value) if isinstance(value, dict) else value
+        if isinstance(value, datetime):
+            if field.type in _INTEGER_TYPES:
+                # Naive timestamps are taken as UTC, which is what BigQuery does
+                aware = value if value.tzinfo is not None else value.replace(tzinfo=UTC)
+                return int(aware.timestamp() * 1_000_000)
+            return value.isoformat()
+        if isinstance(value, date | time_of_day):
+            return value.isoformat()
+        if isinstance(value, Decimal):
+            return str(value) if field.type == FieldDescriptor.TYPE_STRING else float(value)
+        return value
+
+
+def read_rows(
+    path: str | Path, file_format: FileFormat, chunk_rows: int = DEFAULT_CHUNK_ROWS, skip_rows: int = 0
+) -> Iterator[dict]:
+    """Stream the rows of a file as dictionaries, without loading the file into memory
+
+    Args:
+        path (str | Path): File to read
+        file_format (FileFormat): Format of the file
+        chunk_rows (int): Rows decoded at a time from columnar formats
+        skip_rows (int): Rows to skip at the start of the file, without decoding them where the format allows
+    """
+    match file_format:
+        case FileFormat.NDJSON:
+            return _read_ndjson(Path(path), skip_rows)
+        case FileFormat.CSV:
+            return _read_csv(Path(path), skip_rows)
+        case FileFormat.PARQUET:
+            return _read_parquet(Path(path), chunk_rows, skip_rows)
+        case _:
+            raise ValueError(f"🛑 Unsupported file format: {file_format}")
+
+
+def _read_ndjson(path: Path, skip_rows: int) -> Iterator[dict]:
+    with path.open("rb") as f:
+        for line in f:
+            if line.strip():
+                if skip_rows:
+                    skip_rows -= 1
+                    continue
+                yield json.loads(line)
+
+
+def _read_csv(path: Path, skip_rows: int) -> Iterator[dict]:
+    with path.open(newline="") as f:
+        for row in itertools.islice(csv.DictReader(f), skip_rows, None):
+            # An empty cell is a NULL, CSV has no other way to tell them apart
+            yield {name: value for name, value in row.items() if value != ""}
+
+
+def _read_parquet(path: Path, chunk_rows: int, skip_rows: int) -> Iterator[dict]:
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError(
+            "🛑 Loading Parquet files requires pyarrow, install the 'arrow' extra of this package"
+        ) from e
+
+    parquet_file = pq.ParquetFile(path)
+    # Whole row groups are skipped from the footer metadata, without reading them
+    row_groups: list[int] = []
+    for index in range(parquet_file.num_row_groups):
+        group_rows = parquet_file.metadata.row_group(index).num_rows
+        if skip_rows >= group_rows and not row_groups:
+            skip_rows -= group_rows
+        else:
+            row_groups.append(index)
+    if not row_groups:
+        return
+    for record_batch in parquet_file.iter_batches(batch_size=chunk_rows, row_groups=row_groups):
+        if skip_rows >= record_batch.num_rows:
+            skip_rows -= record_batch.num_rows
+            continue
+        yield from record_batch.slice(skip_rows).to_pylist()
+        skip_rows = 0
+
+
+class FileLoader:
+    """
+    Loads a large NDJSON, CSV or Parquet file into a table through one write stream of any type.
+
+    The file is read, mapped onto the table's message, encoded and batched in a background thread of a
+    WritePipeline while the calling thread sends the requests, so parsing overlaps with sending. Only a few
+    requests are buffered between the two and the readers stream the file, so memory stays bounded by the request
+    size, the in-flight window and ``max_buffered_requests``, whatever the size of the file.
+
+    BUFFERED streams are flushed and PENDING streams committed once the whole file is written.
+
+    With a ``checkpoint_path``, the acknowledged offset of the stream is recorded while loading. A load of the same
+    file with ``resume=True`` then reopens the stream of the interrupted load and continues at its checkpoint,
+    skipping the rows that were already written without decoding or encoding them again.
+    """
+
+    def __init__(
+        self,
+        table_path: str,
+        descriptor: Descriptor,
+        stream_type: StreamType = StreamType.DEFAULT,
+        max_rows_per_request: int = DEFAULT_MAX_ROWS_PER_REQUEST,
+        max_request_bytes: int = DEFAULT_MAX_REQUEST_BYTES,
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+        max_buffered_requests: int = DEFAULT_MAX_BUFFERED_REQUESTS,
+        chunk_rows: int = DEFAULT_CHUNK_ROWS,
+        endpoint: str | None = None,
+        checkpoint_path: str | Path | None = None,
+        metrics: WriterMetrics | None = None,
+        compression: Compression = Compression.NONE,
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.table_path = table_path
+        self.descriptor = descriptor
+        self.stream_type = stream_type
+        self.max_in_flight = max_in_flight
+        self.max_buffered_requests = max_buffered_requests
+        self.chunk_rows = chunk_rows
+        self.endpoint = endpoint
+        self.checkpoint_path = checkpoint_path
+        self.metrics = metrics
+        self.compression = compression
+        self.mapper = RowMapper(descriptor)
+        self.batcher = RequestBatcher(
+            RowEncoder.for_descriptor(descriptor), max_rows=max_rows_per_request, max_bytes=max_request_bytes
+        )
+
+    def load(self, path: str | Path, file_format: FileFormat | None = None, resume: bool = False) -> int:
+        """Write every row of the file to the table
+
+        Args:
+            path (str | Path): File to load
+            file_format (FileFormat | None): Format of the file, guessed from the extension by default
+            resume (bool): Continue the interrupted load of this file from its checkpoint, if there is one
+
+        Returns:
+            int: Number of rows written by this call
+        """
+        file_format = file_format or FileFormat.from_path(path)
+        if self.checkpoint_path is None:
+            if resume:
+                raise ValueError("🛑 Resuming a load needs the checkpoint_path of the interrupted load")
+            return self._load(path, file_format)
+        if self.stream_type is StreamType.DEFAULT:
+            raise ValueError("🛑 The default stream has no offsets to checkpoint, use another stream type")
+        with CheckpointLog(self.checkpoint_path) as checkpoint_log:
+            return self._load(path, file_format, checkpoint_log, resume)
+
+    def _load(
+        self,
+        path: str | Path,
+        file_format: FileFormat,
+        checkpoint_log: CheckpointLog | None = None,
+        resume: bool = False,
+    ) -> int:
+        write_client = create_write_client(self.endpoint, compression=self.compression)
+        checkpoint = None
+        if checkpoint_log is not None:
+            checkpoint = self._resumable_checkpoint(checkpoint_log, path) if resume else None
+            if checkpoint is not None and checkpoint.state is CheckpointState.DONE:
+                self.logger.info(f"✅ '{path}' was already loaded into '{checkpoint.stream_name}'")
+                return 0
+        session = WriteSession(
+            write_client,
+            self.table_path,
+            self.stream_type,
+            self.descriptor,
+            max_in_flight=self.max_in_flight,
+            resume_stream=checkpoint.stream_name if checkpoint is not None else None,
+            resume_offset=checkpoint.offset if checkpoint is not None else 0,
+            metrics=self.metrics,
+            compression=self.compression,
+        )
+        if checkpoint_log is not None:
+            if checkpoint is None:
+                checkpoint = Checkpoint(
+                    key=self._checkpoint_key(path),
+                    table_path=self.table_path,
+                    stream_name=session.stream_name,
+                    stream_type=self.stream_type.value,
+                    fingerprint=self._fingerprint(path),
+                )
+                checkpoint_log.record(checkpoint, sync=True)
+            session.sender.on_ack = checkpoint_log.on_ack(checkpoint)
+        skip_rows = checkpoint.offset if checkpoint is not None else 0
+        self.logger.info(f"📂 Loading {file_format.value} file '{path}' into '{session.stream_name}'")
+
+        start = time.perf_counter()
+        rows = (self.mapper.map(row) for row in read_rows(path, file_format, self.chunk_rows, skip_rows))
+        try:
+            if checkpoint is None or checkpoint.state is CheckpointState.OPEN:
+                pipeline = WritePipeline(self.batcher, session.send, self.max_buffered_requests)
+                row_count = pipeline.run(rows, offset=session.next_offset)
+            else:
+                # Finalized before the crash, only the commit is missing
+                row_count = 0
+            if self.stream_type is StreamType.BUFFERED:
+                session.flush()
+        except Exception:
+            # The stream is left unfinalized, so the rows that made it can be inspected
+            try:
+                session.close(finalize=False)
+            except Exception as e:  # noqa: BLE001
+                # The error of the load is the one worth raising
+                self.logger.debug(f"Ignoring error while closing failed stream '{session.stream_name}': {e}")
+            raise
+        if checkpoint is not None and checkpoint.state is CheckpointState.FINALIZED:
+            session.close(finalize=False)
+        else:
+            session.close()
+        if self.stream_type is StreamType.PENDING:
+            if checkpoint_log is not None and checkpoint is not None:
+                checkpoint.state = CheckpointState.FINALIZED
+                checkpoint_log.record(checkpoint, sync=True)
+            WriteSession.commit(write_client, self.table_path, [session])
+        if checkpoint_log is not None and checkpoint is not None:
+            checkpoint.state = CheckpointState.DONE
+            checkpoint_log.record(checkpoint, sync=True)
+        elapsed = time.perf_counter() - start
+
+        self.logger.info(f"✅ Loaded {row_count} rows in {elapsed:.2f}s ({row_count / elapsed:,.0f} rows/s)")
+        return row_count
+
+    def _checkpoint_key(self, path: str | Path) -> str:
+        return f"{self.table_path}:{Path(path).resolve()}"
+
+    def _fingerprint(self, path: str | Path) -> str:
+        # A resumed load must see the same file and cut it into the same requests, or its offsets won't line up
+        stat = Path(path).stat()
+        return f"{stat.st_size}:{stat.st_mtime_ns}:{self.batcher.max_rows}:{self.batcher.max_bytes}"
+
+    def _resumable_checkpoint(self, checkpoint_log: CheckpointLog, path: str | Path) -> Checkpoint | None:
+        checkpoint = checkpoint_log.get(self._checkpoint_key(path))
+        if checkpoint is None:
+            self.logger.info(f"⭕ No checkpoint for '{path}', loading it from the start")
+            return None
+        if checkpoint.stream_type != self.stream_type.value:
+            raise ValueError(
+                f"🛑 '{path}' was being loaded through a {checkpoint.stream_type} stream, "
+                f"resume it with that stream type"
+            )
+        if checkpoint.fingerprint != self._fingerprint(path):
+            raise ValueError(
+                f"🛑 '{path}' or the request limits changed since the checkpoint, the load can't be resumed"
+            )
+        return checkpoint
@@ -0,0 +1,383 @@
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+
+from google.cloud.bigquery_storage_v1 import BigQueryWriteClient, types
+from google.protobuf.descriptor import Descriptor
+
+from bigquery_storage_write_api_examples.append_sender import (
+    DEFAULT_MAX_IN_FLIGHT,
+    AckCallback,
+    PendingAppend,
+)
+from bigquery_storage_write_api_examples.bench import percentiles
+from bigquery_storage_write_api_examples.compression import Compression
+from bigquery_storage_write_api_examples.fake_data_generator import BulkFakeDataGenerator
+from bigquery_storage_write_api_examples.metrics import WriterMetrics
+from bigquery_storage_write_api_examples.request_batcher import serialized_row_size
+from bigquery_storage_write_api_examples.row_corpus import RowCorpus
+from bigquery_storage_write_api_examples.row_encoder import RowEncoder
+from bigquery_storage_write_api_examples.write_client import create_write_client
+from bigquery_storage_write_api_examples.write_session import StreamType, WriteSession
+
+# Distinct fake rows the generated batches are cut from, the batches are replayed round robin
+DEFAULT_POOL_ROWS = 10_000
+
+
+class TokenBucket:
+    """
+    Schedules sends at ``rate`` tokens per second, after an initial burst of ``burst`` tokens.
+
+    The schedule is open-loop: it doesn't wait for the caller. A caller that falls behind gets due times in the past
+    and should send right away, the tokens it missed aren't dropped.
+    """
+
+    def __init__(self, rate: float, burst: float = 0, start: float | None = None):
+        if rate <= 0 or burst < 0:
+            raise ValueError("🛑 rate must be positive and burst not negative")
+        self.rate = rate
+        self.burst = burst
+        self._due = (time.perf_counter() if start is None else start) - burst / rate
+
+    def reserve(self, tokens: int) -> float:
+        """Take ``tokens`` and return when they are due, a ``time.perf_counter()`` timestamp"""
+        self._due += tokens / self.rate
+        return self._due
+
+
+class _Interval:
+    __slots__ = ("bytes", "latencies", "max_lag", "requests", "rows", "sent_rows", "service_latencies")
+
+    def __init__(self):
+        self.sent_rows = 0
+        self.rows = 0
+        self.bytes = 0
+        self.requests = 0
+        # Acknowledgement latency from the due time, and from the actual send
+        self.latencies: list[float] = []
+        self.service_latencies: list[float] = []
+        self.max_lag = 0.0
+
+
+class LoadGenerator:
+    """
+    Drives a stream type with sustained load and reports throughput and latency over time.
+
+    Every stream is written from its own thread and connection. With ``rows_per_second`` the requests follow an
+    open-loop TokenBucket schedule (the rate is split evenly over the streams): when the server slows down the
+    schedule doesn't, requests queue up behind the in-flight window and the latency shows it. Latency is measured
+    from when a request was due, not from when it could be sent, so a saturated writer can't hide its backlog
+    (coordinated omission). Without a rate the streams send as fast as the in-flight window allows.
+
+    The load runs for ``duration`` seconds or ``row_count`` rows, whichever ends first. Every ``report_interval``
+    seconds the rows sent and acknowledged, the ack latency percentiles, the lag behind the schedule and the
+    requests in flight are logged and kept for ``run``'s result. A lag that keeps growing means the target rate is
+    past the saturation point.
+
+    The rows are a pool of pre-encoded fake rows (or the rows of a RowCorpus) replayed round robin, so generating
+    rows doesn't limit the rate.
+    """
+
+    def __init__(
+        self,
+        table_path: str,
+        descriptor: Descriptor,
+        stream_type: StreamType = StreamType.DEFAULT,
+        rows_per_second: float | None = None,
+        duration: float | None = None,
+        row_count: int | None = None,
+        batch_size: int = 500,
+        streams: int = 1,
+        burst: int | None = None,
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+        report_interval: float = 1.0,
+        endpoint: str | None = None,
+        metrics: WriterMetrics | None = None,
+        compression: Compression = Compression.NONE,
+        corpus: RowCorpus | None = None,
+        pool_rows: int = DEFAULT_POOL_ROWS,
+        seed: int = 0,
+    ):
+        if duration is None and row_count is None:
+            raise ValueError("🛑 Set a duration, a row count or both")
+        if rows_per_second is not None and rows_per_second <= 0:
+            raise ValueError("🛑 rows_per_second must be positive")
+        if batch_size < 1 or streams < 1 or report_interval <= 0:
+            raise ValueError("🛑 batch_size, streams and report_interval must be positive")
+        self.logger = logging.getLogger(__name__)
+        self.table_path = table_path
+        self.descriptor = descriptor
+        self.stream_type = stream_type
+        self.rows_per_second = rows_per_second
+        self.duration = duration
+        self.row_count = row_count
+        self.batch_size = batch_size
+        self.streams = streams
+        # One request per stream can go out at once by default
+        self.burst = batch_size if burst is None else burst
+        self.max_in_flight = max_in_flight
+        self.report_interval = report_interval
+        self.endpoint = endpoint
+        self.metrics = metrics
+        self.compression = compression
+        self.corpus = corpus
+        self.pool_rows = pool_rows
+        self.seed = seed
+
+        self._lock = threading.Lock()
+        self._interval = _Interval()
+        self._latencies: list[float] = []
+        self._rows = 0
+        self._bytes = 0
+        self._lag = 0.0
+        self._sessions: list[WriteSession] = []
+        self._stop = threading.Event()
+
+    def run(self) -> dict:
+        """Run the load and return the report of every interval and the totals, ready to be dumped as JSON"""
+        batches = self._batches()
+        # Due time and bytes of the in-flight requests of every stream, acknowledgements arrive in send order
+        pending: list[deque[tuple[float, int]]] = [deque() for _ in range(self.streams)]
+        self._sessions = [
+            WriteSession(
+                create_write_client(self.endpoint, dedicated_connection=True, compression=self.compression),
+                self.table_path,
+                self.stream_type,
+                self.descriptor,
+                max_in_flight=self.max_in_flight,
+                on_ack=self._on_ack(stream_pending),
+                metrics=self.metrics,
+                compression=self.compression,
+            )
+            for stream_pending in pending
+        ]
+        rate = f"at {self.rows_per_second:,.0f} rows/s" if self.rows_per_second else "as fast as possible"
+        limits = []
+        if self.duration is not None:
+            limits.append(f"{self.duration:g} s")
+        if self.row_count is not None:
+            limits.append(f"{self.row_count:,} rows")
+        self.logger.info(
+            f"🚦 Writing {self.streams} {self.stream_type.value} stream(s) {rate} with "
+            f"{self.batch_size} rows per request for {' or '.join(limits)}"
+        )
+
+        errors: list[Exception] = []
+        start = time.perf_counter()
+        threads = [
+            threading.Thread(
+                target=self._write,
+                args=(
+                    session,
+                    pending[index],
+                    batches[index:] + batches[:index],
+                    self._stream_row_count(index),
+                    start,
+                    errors,
+                ),
+                name=f"loadgen-{index}",
+            )
+            for index, session in enumerate(self._sessions)
+        ]
+        for thread in threads:
+            thread.start()
+
+        intervals = []
+        deadline = start + self.duration if self.duration is not None else None
+        next_report = start + self.report_interval
+        try:
+            while alive := [thread for thread in threads if thread.is_alive()]:
+                wait_until = next_report if deadline is None else min(next_report, deadline)
+                alive[0].join(max(0.0, wait_until - time.perf_counter()))
+                now = time.perf_counter()
+                if deadline is not None and now >= deadline:
+                    self._stop.set()
+                if now >= next_report:
+                    intervals.append(self._report(now - start, self.report_interval))
+                    next_report += self.report_interval
+        except KeyboardInterrupt:
+            self.logger.info("⏹️ Stopping the load, waiting for the in-flight requests")
+            self._stop.set()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+        if self.stream_type is StreamType.PENDING:
+            WriteSession.commit(self._sessions[0].write_client, self.table_path, self._sessions)
+        elapsed = time.perf_counter() - start
+        # The rest of the last interval, until the last acknowledgement, too short to be worth a report of its own
+        partial = elapsed - (next_report - self.report_interval - start)
+        if partial >= self.report_interval / 10:
+            intervals.append(self._report(elapsed, partial))
+        else:
+            self._collect()
+
+        total = self._total(elapsed)
+        self.logger.info(
+            f"🏁 {total['rows']:,} rows in {elapsed:.1f} s: {total['rows_per_second']:,.0f} rows/s, "
+            f"{total['mb_per_second']} MB/s, ack p50 {total['p50_ms']} ms, p99 {total['p99_ms']} ms"
+        )
+        if self.rows_per_second and total["max_lag_ms"] > self.report_interval * 1000:
+            self.logger.warning(
+                f"⚠️ Fell {total['max_lag_ms']:,.0f} ms behind the schedule, "
+                f"{self.rows_per_second:,.0f} rows/s is past the saturation point"
+            )
+        return {
+            "settings": {
+                "table_path": self.table_path,
+                "stream_type": self.stream_type.value,
+                "target_rows_per_second": self.rows_per_second,
+                "duration": self.duration,
+                "row_count": self.row_count,
+                "batch_size": self.batch_size,
+                "streams": self.streams,
+                "burst": self.burst,
+                "max_in_flight": self.max_in_flight,
+                "endpoint": self.endpoint,
+                "compression": self.compression.value,
+                "corpus": str(self.corpus.path) if self.corpus is not None else None,
+            },
+            "intervals": intervals,
+            "total": total,
+        }
+
+    def _batches(self) -> list[tuple[list[bytes] | bytes | memoryview, int, int]]:
+        # (rows, row count, bytes) of every request in the pool
+        if self.corpus is not None:
+            return [
+                (batch.proto_rows, batch.row_count, len(batch.proto_rows))
+                for batch in self.corpus.batches(self.batch_size)
+            ]
+        encode = RowEncoder.for_descriptor(self.descriptor).encode
+        table_id = BigQueryWriteClient.parse_table_path(self.table_path)["table"]
+        rows = [
+            encode(row)
+            for row in BulkFakeDataGenerator(seed=self.seed).generate_fake(
+                table_id, max(self.pool_rows, self.batch_size)
+            )
+        ]
+        return [
+            (batch, len(batch), sum(serialized_row_size(row) for row in batch))
+            for batch in (
+                rows[start : start + self.batch_size] for start in range(0, len(rows), self.batch_size)
+            )
+        ]
+
+    def _stream_row_count(self, index: int) -> int | None:
+        if self.row_count is None:
+            return None
+        return self.row_count // self.streams + (1 if index < self.row_count % self.streams else 0)
+
+    def _on_ack(self, pending: deque[tuple[float, int]]) -> AckCallback:
+        def record_ack(append: PendingAppend, response: types.AppendRowsResponse):
+            due, byte_count = pending.popleft()
+            # Stamped by the sender when the response arrived, not when it got around to processing it
+            acked_at = append.acked_at or time.perf_counter()
+            with self._lock:
+                interval = self._interval
+                interval.rows += append.row_count
+                interval.bytes += byte_count
+                interval.requests += 1
+                interval.latencies.append(acked_at - due)
+                interval.service_latencies.append(acked_at - append.sent_at)
+
+        return record_ack
+
+    def _write(
+        self,
+        session: WriteSession,
+        pending: deque[tuple[float, int]],
+        batches: list[tuple[list[bytes] | bytes | memoryview, int, int]],
+        row_count: int | None,
+        start: float,
+        errors: list[Exception],
+    ):
+        bucket = (
+            TokenBucket(self.rows_per_second / self.streams, self.burst, start)
+            if self.rows_per_second
+            else None
+        )
+        sent_rows = 0
+        try:
+            for rows, batch_rows, byte_count in itertools.cycle(batches):
+                if self._stop.is_set() or (row_count is not None and sent_rows >= row_count):
+                    break
+                # The last batch is cut to the row count, a corpus batch can't be and may overshoot it
+                if row_count is not None and sent_rows + batch_rows > row_count and isinstance(rows, list):
+                    rows, batch_rows = rows[: row_count - sent_rows], row_count - sent_rows
+                    byte_count = sum(serialized_row_size(row) for row in rows)
+                if bucket is None:
+                    due = time.perf_counter()
+                else:
+                    due = bucket.reserve(batch_rows)
+                    if self._stop.wait(max(0.0, due - time.perf_counter())):
+                        break
+                lag = time.perf_counter() - due
+                pending.append((due, byte_count))
+                if isinstance(rows, list):
+                    session.append(rows)
+                else:
+                    session.append_proto_rows(rows)
+                sent_rows += batch_rows
+                with self._lock:
+                    self._interval.sent_rows += batch_rows
+                    self._interval.max_lag = max(self._interval.max_lag, lag)
+                    self._lag = max(self._lag, lag)
+            if self.stream_type is StreamType.BUFFERED:
+                session.flush()
+            session.close()
+        except Exception as e:  # noqa: BLE001
+            # Raised from run once every stream has stopped
+            self.logger.error(f"🚨 Load on '{session.stream_name}' failed: {e}")
+            errors.append(e)
+            self._stop.set()
+
+    def _collect(self) -> _Interval:
+        # Start a new interval, adding the finished one to the totals
+        with self._lock:
+            interval, self._interval = self._interval, _Interval()
+            self._latencies.extend(interval.latencies)
+            self._rows += interval.rows
+            self._bytes += interval.bytes
+        return interval
+
+    def _report(self, elapsed: float, seconds: float) -> dict:
+        interval = self._collect()
+        p50, p95, p99 = percentiles(interval.latencies, (50, 95, 99))
+        (service_p99,) = percentiles(interval.service_latencies, (99,))
+        report = {
+            "elapsed": round(elapsed, 3),
+            "sent_rows_per_second": round(interval.sent_rows / seconds, 1),
+            "rows_per_second": round(interval.rows / seconds, 1),
+            "mb_per_second": round(interval.bytes / seconds / 1_000_000, 3),
+            "requests": interval.requests,
+            "p50_ms": p50,
+            "p95_ms": p95,
+            "p99_ms": p99,
+            "service_p99_ms": service_p99,
+            "max_lag_ms": round(interval.max_lag * 1000, 3),
+            "in_flight": sum(session.sender.in_flight for session in self._sessions),
+        }
+        self.logger.info(
+            f"📊 {elapsed:7.1f} s  sent {report['sent_rows_per_second']:>11,.0f} rows/s  "
+            f"acked {report['rows_per_second']:>11,.0f} rows/s  {report['mb_per_second']:>8.2f} MB/s  "
+            f"p50 {p50 or 0:>8.2f} ms  p99 {p99 or 0:>8.2f} ms  lag {report['max_lag_ms']:>8.1f} ms  "
+            f"in flight {report['in_flight']}"
+        )
+        return report
+
+    def _total(self, seconds: float) -> dict:
+        p50, p95, p99 = percentiles(self._latencies, (50, 95, 99))
+        return {
+            "rows": self._rows,
+            "bytes": self._bytes,
+            "seconds": round(seconds, 6),
+            "rows_per_second": round(self._rows / seconds, 1) if seconds else 0.0,
+            "mb_per_second": round(self._bytes / seconds / 1_000_000, 3) if seconds else 0.0,
+            "p50_ms": p50,
+            "p95_ms": p95,
+            "p99_ms": p99,
+            "max_lag_ms": round(self._lag * 1000, 3),
+        }
@@ -0,0 +1,557 @@
+import functools
+import hashlib
+import logging
+import queue
+import random
+import threading
+import time
+import uuid
+from collections.abc import Callable
+from concurrent import futures
+from dataclasses import dataclass, field
+from typing import NoReturn, Self
+
+import grpc
+from google.cloud.bigquery_storage_v1 import types
+from google.protobuf import descriptor_pb2, descriptor_pool, message_factory
+from google.protobuf.any_pb2 import Any
+from google.protobuf.message import DecodeError, Message
+from google.protobuf.timestamp_pb2 import Timestamp
+from google.rpc import status_pb2
+
+from bigquery_storage_write_api_examples.request_batcher import request_row_count
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+_SERVICE_NAME = "google.cloud.bigquery.storage.v1.BigQueryWrite"
+_END_OF_RESPONSES = None
+
+
+@dataclass
+class _Stream:
+    name: str
+    table_path: str
+    type_: types.WriteStream.Type | None  # None for the _default stream
+    create_time: Timestamp
+    row_count: int = 0
+    flushed_offset: int = -1
+    finalized: bool = False
+    committed: bool = False
+    rows: list = field(default_factory=list)
+
+    @property
+    def visible_row_count(self) -> int:
+        """Number of rows of the stream a query of the table would return"""
+        match self.type_:
+            case None | types.WriteStream.Type.COMMITTED:
+                return self.row_count
+            case types.WriteStream.Type.PENDING:
+                return self.row_count if self.committed else 0
+            case types.WriteStream.Type.BUFFERED:
+                return self.flushed_offset + 1
+        return 0
+
+
+class _AppendError(Exception):
+    """An error answered in the AppendRowsResponse, the connection stays open"""
+
+    def __init__(self, code: grpc.StatusCode, message: str, storage_error_code=None, row_errors=()):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.storage_error_code = storage_error_code
+        self.row_errors = list(row_errors)
+
+
+class _CallAborted(Exception):
+    """An error that ends the AppendRows call"""
+
+    def __init__(self, code: grpc.StatusCode, message: str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+def _timestamp_now() -> Timestamp:
+    timestamp = Timestamp()
+    timestamp.GetCurrentTime()
+    return timestamp
+
+
+def _abort(context: grpc.ServicerContext, code: grpc.StatusCode, message: str) -> NoReturn:
+    """End the call with an error, ``context.abort`` raises but isn't typed as never returning"""
+    context.abort(code, message)
+    raise RuntimeError(f"🛑 Aborting the call didn't raise: {message}")
+
+
+def _table_path(stream_name: str) -> str:
+    return stream_name.split("/streams/")[0]
+
+
+class LocalWriteServer:
+    """
+    An in-process stand-in for the BigQuery Storage Write API, to measure the writers without a GCP project.
+
+    Implements CreateWriteStream, GetWriteStream, AppendRows, FlushRows, FinalizeWriteStream and
+    BatchCommitWriteStreams over gRPC, with the offset and stream type semantics of BigQuery: offsets must match
+    the end of the stream, ``_default`` streams don't take offsets, PENDING rows only become visible when committed
+    and BUFFERED rows when flushed. Rows are decoded with the ``writer_schema`` of the connection, protobuf rows into
+    messages and Arrow record batches into dictionaries.
+
+    The network and service are simulated per connection: every append is acknowledged ``latency_ms`` after it
+    was received, requests are processed at most at ``max_bytes_per_second`` and a fraction ``error_rate`` of the
+    appends is answered with ``error_code`` instead of being written.
+
+    Point the writers at it with ``write_api_endpoint`` in the Config:
+
+        with LocalWriteServer(latency_ms=20) as server:
+            config = Config(gcp_project_id="local", gcp_dataset_id="local", write_api_endpoint=server.endpoint)
+    """
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 0,
+        latency_ms: float = 0,
+        max_bytes_per_second: float | None = None,
+        error_rate: float = 0.0,
+        error_code: grpc.StatusCode = grpc.StatusCode.INTERNAL,
+        decode_rows: bool = True,
+        store_rows: bool = False,
+        seed: int | None = None,
+        max_workers: int = 64,
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.host = host
+        self.port = port
+        self.latency = latency_ms / 1000
+        self.max_bytes_per_second = max_bytes_per_second
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.decode_rows = decode_rows
+        self.store_rows = store_rows
+        self.max_workers = max_workers
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._streams: dict[str, _Stream] = {}
+        self._message_classes: dict[bytes, type[Message]] = {}
+        self._server: grpc.Server | None = None
+
+    def __enter__(self) -> Self:
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    @property
+    def endpoint(self) -> str:
+        """``host:port`` to use as ``write_api_endpoint``"""
+        return f"{self.host}:{self.port}"
+
+    def start(self):
+        # Every AppendRows call holds a worker thread for as long as it is open
+        self._server = grpc.server(
+            futures.ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="local-write-server"),
+            options=[("grpc.max_receive_message_length", -1), ("grpc.max_send_message_length", -1)],
+        )
+        self._server.add_generic_rpc_handlers([self._handler()])
+        self.port = self._server.add_insecure_port(f"{self.host}:{self.port}")
+        if not self.port:
+            raise RuntimeError(f"🛑 Couldn't bind the local write server to {self.host}")
+        self._server.start()
+        self.logger.info(f"🧪 Local write server listening on {self.endpoint}")
+
+    def stop(self, grace: float | None = 1):
+        if self._server is not None:
+            self._server.stop(grace).wait()
+            self._server = None
+
+    def wait_for_termination(self):
+        if self._server is not None:
+            self._server.wait_for_termination()
+
+    def visible_row_count(self, table_path: str) -> int:
+        """Number of rows of a table that a query would return"""
+        with self._lock:
+            return sum(
+                stream.visible_row_count
+                for stream in self._streams.values()
+                if stream.table_path == table_path
+            )
+
+    def visible_rows(self, table_path: str) -> list:
+        """Decoded rows of a table that a query would return, only available with ``store_rows``"""
+        if not self.store_rows:
+            raise RuntimeError("🛑 The server doesn't store rows, start it with store_rows=True")
+        with self._lock:
+            return [
+                row
+                for stream in self._streams.values()
+                if stream.table_path == table_path
+                for row in stream.rows[: stream.visible_row_count]
+            ]
+
+    def _handler(self) -> grpc.GenericRpcHandler:
+        def unary(method, request_type, response_type):
+            return grpc.unary_unary_rpc_method_handler(
+                method,
+                request_deserializer=request_type.deserialize,
+                response_serializer=response_type.serialize,
+            )
+
+        return grpc.method_handlers_generic_handler(
+            _SERVICE_NAME,
+            {
+                "CreateWriteStream": unary(
+                    self._create_write_stream, types.CreateWriteStreamRequest, types.WriteStream
+                ),
+                "GetWriteStream": unary(
+                    self._get_write_stream, types.GetWriteStreamRequest, types.WriteStream
+                ),
+                "AppendRows": grpc.stream_stream_rpc_method_handler(
+                    self._append_rows,
+                    request_deserializer=types.AppendRowsRequest.deserialize,
+                    response_serializer=types.AppendRowsResponse.serialize,
+                ),
+                "FlushRows": unary(self._flush_rows, types.FlushRowsRequest, types.FlushRowsResponse),
+                "FinalizeWriteStream": unary(
+                    self._finalize_write_stream,
+                    types.FinalizeWriteStreamRequest,
+                    types.FinalizeWriteStreamResponse,
+                ),
+                "BatchCommitWriteStreams": unary(
+                    self._batch_commit_write_streams,
+                    types.BatchCommitWriteStreamsRequest,
+                    types.BatchCommitWriteStreamsResponse,
+                ),
+            },
+        )
+
+    def _simulate_latency(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _create_write_stream(self, request: types.CreateWriteStreamRequest, context) -> types.WriteStream:
+        self._simulate_latency()
+        stream_type = request.write_stream.type_
+        if stream_type == types.WriteStream.Type.TYPE_UNSPECIFIED:
+            _abort(context, grpc.StatusCode.INVALID_ARGUMENT, "The write stream type must be specified")
+        stream = _Stream(
+            f"{request.parent}/streams/{uuid.uuid4().hex}", request.parent, stream_type, _timestamp_now()
+        )
+        with self._lock:
+            self._streams[stream.name] = stream
+        return self._write_stream(stream)
+
+    def _get_write_stream(self, request: types.GetWriteStreamRequest, context) -> types.WriteStream:
+        with self._lock:
+            stream = self._streams.get(request.name)
+        if stream is None:
+            _abort(context, grpc.StatusCode.NOT_FOUND, f"Stream {request.name} not found")
+        return self._write_stream(stream)
+
+    @staticmethod
+    def _write_stream(stream: _Stream) -> types.WriteStream:
+        return types.WriteStream(
+            name=stream.name,
+            type_=stream.type_ or types.WriteStream.Type.COMMITTED,
+            create_time=stream.create_time,
+        )
+
+    def _flush_rows(self, request: types.FlushRowsRequest, context) -> types.FlushRowsResponse:
+        self._simulate_latency()
+        with self._lock:
+            stream = self._streams.get(request.write_stream)
+            if stream is None:
+                _abort(context, grpc.StatusCode.NOT_FOUND, f"Stream {request.write_stream} not found")
+            if stream.type_ != types.WriteStream.Type.BUFFERED:
+                _abort(
+                    context,
+                    grpc.StatusCode.INVALID_ARGUMENT,
+                    "FlushRows is only supported on BUFFERED streams",
+                )
+            if request.offset >= stream.row_count:
+                _abort(
+                    context,
+                    grpc.StatusCode.OUT_OF_RANGE,
+                    f"Offset {request.offset} is beyond the end of the stream ({stream.row_count} rows)",
+                )
+            stream.flushed_offset = max(stream.flushed_offset, request.offset)
+        return types.FlushRowsResponse(offset=request.offset)
+
+    def _finalize_write_stream(
+        self, request: types.FinalizeWriteStreamRequest, context
+    ) -> types.FinalizeWriteStreamResponse:
+        self._simulate_latency()
+        with self._lock:
+            stream = self._streams.get(request.name)
+            if stream is None or stream.type_ is None:
+                _abort(context, grpc.StatusCode.NOT_FOUND, f"Stream {request.name} not found")
+            stream.finalized = True
+            return types.FinalizeWriteStreamResponse(row_count=stream.row_count)
+
+    def _batch_commit_write_streams(
+        self, request: types.BatchCommitWriteStreamsRequest, context
+    ) -> types.BatchCommitWriteStreamsResponse:
+        self._simulate_latency()
+        errors = []
+        with self._lock:
+            streams = []
+            for name in request.write_streams:
+                stream = self._streams.get(name)
+                code = types.StorageError.StorageErrorCode
+                if stream is None or stream.table_path != request.parent:
+                    errors.append((code.STREAM_NOT_FOUND, name, "Stream not found"))
+                elif stream.type_ != types.WriteStream.Type.PENDING:
+                    errors.append((code.INVALID_STREAM_TYPE, name, "Only PENDING streams can be committed"))
+                elif stream.committed:
+                    errors.append((code.STREAM_ALREADY_COMMITTED, name, "Stream is already committed"))
+                elif not stream.finalized:
+                    errors.append((code.INVALID_STREAM_STATE, name, "Stream is not finalized"))
+                else:
+                    streams.append(stream)
+            # The commit is atomic, no stream is committed when one of them can't be
+            if errors:
+                return types.BatchCommitWriteStreamsResponse(
+                    stream_errors=[
+                        types.StorageError(code=code, entity=name, error_message=message)
+                        for code, name, message in errors
+                    ]
+                )
+            for stream in streams:
+                stream.committed = True
+        return types.BatchCommitWriteStreamsResponse(commit_time=_timestamp_now())
+
+    def _append_rows(self, request_iterator, context):
+        # Requests are read and written on a separate thread, so that the responses can be held back until their
+        # simulated acknowledgement time without blocking the requests that are pipelined behind them
+        responses: queue.SimpleQueue = queue.SimpleQueue()
+        threading.Thread(
+            target=self._process_appends,
+            args=(request_iterator, responses),
+            name="local-append-rows",
+            daemon=True,
+        ).start()
+        while (item := responses.get()) is not _END_OF_RESPONSES:
+            if isinstance(item, _CallAborted):
+                _abort(context, item.code, item.message)
+            acknowledge_at, response = item
+            delay = acknowledge_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            yield response
+
+    def _process_appends(self, request_iterator, responses: queue.SimpleQueue):
+        stream_name: str | None = None
+        # Decodes the rows of a request with the writer schema of the connection, protobuf or Arrow
+        decode: Callable[[types.AppendRowsRequest], list] | None = None
+        # When the connection is done processing the previous request, for the bandwidth limit
+        busy_until = time.monotonic()
+        try:
+            for request in request_iterator:
+                received_at = time.monotonic()
+                if request.write_stream:
+                    stream_name = request.write_stream
+                elif stream_name is None:
+                    raise _CallAborted(
+                        grpc.StatusCode.INVALID_ARGUMENT, "The first request must name the write stream"
+                    )
+                if request._pb.HasField("arrow_rows"):
+                    arrow_data = request._pb.arrow_rows
+                    if arrow_data.HasField("writer_schema"):
+                        decode = functools.partial(
+                            self._decode_arrow_rows,
+                            self._arrow_schema(arrow_data.writer_schema.serialized_schema),
+                        )
+                else:
+                    proto_data = request._pb.proto_rows
+                    if proto_data.HasField("writer_schema"):
+                        decode = functools.partial(
+                            self._decode_proto_rows,
+                            self._message_class(proto_data.writer_schema.proto_descriptor),
+                        )
+                if decode is None:
+                    raise _CallAborted(
+                        grpc.StatusCode.INVALID_ARGUMENT, "The first request must contain the writer schema"
+                    )
+
+                response = self._append(request, stream_name, decode)
+
+                if self.max_bytes_per_second:
+                    busy_until = (
+                        max(busy_until, received_at) + request._pb.ByteSize() / self.max_bytes_per_second
+                    )
+                    acknowledge_at = busy_until + self.latency
+                else:
+                    acknowledge_at = received_at + self.latency
+                responses.put((acknowledge_at, response))
+        except _CallAborted as e:
+            responses.put(e)
+        except Exception as e:  # noqa: BLE001
+            # The client cancelled or closed the call
+            self.logger.debug(f"AppendRows call ended: {e}")
+        finally:
+            responses.put(_END_OF_RESPONSES)
+
+    def _append(
+        self,
+        request: types.AppendRowsRequest,
+        stream_name: str,
+        decode: Callable[[types.AppendRowsRequest], list],
+    ):
+        row_count = request_row_count(request)
+        offset = request._pb.offset.value if request._pb.HasField("offset") else None
+        response = types.AppendRowsResponse(write_stream=stream_name)
+        try:
+            if self.error_rate and self._random.random() < self.error_rate:
+                raise _AppendError(self.error_code, "Injected error")
+            decoded = decode(request) if self.decode_rows or self.store_rows else None
+            with self._lock:
+                stream = self._stream(stream_name)
+                start = self._check_offset(stream, offset)
+                stream.row_count += row_count
+                if self.store_rows and decoded is not None:
+                    stream.rows.extend(decoded)
+        except _AppendError as e:
+            error = status_pb2.Status(code=e.code.value[0], message=e.message)
+            if e.storage_error_code is not None:
+                error.details.append(self._storage_error_detail(e, stream_name))
+            response.error = error
+            if e.row_errors:
+                response.row_errors = e.row_errors
+            return response
+        if stream.type_ is not None:
+            response.append_result = types.AppendRowsResponse.AppendResult(offset=start)
+        else:
+            response.append_result = types.AppendRowsResponse.AppendResult()
+        return response
+
+    def _stream(self, stream_name: str) -> _Stream:
+        stream = self._streams.get(stream_name)
+        if stream is None and stream_name.endswith("/streams/_default"):
+            # Every table has a default stream, it doesn't need to be created
+            stream = _Stream(stream_name, _table_path(stream_name), None, _timestamp_now())
+            self._streams[stream_name] = stream
+        if stream is None:
+            raise _AppendError(
+                grpc.StatusCode.NOT_FOUND,
+                f"Stream {stream_name} not found",
+                types.StorageError.StorageErrorCode.STREAM_NOT_FOUND,
+            )
+        if stream.finalized:
+            raise _AppendError(
+                grpc.StatusCode.INVALID_ARGUMENT,
+                f"Stream {stream_name} is finalized",
+                types.StorageError.StorageErrorCode.STREAM_FINALIZED,
+            )
+        return stream
+
+    @staticmethod
+    def _check_offset(stream: _Stream, offset: int | None) -> int:
+        if offset is None:
+            return stream.row_count
+        if stream.type_ is None:
+            raise _AppendError(grpc.StatusCode.INVALID_ARGUMENT, "The default stream doesn't support offsets")
+        if offset < stream.row_count:
+            raise _AppendError(
+                grpc.StatusCode.ALREADY_EXISTS,
+                f"Offset {offset} already exists, the stream has {stream.row_count} rows",
+                types.StorageError.StorageErrorCode.OFFSET_ALREADY_EXISTS,
+            )
+        if offset > stream.row_count:
+            raise _AppendError(
+                grpc.StatusCode.OUT_OF_RANGE,
+                f"Offset {offset} is beyond the end of the stream ({stream.row_count} rows)",
+                types.StorageError.StorageErrorCode.OFFSET_OUT_OF_RANGE,
+            )
+        return offset
+
+    @staticmethod
+    def _storage_error_detail(error: _AppendError, stream_name: str) -> Any:
+        detail = Any()
+        detail.Pack(
+            types.StorageError.pb(
+                types.StorageError(
+                    code=error.storage_error_code, entity=stream_name, error_message=error.message
+                )
+            )
+        )
+        return detail
+
+    @staticmethod
+    def _decode_proto_rows(message_class: type[Message], request: types.AppendRowsRequest) -> list:
+        rows = request._pb.proto_rows.rows.serialized_rows
+        decoded = []
+        row_errors = []
+        for index, row in enumerate(rows):
+            try:
+                decoded.append(message_class.FromString(row))
+            except DecodeError as e:
+                row_errors.append(
+                    types.RowError(
+                        index=index,
+                        code=types.RowError.RowErrorCode.FIELDS_ERROR,
+                        message=f"Invalid row: {e}",
+                    )
+                )
+        if row_errors:
+            # A request with invalid rows is rejected as a whole
+            raise _AppendError(
+                grpc.StatusCode.INVALID_ARGUMENT, f"{len(row_errors)} rows are invalid", row_errors=row_errors
+            )
+        return decoded
+
+    @staticmethod
+    def _decode_arrow_rows(schema, request: types.AppendRowsRequest) -> list:
+        """Rows of the record batch as dictionaries"""
+        arrow_rows = request._pb.arrow_rows.rows
+        try:
+            record_batch = pa.ipc.read_record_batch(pa.py_buffer(arrow_rows.serialized_record_batch), schema)
+        except (pa.ArrowInvalid, OSError) as e:
+            raise _AppendError(grpc.StatusCode.INVALID_ARGUMENT, f"Invalid record batch: {e}")
+        if record_batch.num_rows != arrow_rows.row_count:
+            raise _AppendError(
+                grpc.StatusCode.INVALID_ARGUMENT,
+                f"The record batch has {record_batch.num_rows} rows, the request says {arrow_rows.row_count}",
+            )
+        return record_batch.to_pylist()
+
+    @staticmethod
+    def _arrow_schema(serialized_schema: bytes):
+        if pa is None:
+            raise _CallAborted(
+                grpc.StatusCode.UNIMPLEMENTED, "Arrow appends need pyarrow on the local server"
+            )
+        return pa.ipc.read_schema(pa.py_buffer(serialized_schema))
+
+    def _message_class(self, proto_descriptor: descriptor_pb2.DescriptorProto) -> type[Message]:
+        """Build (once per schema) a message class from the self-contained descriptor of a writer schema"""
+        serialized = proto_descriptor.SerializeToString()
+        key = hashlib.sha256(serialized).digest()
+        # AppendRows calls are served from several gRPC worker threads
+        with self._lock:
+            message_class = self._message_classes.get(key)
+        if message_class is None:
+            file_proto = descriptor_pb2.FileDescriptorProto(name=f"writer_schema_{key.hex()[:16]}.proto")
+            file_proto.message_type.add().ParseFromString(serialized)
+            # Nested types are referenced with their full name, which includes the package of the original file
+            for field_ in file_proto.message_type[0].field:
+                prefix, _, _ = field_.type_name.lstrip(".").partition(f"{file_proto.message_type[0].name}.")
+                if field_.type_name and prefix:
+                    file_proto.package = prefix.rstrip(".")
+                    break
+            pool = descriptor_pool.DescriptorPool()
+            pool.Add(file_proto)
+            descriptor = pool.FindMessageTypeByName(
+                ".".join(filter(None, [file_proto.package, file_proto.message_type[0].name]))
+            )
+            message_class = message_factory.GetMessageClass(descriptor)
+            with self._lock:
+                # Another thread may have built the class of the same schema meanwhile, the first one is kept
+                message_class = self._message_classes.setdefault(key, message_class)
+        return message_class
@@ -0,0 +1,406 @@
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Protocol, Self
+
+from bigquery_storage_write_api_examples import Config
+
+# Upper bounds of the ack latency histogram buckets in seconds, from a fast regional append to a stalled one
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class StreamMetrics(Protocol):
+    """Records the appends of one write stream, called by the sender for every request
+
+    ``sent`` gets the serialized size of a request and its size on the wire, smaller on a compressed channel.
+    ``flushed`` and ``visible`` are called by the BackgroundFlusher of a BUFFERED stream, for every flush and for
+    every append it made visible, with the seconds from sending the append to its rows being visible.
+    """
+
+    def sent(self, row_count: int, byte_count: int, wire_byte_count: int): ...
+
+    def acked(self, row_count: int, latency: float): ...
+
+    def failed(self, row_count: int, row_errors: int): ...
+
+    def retried(self, row_count: int): ...
+
+    def flushed(self, row_count: int): ...
+
+    def visible(self, latency: float): ...
+
+
+class WriterMetrics(Protocol):
+    """A metrics backend, hands out the recorder of every stream a writer opens"""
+
+    def stream(self, table_path: str, stream_name: str) -> StreamMetrics: ...
+
+
+def _stream_labels(table_path: str, stream_name: str) -> dict[str, str]:
+    # The stream id is enough next to the table, the full stream name repeats the table path
+    return {"table": table_path, "stream": stream_name.rsplit("/", 1)[-1]}
+
+
+class _Histogram:
+    __slots__ = ("bounds", "count", "counts", "sum")
+
+    def __init__(self, bounds: tuple[float, ...]):
+        self.bounds = bounds
+        # One count per bucket plus the +Inf bucket, not cumulative until rendered
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _StreamStats:
+    """In-memory StreamMetrics, plain attribute updates by the one thread that sends on the stream (and the one
+    that flushes it)"""
+
+    __slots__ = (
+        "bytes_sent",
+        "flushes",
+        "labels",
+        "latency",
+        "requests_acked",
+        "requests_failed",
+        "requests_sent",
+        "retries",
+        "row_errors",
+        "rows_acked",
+        "rows_failed",
+        "rows_flushed",
+        "rows_sent",
+        "visibility",
+        "wire_bytes_sent",
+    )
+
+    def __init__(self, labels: dict[str, str], latency_buckets: tuple[float, ...]):
+        self.labels = labels
+        self.requests_sent = 0
+        self.rows_sent = 0
+        self.bytes_sent = 0
+        self.wire_bytes_sent = 0
+        self.requests_acked = 0
+        self.rows_acked = 0
+        self.requests_failed = 0
+        self.rows_failed = 0
+        self.row_errors = 0
+        self.retries = 0
+        self.flushes = 0
+        self.rows_flushed = 0
+        self.latency = _Histogram(latency_buckets)
+        self.visibility = _Histogram(latency_buckets)
+
+    @property
+    def in_flight(self) -> int:
+        return self.requests_sent - self.requests_acked - self.requests_failed
+
+    def sent(self, row_count: int, byte_count: int, wire_byte_count: int):
+        self.requests_sent += 1
+        self.rows_sent += row_count
+        self.bytes_sent += byte_count
+        self.wire_bytes_sent += wire_byte_count
+
+    def acked(self, row_count: int, latency: float):
+        self.requests_acked += 1
+        self.rows_acked += row_count
+        self.latency.observe(latency)
+
+    def failed(self, row_count: int, row_errors: int):
+        self.requests_failed += 1
+        self.rows_failed += row_count
+        self.row_errors += row_errors
+
+    def retried(self, row_count: int):
+        self.retries += 1
+
+    def flushed(self, row_count: int):
+        self.flushes += 1
+        self.rows_flushed += row_count
+
+    def visible(self, latency: float):
+        self.visibility.observe(latency)
+
+
+# Name, type, help and value of every series of a stream in the Prometheus exposition
+_PROMETHEUS_SERIES = (
+    ("requests_sent_total", "counter", "AppendRows requests sent", lambda s: s.requests_sent),
+    ("rows_sent_total", "counter", "Rows sent", lambda s: s.rows_sent),
+    ("bytes_sent_total", "counter", "Serialized bytes of the requests sent", lambda s: s.bytes_sent),
+    (
+        "wire_bytes_sent_total",
+        "counter",
+        "Bytes of the requests sent after channel compression, estimated from samples",
+        lambda s: s.wire_bytes_sent,
+    ),
+    ("rows_acked_total", "counter", "Rows acknowledged", lambda s: s.rows_acked),
+    ("requests_in_flight", "gauge", "Requests waiting for an acknowledgement", lambda s: s.in_flight),
+    ("requests_failed_total", "counter", "Requests that failed", lambda s: s.requests_failed),
+    ("row_errors_total", "counter", "Row errors of failed requests", lambda s: s.row_errors),
+    ("retries_total", "counter", "Appends already written by an earlier attempt", lambda s: s.retries),
+    ("flushes_total", "counter", "FlushRows calls of a BUFFERED stream", lambda s: s.flushes),
+    ("rows_flushed_total", "counter", "Rows made visible by flushing", lambda s: s.rows_flushed),
+)
+
+# Name, help and values of every histogram of a stream
+_PROMETHEUS_HISTOGRAMS = (
+    ("ack_latency_seconds", "Seconds from sending a request to its acknowledgement", lambda s: s.latency),
+    (
+        "visibility_latency_seconds",
+        "Seconds from sending a request to its rows being flushed",
+        lambda s: s.visibility,
+    ),
+)
+
+
+class MetricsRegistry:
+    """
+    Keeps the metrics of every stream in memory and renders them in the Prometheus text format.
+
+    Recording is a handful of integer additions on the stream's own object, without locks or label lookups, so it
+    can stay on in the hot path. Values are read when scraped, see ``PrometheusEndpoint``.
+    """
+
+    def __init__(
+        self, prefix: str = "bigquery_write", latency_buckets: tuple[float, ...] = DEFAULT_LATENCY_BUCKETS
+    ):
+        self.prefix = prefix
+        self.latency_buckets = tuple(sorted(latency_buckets))
+        self._streams: dict[tuple[str, str], _StreamStats] = {}
+        self._lock = threading.Lock()
+
+    def stream(self, table_path: str, stream_name: str) -> _StreamStats:
+        with self._lock:
+            key = (table_path, stream_name)
+            stats = self._streams.get(key)
+            if stats is None:
+                stats = _StreamStats(_stream_labels(table_path, stream_name), self.latency_buckets)
+                self._streams[key] = stats
+            return stats
+
+    def snapshot(self) -> list[dict]:
+        """Current values of every stream, e.g. to log or dump as JSON"""
+        with self._lock:
+            streams = list(self._streams.values())
+        return [
+            {
+                **stats.labels,
+                **{name.removesuffix("_total"): value(stats) for name, _, _, value in _PROMETHEUS_SERIES},
+                **{
+                    f"{name}_{field}": round(getattr(histogram(stats), field), 6)
+                    for name, _, histogram in _PROMETHEUS_HISTOGRAMS
+                    for field in ("sum", "count")
+                },
+            }
+            for stats in streams
+        ]
+
+    def render_prometheus(self) -> str:
+        """Every series in the Prometheus text exposition format"""
+        with self._lock:
+            streams = list(self._streams.values())
+        lines = []
+        for name, metric_type, help_text, value in _PROMETHEUS_SERIES:
+            lines.append(f"# HELP {self.prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {self.prefix}_{name} {metric_type}")
+            for stats in streams:
+                lines.append(f"{self.prefix}_{name}{{{_format_labels(stats.labels)}}} {value(stats)}")
+
+        for name, help_text, histogram in _PROMETHEUS_HISTOGRAMS:
+            name = f"{self.prefix}_{name}"
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for stats in streams:
+                labels = _format_labels(stats.labels)
+                values = histogram(stats)
+                cumulative = 0
+                for bound, count in zip((*self.latency_buckets, float("inf")), values.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+                lines.append(f"{name}_sum{{{labels}}} {values.sum}")
+                lines.append(f"{name}_count{{{labels}}} {values.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    return ",".join(
+        f'{key}="{value.replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for key, value in labels.items()
+    )
+
+
+class PrometheusEndpoint:
+    """
+    Serves the metrics of a MetricsRegistry at ``/metrics`` for Prometheus to scrape, from a daemon thread.
+
+    Use it as a context manager or call ``start`` and ``stop``. It only listens on the loopback interface unless
+    ``host`` says otherwise, e.g. ``"0.0.0.0"`` for a scraper on another host.
+    """
+
+    def __init__(self, registry: MetricsRegistry, port: int = 9464, host: str = "127.0.0.1"):
+        self.logger = logging.getLogger(__name__)
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server: ThreadingHTTPServer | None = None
+        self._thread: threading.Thread | None = None
+
+    def __enter__(self) -> Self:
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", _PROMETHEUS_CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="prometheus-endpoint", daemon=True
+        )
+        self._thread.start()
+        self.logger.info(f"📈 Prometheus metrics at http://{self.host}:{self.port}/metrics")
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+
+class _OpenTelemetryStream:
+    __slots__ = ("_attributes", "_instruments")
+
+    def __init__(self, instruments: "OpenTelemetryMetrics", attributes: dict[str, str]):
+        self._instruments = instruments
+        self._attributes = attributes
+
+    def sent(self, row_count: int, byte_count: int, wire_byte_count: int):
+        instruments, attributes = self._instruments, self._attributes
+        instruments.requests_sent.add(1, attributes)
+        instruments.rows_sent.add(row_count, attributes)
+        instruments.bytes_sent.add(byte_count, attributes)
+        instruments.wire_bytes_sent.add(wire_byte_count, attributes)
+        instruments.in_flight.add(1, attributes)
+
+    def acked(self, row_count: int, latency: float):
+        instruments, attributes = self._instruments, self._attributes
+        instruments.rows_acked.add(row_count, attributes)
+        instruments.in_flight.add(-1, attributes)
+        instruments.ack_latency.record(latency, attributes)
+
+    def failed(self, row_count: int, row_errors: int):
+        instruments, attributes = self._instruments, self._attributes
+        instruments.requests_failed.add(1, attributes)
+        instruments.row_errors.add(row_errors, attributes)
+        instruments.in_flight.add(-1, attributes)
+
+    def retried(self, row_count: int):
+        self._instruments.retries.add(1, self._attributes)
+
+    def flushed(self, row_count: int):
+        self._instruments.flushes.add(1, self._attributes)
+        self._instruments.rows_flushed.add(row_count, self._attributes)
+
+    def visible(self, latency: float):
+        self._instruments.visibility_latency.record(latency, self._attributes)
+
+
+class OpenTelemetryMetrics:
+    """
+    Records the same metrics with OpenTelemetry instruments, exported by whatever the MeterProvider is set up with.
+
+    Only the OpenTelemetry API is needed here. Without an SDK MeterProvider (e.g. from ``opentelemetry-instrument``
+    or set up by the application with an OTLP or Prometheus reader) the instruments are no-ops.
+    """
+
+    def __init__(self, meter=None, prefix: str = "bigquery_write"):
+        if meter is None:
+            try:
+                from opentelemetry import metrics
+            except ImportError as e:
+                raise ImportError(
+                    "🛑 OpenTelemetry metrics require opentelemetry-api, install the 'otel' extra of this package"
+                ) from e
+            meter = metrics.get_meter("bigquery_storage_write_api_examples")
+        self.requests_sent = meter.create_counter(
+            f"{prefix}.requests_sent", description="AppendRows requests sent"
+        )
+        self.rows_sent = meter.create_counter(f"{prefix}.rows_sent", description="Rows sent")
+        self.bytes_sent = meter.create_counter(f"{prefix}.bytes_sent", unit="By", description="Bytes sent")
+        self.wire_bytes_sent = meter.create_counter(
+            f"{prefix}.wire_bytes_sent", unit="By", description="Bytes sent after channel compression"
+        )
+        self.rows_acked = meter.create_counter(f"{prefix}.rows_acked", description="Rows acknowledged")
+        self.in_flight = meter.create_up_down_counter(
+            f"{prefix}.requests_in_flight", description="Requests waiting for an acknowledgement"
+        )
+        self.ack_latency = meter.create_histogram(
+            f"{prefix}.ack_latency",
+            unit="s",
+            description="Seconds from sending a request to its acknowledgement",
+        )
+        self.requests_failed = meter.create_counter(
+            f"{prefix}.requests_failed", description="Requests that failed"
+        )
+        self.row_errors = meter.create_counter(
+            f"{prefix}.row_errors", description="Row errors of failed requests"
+        )
+        self.retries = meter.create_counter(
+            f"{prefix}.retries", description="Appends that were already written by an earlier attempt"
+        )
+        self.flushes = meter.create_counter(
+            f"{prefix}.flushes", description="FlushRows calls of a BUFFERED stream"
+        )
+        self.rows_flushed = meter.create_counter(
+            f"{prefix}.rows_flushed", description="Rows made visible by flushing"
+        )
+        self.visibility_latency = meter.create_histogram(
+            f"{prefix}.visibility_latency",
+            unit="s",
+            description="Seconds from sending a request to its rows being flushed",
+        )
+
+    def stream(self, table_path: str, stream_name: str) -> _OpenTelemetryStream:
+        return _OpenTelemetryStream(self, _stream_labels(table_path, stream_name))
+
+
+# Shared by every writer of the process, like the default registry of the Prometheus client
+REGISTRY = MetricsRegistry()
+
+
+def configured_metrics(config: Config) -> WriterMetrics | None:
+    """Return the metrics backend set by ``metrics`` in the config, None when metrics are off"""
+    match config.metrics:
+        case "prometheus":
+            return REGISTRY
+        case "otel":
+            return OpenTelemetryMetrics()
+    return None
@@ -0,0 +1,274 @@
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import random
+import traceback
+from collections.abc import Iterator
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+from typing import Protocol, Self
+
+from google.cloud.bigquery_storage_v1 import types
+
+from bigquery_storage_write_api_examples.fake_data_generator import (
+    BulkFakeDataGenerator,
+    FakeDataGenerator,
+)
+from bigquery_storage_write_api_examples.request_batcher import (
+    DEFAULT_MAX_ROWS_PER_REQUEST,
+    build_request_from_proto_rows,
+    frame_row,
+)
+from bigquery_storage_write_api_examples.row_encoder import RowEncoder
+from bigquery_storage_write_api_examples.table_registry import message_class
+
+# One slot holds one request, smaller than the request limit so the ring stays small with many processes
+DEFAULT_SLOT_BYTES = 2 * 1024 * 1024
+
+# Messages on the filled slots queue
+_SLOT_FILLED = "filled"
+_WORKER_DONE = "done"
+_WORKER_FAILED = "failed"
+
+# Seconds the parent waits for a filled slot before it checks whether the workers are still alive
+_WORKER_CHECK_INTERVAL = 1.0
+
+
+class RowSource(Protocol):
+    """A picklable source of rows that can be split over worker processes"""
+
+    def rows(self, worker_index: int, worker_count: int) -> Iterator[dict]: ...
+
+
+class FakeRowSource:
+    """Fake rows of one entity from the FakeDataGenerator, split evenly over the workers
+
+    Set ``bulk`` to generate them column-wise with the BulkFakeDataGenerator, which is much faster.
+    """
+
+    def __init__(
+        self,
+        entity: str,
+        row_count: int,
+        seed: int | None = None,
+        chunk_size: int = 1_000,
+        bulk: bool = False,
+    ):
+        self.entity = entity
+        self.row_count = row_count
+        self.seed = random.randrange(2**32) if seed is None else seed
+        self.chunk_size = chunk_size
+        self.bulk = bulk
+
+    def rows(self, worker_index: int, worker_count: int) -> Iterator[dict]:
+        row_count = self.row_count // worker_count + (worker_index < self.row_count % worker_count)
+        generator_class = BulkFakeDataGenerator if self.bulk else FakeDataGenerator
+        faker = generator_class(seed=self.seed + worker_index)
+        return faker.iter_fake(self.entity, row_count, self.chunk_size)
+
+
+class NdjsonRowSource:
+    """Rows of a newline delimited JSON file, every worker parses its own byte range of the file"""
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+
+    def rows(self, worker_index: int, worker_count: int) -> Iterator[dict]:
+        size = self.path.stat().st_size
+        start = size * worker_index // worker_count
+        end = size * (worker_index + 1) // worker_count
+        with self.path.open("rb") as f:
+            if start > 0:
+                # A line belongs to the worker whose range contains its first byte, skip the line in progress
+                f.seek(start - 1)
+                f.readline()
+            while f.tell() < end:
+                line = f.readline()
+                if not line:
+                    break
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _buffer(shared_memory: SharedMemory) -> memoryview:
+    buffer = shared_memory.buf
+    if buffer is None:
+        raise RuntimeError(f"🛑 Shared memory '{shared_memory.name}' is closed")
+    return buffer
+
+
+def _encode_rows(
+    source: RowSource,
+    table_id: str,
+    worker_index: int,
+    worker_count: int,
+    shared_memory_name: str,
+    slot_bytes: int,
+    max_rows_per_slot: int,
+    free_slots: multiprocessing.Queue,
+    filled_slots: multiprocessing.Queue,
+):
+    """Worker process: encode rows from the source into free slots of the shared memory ring"""
+    shared_memory = SharedMemory(name=shared_memory_name)
+    buffer = _buffer(shared_memory)
+    try:
+        encode = RowEncoder.for_message(message_class(table_id)).encode
+        slot = None
+        position = slot_end = rows = 0
+        for row in source.rows(worker_index, worker_count):
+            framed = frame_row(encode(row))
+            if len(framed) > slot_bytes:
+                raise ValueError(f"🛑 Row of {len(framed)} bytes doesn't fit in a slot of {slot_bytes} bytes")
+            if slot is not None and (position + len(framed) > slot_end or rows >= max_rows_per_slot):
+                filled_slots.put((_SLOT_FILLED, slot, position - (slot_end - slot_bytes), rows))
+                slot = None
+            if slot is None:
+                slot = free_slots.get()
+                position, slot_end, rows = slot * slot_bytes, (slot + 1) * slot_bytes, 0
+            buffer[position : position + len(framed)] = framed
+            position += len(framed)
+            rows += 1
+        if slot is not None:
+            filled_slots.put((_SLOT_FILLED, slot, position - (slot_end - slot_bytes), rows))
+        filled_slots.put((_WORKER_DONE, worker_index, None, None))
+    except Exception:  # noqa: BLE001
+        # Any failure of the worker is reported to the parent with its traceback, which raises it
+        filled_slots.put((_WORKER_FAILED, worker_index, traceback.format_exc(), None))
+    finally:
+        del buffer
+        shared_memory.close()
+
+
+class SharedMemoryEncoderPool:
+    """
+    Builds and serializes rows in a pool of worker processes, outside of the GIL of the sending process.
+
+    Workers take rows from a RowSource (e.g. FakeRowSource or NdjsonRowSource), encode them with the RowEncoder and
+    write them, length-prefixed in the ProtoRows wire format, into free slots of a shared memory ring buffer.
+    A full slot is one request: the parent only turns the slot into ProtoRows with a single parse and hands the
+    slot back, so the encoding throughput scales with the number of processes while the parent keeps sending.
+
+    Use it as a context manager:
+
+        with SharedMemoryEncoderPool(FakeRowSource("students", 1_000_000), "students") as pool:
+            for request in pool.requests():
+                sender.send(request)
+    """
+
+    def __init__(
+        self,
+        source: RowSource,
+        table_id: str,
+        processes: int | None = None,
+        slot_bytes: int = DEFAULT_SLOT_BYTES,
+        max_rows_per_slot: int = DEFAULT_MAX_ROWS_PER_REQUEST,
+        slots_per_process: int = 2,
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.source = source
+        # Workers look the message class up by table, generated message classes can't be pickled
+        self.table_id = table_id
+        # Leave a core for the process that sends the requests
+        self.processes = processes or max((os.cpu_count() or 2) - 1, 1)
+        self.slot_bytes = slot_bytes
+        self.max_rows_per_slot = max_rows_per_slot
+        self.slot_count = self.processes * slots_per_process
+
+        self._shared_memory: SharedMemory | None = None
+        self._workers: list[multiprocessing.Process] = []
+
+    def __enter__(self) -> Self:
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def start(self):
+        # Spawn instead of fork, forking a process that already has gRPC channels open is unsafe
+        context = multiprocessing.get_context("spawn")
+        self._shared_memory = SharedMemory(create=True, size=self.slot_count * self.slot_bytes)
+        self._free_slots = context.Queue()
+        self._filled_slots = context.Queue()
+        for slot in range(self.slot_count):
+            self._free_slots.put(slot)
+
+        self._workers = [
+            context.Process(
+                target=_encode_rows,
+                args=(
+                    self.source,
+                    self.table_id,
+                    worker_index,
+                    self.processes,
+                    self._shared_memory.name,
+                    self.slot_bytes,
+                    self.max_rows_per_slot,
+                    self._free_slots,
+                    self._filled_slots,
+                ),
+                name=f"row-encoder-{worker_index}",
+                daemon=True,
+            )
+            for worker_index in range(self.processes)
+        ]
+        for worker in self._workers:
+            worker.start()
+        self.logger.debug(f"🏭 Started {self.processes} encoder processes with {self.slot_count} slots")
+
+    def requests(self, offset: int | None = None) -> Iterator[types.AppendRowsRequest]:
+        """Yield an AppendRowsRequest per filled slot until every worker is done
+
+        Args:
+            offset (int | None): Offset of the first row, ``None`` for streams without offsets
+
+        Raises:
+            RuntimeError: If a worker failed, or died without reporting it (killed, crashed, out of memory)
+        """
+        if self._shared_memory is None:
+            raise RuntimeError("🛑 The pool is not started")
+        buffer = _buffer(self._shared_memory)
+        done: set[int] = set()
+        while len(done) < self.processes:
+            try:
+                kind, slot, size, rows = self._filled_slots.get(timeout=_WORKER_CHECK_INTERVAL)
+            except queue.Empty:
+                self._check_workers(done)
+                continue
+            if kind == _WORKER_DONE:
+                done.add(slot)
+                continue
+            if kind == _WORKER_FAILED:
+                raise RuntimeError(f"🛑 Encoder process {slot} failed:\n{size}")
+
+            start = slot * self.slot_bytes
+            request = build_request_from_proto_rows(buffer[start : start + size], offset)
+            # The request holds its own copy of the rows, so the slot can be reused right away
+            self._free_slots.put(slot)
+            if offset is not None:
+                offset += rows
+            yield request
+
+    def _check_workers(self, done: set[int]):
+        dead = [
+            (index, worker.exitcode)
+            for index, worker in enumerate(self._workers)
+            if index not in done and not worker.is_alive()
+        ]
+        # A worker that just exited may have sent its last messages after the wait timed out
+        if dead and self._filled_slots.empty():
+            details = ", ".join(f"{index} (exit code {exitcode})" for index, exitcode in dead)
+            raise RuntimeError(f"🛑 Encoder processes exited without finishing: {details}")
+
+    def close(self):
+        for worker in self._workers:
+            if worker.is_alive():
+                worker.terminate()
+            worker.join()
+        self._workers = []
+        if self._shared_memory is not None:
+            self._shared_memory.close()
+            self._shared_memory.unlink()
+            self._shared_memory = None
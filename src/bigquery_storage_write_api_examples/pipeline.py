@@ -0,0 +1,127 @@
+import logging
+import queue
+import threading
+from collections.abc import Callable, Iterable, Iterator
+
+from google.cloud.bigquery_storage_v1 import types
+
+from bigquery_storage_write_api_examples.append_sender import PendingAppend
+from bigquery_storage_write_api_examples.arrow_rows import ArrowRequestBatcher
+from bigquery_storage_write_api_examples.request_batcher import (
+    RequestBatcher,
+    request_row_count,
+)
+
+DEFAULT_MAX_BUFFERED_REQUESTS = 4
+
+_END_OF_ITEMS = object()
+
+
+class _Failure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def prefetch[T](items: Iterable[T], max_buffered: int, name: str = "prefetch") -> Iterator[T]:
+    """Iterate over ``items`` in a background thread, keeping at most ``max_buffered`` of them ready
+
+    The thread runs ahead of the consumer until the buffer is full, so producing the next items overlaps with
+    whatever the consumer does with the current one. Errors of the iterable are raised by the consumer. Closing the
+    returned iterator early stops the thread after the item it is producing.
+    """
+    if max_buffered < 1:
+        raise ValueError("🛑 max_buffered must be positive")
+    buffer: queue.Queue = queue.Queue(maxsize=max_buffered)
+    stopped = threading.Event()
+
+    def put(item) -> bool:
+        while not stopped.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put(item):
+                    return
+        except BaseException as e:  # noqa: BLE001
+            # Whatever ends the producer, KeyboardInterrupt included, is re-raised by the consumer
+            put(_Failure(e))
+            return
+        put(_END_OF_ITEMS)
+
+    producer = threading.Thread(target=produce, name=name, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is _END_OF_ITEMS:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stopped.set()
+        producer.join()
+
+
+class WritePipeline:
+    """
+    Streams rows to a write stream: source → encode → batch → send.
+
+    A background thread pulls rows from the source, encodes them and packs them into requests, while the calling
+    thread sends them. At most ``max_buffered_requests`` requests wait between the two, on top of the in-flight
+    window of the sender, so memory stays constant however many rows the source yields, and the first request is
+    sent as soon as it is full instead of after the whole load is generated.
+
+    The source can be any iterable, e.g. a generator:
+
+        pipeline = WritePipeline(batcher, sender.send)
+        pipeline.run(FakeDataGenerator().iter_fake("students", 100_000_000))
+        sender.drain()
+    """
+
+    def __init__(
+        self,
+        batcher: RequestBatcher | ArrowRequestBatcher,
+        send: Callable[[types.AppendRowsRequest], PendingAppend],
+        max_buffered_requests: int = DEFAULT_MAX_BUFFERED_REQUESTS,
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.batcher = batcher
+        self.send = send
+        self.max_buffered_requests = max_buffered_requests
+
+    def run(self, rows: Iterable[dict], offset: int | None = None) -> int:
+        """Encode, batch and send every row of the source
+
+        Args:
+            rows (Iterable[dict]): Row source, consumed lazily
+            offset (int | None): Offset of the first row, ``None`` for the default stream
+
+        Returns:
+            int: Number of rows sent, the caller drains the sender to wait for their acknowledgements
+        """
+        return self._send_all(self.batcher.requests(rows, offset))
+
+    def run_serialized(self, serialized_rows: Iterable[bytes], offset: int | None = None) -> int:
+        """Same as ``run`` but for rows that are already serialized protobuf messages"""
+        if isinstance(self.batcher, ArrowRequestBatcher):
+            raise ValueError(
+                "🛑 Serialized protobuf rows can't be sent as Arrow record batches, use a RequestBatcher"
+            )
+        return self._send_all(self.batcher.serialized_requests(serialized_rows, offset))
+
+    def _send_all(self, requests: Iterator[types.AppendRowsRequest]) -> int:
+        row_count = 0
+        for request_index, request in enumerate(
+            prefetch(requests, self.max_buffered_requests, name="write-pipeline")
+        ):
+            self.send(request)
+            row_count += request_row_count(request)
+            self.logger.debug(f"🚀 Sent request {request_index}, {row_count} rows so far")
+        return row_count
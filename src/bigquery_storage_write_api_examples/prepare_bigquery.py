@@ -1,11 +1,33 @@
 import json
 import logging
+import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from enum import Enum
 from pathlib import Path
 
+from google.api_core.exceptions import GoogleAPICallError
 from google.cloud import bigquery
 from google.cloud.exceptions import NotFound
 
 from bigquery_storage_write_api_examples import Config
+from bigquery_storage_write_api_examples.schema_descriptor import SCHEMAS_DIR, schema_hash
+
+STATE_CACHE_PATH = Path("./.cache/bigquery_state.json")
+DEFAULT_CONCURRENCY = 8
+
+
+class TableState(Enum):
+    # Same schema as in the state cache of the last run, no request was made
+    UNCHANGED = "unchanged"
+    # The table exists with the schema of misc/schemas
+    FOUND = "found"
+    CREATED = "created"
+    # The schema of the existing table was updated to misc/schemas (diff mode)
+    UPDATED = "updated"
+    # The table exists with another schema and was left as is (not in diff mode)
+    DIFFERS = "differs"
+    FAILED = "failed"
 
 
 class PrepareBigQueryService:
@@ -15,25 +37,86 @@ class PrepareBigQueryService:
     Performs the following setup:
         - Creates a new BigQuery dataset if one doesn't already exist
         - Creates all required tables using schema definitions from the 'misc/schemas' directory
+
+    Tables are checked and created concurrently on a pool of ``concurrency`` threads. The schema hash of every
+    table that is known to be in place is kept in a state cache (``.cache/bigquery_state.json``), tables whose
+    schema file didn't change since are skipped without any request, so does the dataset when no table changed.
+    Pass ``use_cache=False`` to check everything again, e.g. after tables were dropped by hand.
+
+    Existing tables with another schema than misc/schemas are only reported, in diff mode their schema is updated
+    (BigQuery accepts new NULLABLE or REPEATED columns and relaxed modes).
     """
 
-    def __init__(self, config: Config):
+    def __init__(
+        self,
+        config: Config,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        state_path: str | Path = STATE_CACHE_PATH,
+        schemas_dir: str | Path = SCHEMAS_DIR,
+    ):
+        if concurrency < 1:
+            raise ValueError("🛑 concurrency must be positive")
         self.config = config
+        self.concurrency = concurrency
+        self.state_path = Path(state_path)
+        self.schemas_dir = Path(schemas_dir)
         self.logger = logging.getLogger("bigquery_preparation")
         self.logger.setLevel(logging.INFO)
 
-    def prepare(self):
-        logging.info("Preparing BigQuery infrastructure...")
-        client = bigquery.Client(project=self.config.gcp_project_id)
+    def prepare(self, diff: bool = False, use_cache: bool = True) -> dict[str, TableState]:
+        """Create the dataset and the tables that are missing
 
-        dataset = self._create_dataset(client, self.config.gcp_dataset_id)
+        Args:
+            diff (bool): Update the schema of existing tables that differ from misc/schemas
+            use_cache (bool): Skip the tables whose schema is unchanged since the last run
 
-        schemas_dir = Path("./misc/schemas").resolve()
-        for schema in Path(schemas_dir).glob("*.json"):
+        Returns:
+            dict[str, TableState]: What was done for every table
+        """
+        self.logger.info("Preparing BigQuery infrastructure...")
+        dataset_key = f"{self.config.gcp_project_id}.{self.config.gcp_dataset_id}"
+        schemas = {}
+        for schema in sorted(self.schemas_dir.resolve().glob("*.json")):
             with schema.open("r") as f:
-                schema_data = json.load(f)
-                table_name = schema.stem
-                _table = self._create_table(client, dataset, table_name, schema_data)
+                schemas[schema.stem] = json.load(f)
+        hashes = {table_name: schema_hash(table_name, schema) for table_name, schema in schemas.items()}
+
+        state = self._read_state() if use_cache else {}
+        results = {
+            table_name: TableState.UNCHANGED
+            for table_name in schemas
+            if state.get(f"{dataset_key}.{table_name}") == hashes[table_name]
+        }
+        changed = {table_name: schema for table_name, schema in schemas.items() if table_name not in results}
+        if not changed:
+            self.logger.info(f"⏩ All {len(schemas)} tables are unchanged since the last run")
+            return results
+        if results:
+            self.logger.info(f"⏩ Skipping {len(results)} unchanged tables, checking {len(changed)}")
+
+        client = bigquery.Client(project=self.config.gcp_project_id)
+        dataset = self._create_dataset(client, self.config.gcp_dataset_id)
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="bq-init") as executor:
+            futures = {
+                executor.submit(self._prepare_table, client, dataset, table_name, schema, diff): table_name
+                for table_name, schema in changed.items()
+            }
+            for future in as_completed(futures):
+                table_name = futures[future]
+                try:
+                    results[table_name] = future.result()
+                except GoogleAPICallError as e:
+                    self.logger.error(f"🚨 Preparing table '{table_name}' failed: {e.message}")
+                    results[table_name] = TableState.FAILED
+                if results[table_name] in (TableState.FOUND, TableState.CREATED, TableState.UPDATED):
+                    state[f"{dataset_key}.{table_name}"] = hashes[table_name]
+        self._write_state(state)
+
+        counts = Counter(table_state.value for table_state in results.values())
+        self.logger.info(
+            f"📊 {len(results)} tables: {', '.join(f'{n} {name}' for name, n in counts.items())}"
+        )
+        return results
 
     def _create_dataset(self, client: bigquery.Client, dataset_id: str):
         """
@@ -57,17 +140,46 @@ class PrepareBigQueryService:
             self.logger.info(f"✅ Dataset {dataset_id} created")
             return dataset
 
+    def _prepare_table(
+        self,
+        client: bigquery.Client,
+        dataset: bigquery.Dataset,
+        table_name: str,
+        schema: list[dict],
+        diff: bool,
+    ) -> TableState:
+        table = self._create_table(client, dataset, table_name, schema)
+        if table is None:
+            return TableState.CREATED
+        expected = [bigquery.SchemaField.from_api_repr(field) for field in schema]
+        changes = schema_changes(table.schema, expected)
+        if not changes:
+            return TableState.FOUND
+        details = "\n".join(f"    {change}" for change in changes)
+        if not diff:
+            self.logger.warning(
+                f"⚠️ Table '{table_name}' differs from its schema file, run with --diff to update it:\n{details}"
+            )
+            return TableState.DIFFERS
+        table.schema = expected
+        client.update_table(table, ["schema"])
+        self.logger.info(f"✅ Table '{table_name}' updated:\n{details}")
+        return TableState.UPDATED
+
     def _create_table(
-        self, client: bigquery.Client, dataset: bigquery.Dataset, table_name: str, schema: dict
-    ):
+        self, client: bigquery.Client, dataset: bigquery.Dataset, table_name: str, schema: list[dict]
+    ) -> bigquery.Table | None:
         """
-            Creates a new table in BigQuery if it doesn't already exist.
+        Creates a new table in BigQuery if it doesn't already exist.
 
         Args:
-            client (bigquery.Client): _description_
-            dataset (bigquery.Dataset): _description_
-            table_name (str): _description_
-            schema (dict): _description_
+            client (bigquery.Client): The BigQuery client object
+            dataset (bigquery.Dataset): Dataset of the table
+            table_name (str): Name of the table
+            schema (list[dict]): BigQuery schema JSON of the table
+
+        Returns:
+            bigquery.Table | None: The existing table, None if it was created
         """
         try:
             table = client.get_table(f"{dataset.dataset_id}.{table_name}")
@@ -76,6 +188,46 @@ class PrepareBigQueryService:
         except NotFound:
             self.logger.info(f"⭕ Table '{table_name}' not found, creating it...")
             table = bigquery.Table(f"{dataset.project}.{dataset.dataset_id}.{table_name}", schema=schema)
-            table = client.create_table(table)
+            client.create_table(table)
             self.logger.info(f"✅ Table '{table_name}' created")
-            return table
+            return None
+
+    def _read_state(self) -> dict[str, str]:
+        if not self.state_path.is_file():
+            return {}
+        try:
+            with self.state_path.open("r") as f:
+                return json.load(f)
+        except ValueError:
+            self.logger.warning(f"⚠️ Ignoring unreadable state cache {self.state_path}")
+            return {}
+
+    def _write_state(self, state: dict[str, str]):
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = self.state_path.with_suffix(f"{self.state_path.suffix}.{os.getpid()}.tmp")
+        with temporary.open("w") as f:
+            json.dump(state, f, indent=2, sort_keys=True)
+        os.replace(temporary, self.state_path)
+
+
+def schema_changes(
+    actual: list[bigquery.SchemaField], expected: list[bigquery.SchemaField], prefix: str = ""
+) -> list[str]:
+    """Differences between two table schemas, one line per added (+), removed (-) or changed (~) column"""
+    changes = []
+    actual_fields = {field.name: field for field in actual}
+    expected_fields = {field.name: field for field in expected}
+    for name, field in expected_fields.items():
+        current = actual_fields.get(name)
+        if current is None:
+            changes.append(f"+ {prefix}{name} {field.field_type} {field.mode}")
+            continue
+        if (current.field_type, current.mode) != (field.field_type, field.mode):
+            changes.append(
+                f"~ {prefix}{name} {current.field_type} {current.mode} → {field.field_type} {field.mode}"
+            )
+        changes.extend(schema_changes(list(current.fields), list(field.fields), f"{prefix}{name}."))
+    for name, field in actual_fields.items():
+        if name not in expected_fields:
+            changes.append(f"- {prefix}{name} {field.field_type} {field.mode}")
+    return changes
@@ -0,0 +1,340 @@
+import cProfile
+import functools
+import io
+import logging
+import pstats
+import threading
+import time
+from collections.abc import Callable, Iterable, Iterator
+from enum import Enum
+from pathlib import Path
+from typing import TextIO
+
+from bigquery_storage_write_api_examples import Config
+
+StageCallback = Callable[["Stage", float], None]
+
+
+class Stage(Enum):
+    # Producing the source rows, e.g. fake data or reading a file
+    GENERATE = "generate"
+    # Serializing rows and grouping them into batches, protobuf bytes or Arrow record batches
+    ENCODE = "encode"
+    # Wrapping a batch in an AppendRowsRequest
+    BUILD_REQUEST = "build_request"
+    # Handing a request to the stream, including the wait for a free slot in the in-flight window
+    SEND = "send"
+    # Waiting for the acknowledgement of the oldest in-flight request
+    AWAIT_ACK = "await_ack"
+
+
+class _StageStats:
+    __slots__ = ("calls", "self_time", "total")
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.self_time = 0.0
+
+
+class _Frame:
+    __slots__ = ("children", "path", "start")
+
+    def __init__(self, path: tuple[str, ...], start: float):
+        self.path = path
+        self.start = start
+        self.children = 0.0
+
+
+class StageProfiler:
+    """
+    Times the stages of a write pipeline (see Stage) and reports them as a flame-style tree.
+
+    Writers don't call the profiler for every row, they wrap their stage functions and iterators once with
+    ``timed`` and ``iterate`` when they're built, through the module functions of the same name. Without a
+    profiler those return the function or iterator itself, so profiling costs nothing when it's off.
+
+    Stages nest: a request pulled from the encoder pulls rows from the generator, a send waits for acks when the
+    window is full. Every stage is recorded under the path of stages it ran in, per thread, with its total time and
+    its self time (without nested stages), like the frames of a flame graph. ``callback`` is called with the stage
+    and its seconds after every stage, e.g. to feed another metrics system.
+
+    Subclasses profile the code inside the stages as well, see CProfileStageProfiler and LineStageProfiler.
+    """
+
+    def __init__(self, callback: StageCallback | None = None):
+        self.logger = logging.getLogger(__name__)
+        self.callback = callback
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # Stats of every thread, each thread only writes its own so recording needs no lock
+        self._thread_stats: list[dict[tuple[str, ...], _StageStats]] = []
+
+    def timed[T](self, stage: Stage, func: Callable[..., T]) -> Callable[..., T]:
+        """Wrap a function so that every call is timed as ``stage``"""
+        func = self._instrument(func)
+        enter, leave = self._enter, self._leave
+
+        @functools.wraps(func)
+        def timed_call(*args, **kwargs):
+            frame = enter(stage)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                leave(stage, frame)
+
+        return timed_call
+
+    def iterate[T](self, stage: Stage, items: Iterable[T]) -> Iterator[T]:
+        """Wrap an iterable so that producing every item is timed as ``stage``"""
+        advance = self.timed(stage, _next_item)
+        iterator = iter(items)
+        while True:
+            try:
+                item = advance(iterator)
+            except StopIteration:
+                return
+            yield item
+
+    def stats(self) -> dict[tuple[str, ...], dict]:
+        """Calls, total and self seconds of every stage path, the first element of a path is the thread"""
+        with self._lock:
+            thread_stats = list(self._thread_stats)
+        merged: dict[tuple[str, ...], dict] = {}
+        for stats in thread_stats:
+            for path, stage_stats in list(stats.items()):
+                entry = merged.setdefault(path, {"calls": 0, "total": 0.0, "self": 0.0})
+                entry["calls"] += stage_stats.calls
+                entry["total"] += stage_stats.total
+                entry["self"] += stage_stats.self_time
+        return merged
+
+    def folded(self) -> str:
+        """Self time of every stage path in microseconds, in the folded stack format of flamegraph.pl and speedscope"""
+        return "".join(
+            f"{';'.join(path)} {round(entry['self'] * 1_000_000)}\n"
+            for path, entry in sorted(self.stats().items())
+        )
+
+    def report(self) -> str:
+        """The stage tree of every thread with calls, total and self time, largest first"""
+        stats = self.stats()
+        if not stats:
+            return "No stages were timed"
+        grand_total = sum(entry["total"] for path, entry in stats.items() if len(path) == 2) or 1.0
+        lines = [f"{'Stage':<40} {'Calls':>10} {'Total s':>10} {'Self s':>10} {'% Total':>8}"]
+
+        def add_children(parent: tuple[str, ...]):
+            children = [path for path in stats if len(path) == len(parent) + 1 and path[:-1] == parent]
+            for path in sorted(children, key=lambda child: stats[child]["total"], reverse=True):
+                entry = stats[path]
+                name = "  " * (len(path) - 2) + path[-1]
+                lines.append(
+                    f"{name:<40} {entry['calls']:>10} {entry['total']:>10.3f} {entry['self']:>10.3f} "
+                    f"{entry['total'] / grand_total:>8.1%}"
+                )
+                add_children(path)
+
+        for thread in sorted({path[0] for path in stats}):
+            lines.append(f"[{thread}]")
+            add_children((thread,))
+        return "\n".join(lines)
+
+    def dump(self, directory: str | Path) -> list[Path]:
+        """Write the folded stages (and the profiles of subclasses) to a directory
+
+        Returns:
+            list[Path]: The written files
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / "stages.folded"
+        path.write_text(self.folded())
+        return [path]
+
+    def _instrument[T](self, func: Callable[..., T]) -> Callable[..., T]:
+        # Hook for profilers that need to register the functions they trace
+        return func
+
+    def _thread_started(self):
+        # Called when the outermost stage of a thread begins ...
+        pass
+
+    def _thread_stopped(self):
+        # ... and when it ends, so profilers only trace code inside stages
+        pass
+
+    def _enter(self, stage: Stage) -> _Frame:
+        local = self._local
+        stack = getattr(local, "stack", None)
+        if stack is None:
+            stack = local.stack = []
+            local.stats = {}
+            with self._lock:
+                self._thread_stats.append(local.stats)
+        if stack:
+            path = (*stack[-1].path, stage.value)
+        else:
+            path = (threading.current_thread().name, stage.value)
+            self._thread_started()
+        frame = _Frame(path, time.perf_counter())
+        stack.append(frame)
+        return frame
+
+    def _leave(self, stage: Stage, frame: _Frame):
+        elapsed = time.perf_counter() - frame.start
+        local = self._local
+        stack = local.stack
+        stack.pop()
+        if stack:
+            stack[-1].children += elapsed
+        else:
+            self._thread_stopped()
+        stats = local.stats.get(frame.path)
+        if stats is None:
+            stats = local.stats[frame.path] = _StageStats()
+        stats.calls += 1
+        stats.total += elapsed
+        stats.self_time += elapsed - frame.children
+        if self.callback is not None:
+            self.callback(stage, elapsed)
+
+
+def _next_item[T](iterator: Iterator[T]) -> T:
+    return next(iterator)
+
+
+class CProfileStageProfiler(StageProfiler):
+    """
+    Times the stages and runs cProfile inside them, to see which functions the time of a stage goes to.
+
+    Since Python 3.12 cProfile traces every thread of the process and only one profile can be enabled at a time,
+    so all threads share one profile: it's enabled when a thread enters its outermost stage and disabled once no
+    thread is inside a stage. Code of other threads that runs meanwhile is profiled as well. The report adds the
+    functions with the most cumulative time, ``dump`` writes ``stages.prof`` for pstats or snakeviz.
+    """
+
+    def __init__(self, callback: StageCallback | None = None, top_functions: int = 25):
+        super().__init__(callback)
+        self.top_functions = top_functions
+        self._profile = cProfile.Profile()
+        # Threads inside a stage, the profile is enabled while there is at least one
+        self._active_threads = 0
+
+    def report(self) -> str:
+        output = io.StringIO()
+        stats = self._function_stats(output)
+        if stats is None:
+            return super().report()
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top_functions)
+        return f"{super().report()}\n{output.getvalue()}"
+
+    def dump(self, directory: str | Path) -> list[Path]:
+        paths = super().dump(directory)
+        stats = self._function_stats()
+        if stats is not None:
+            path = Path(directory) / "stages.prof"
+            stats.dump_stats(path)
+            paths.append(path)
+        return paths
+
+    def _function_stats(self, stream: TextIO | None = None) -> pstats.Stats | None:
+        with self._lock:
+            if not self._profile.getstats():
+                # No stage ran, pstats can't load an empty profile
+                return None
+            # Taking the stats disables the profile, the stages that are still running go on being profiled
+            stats = pstats.Stats(self._profile, stream=stream)
+            if self._active_threads:
+                self._profile.enable()
+        return stats
+
+    def _thread_started(self):
+        with self._lock:
+            self._active_threads += 1
+            if self._active_threads == 1:
+                self._profile.enable()
+
+    def _thread_stopped(self):
+        with self._lock:
+            self._active_threads -= 1
+            if not self._active_threads:
+                self._profile.disable()
+
+
+class LineStageProfiler(StageProfiler):
+    """
+    Times the stages and runs line_profiler inside them, for line by line timings of the stage functions.
+
+    Every function wrapped with ``timed`` is traced, plus the ``functions`` given here, e.g. the encoder or the
+    fake data generator. Needs the line_profiler package (a dev dependency), ``dump`` writes ``stages.lprof`` for
+    ``python -m line_profiler``.
+    """
+
+    def __init__(self, callback: StageCallback | None = None, functions: Iterable[Callable] = ()):
+        try:
+            from line_profiler import LineProfiler
+        except ImportError as e:
+            raise ImportError(
+                "🛑 Line profiling requires the line-profiler package, see the dev dependencies"
+            ) from e
+        super().__init__(callback)
+        self.line_profiler = LineProfiler()
+        for func in functions:
+            self._instrument(func)
+
+    def report(self) -> str:
+        output = io.StringIO()
+        self.line_profiler.print_stats(stream=output, stripzeros=True)
+        return f"{super().report()}\n{output.getvalue()}"
+
+    def dump(self, directory: str | Path) -> list[Path]:
+        paths = super().dump(directory)
+        path = Path(directory) / "stages.lprof"
+        self.line_profiler.dump_stats(str(path))
+        return [*paths, path]
+
+    def _instrument[T](self, func: Callable[..., T]) -> Callable[..., T]:
+        target = getattr(func, "__func__", func)
+        if hasattr(target, "__code__") and target is not _next_item:
+            self.line_profiler.add_function(target)
+        return func
+
+    def _thread_started(self):
+        self.line_profiler.enable_by_count()
+
+    def _thread_stopped(self):
+        self.line_profiler.disable_by_count()
+
+
+def timed[T](profiler: StageProfiler | None, stage: Stage, func: Callable[..., T]) -> Callable[..., T]:
+    """``profiler.timed(stage, func)``, or ``func`` itself without a profiler"""
+    return func if profiler is None else profiler.timed(stage, func)
+
+
+def iterate[T](profiler: StageProfiler | None, stage: Stage, items: Iterable[T]) -> Iterable[T]:
+    """``profiler.iterate(stage, items)``, or ``items`` itself without a profiler"""
+    return items if profiler is None else profiler.iterate(stage, items)
+
+
+def configured_profiler(config: Config) -> StageProfiler | None:
+    """Return the profiler set by ``profiling`` in the config, None when profiling is off"""
+    match config.profiling:
+        case "stages":
+            return StageProfiler()
+        case "cprofile":
+            return CProfileStageProfiler()
+        case "line":
+            return LineStageProfiler()
+    return None
+
+
+def log_profile(profiler: StageProfiler | None, output: str | Path | None = None):
+    """Log the report of a profiler and write its files to the ``output`` directory, if given"""
+    if profiler is None:
+        return
+    logger = logging.getLogger(__name__)
+    logger.info(f"⏱️ Stage timings\n{profiler.report()}")
+    if output:
+        for path in profiler.dump(output):
+            logger.info(f"💾 Wrote {path}")
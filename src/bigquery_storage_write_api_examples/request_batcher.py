@@ -0,0 +1,158 @@
+from collections.abc import Iterable, Iterator
+from typing import Protocol
+
+from google.cloud.bigquery_storage_v1 import types
+
+from bigquery_storage_write_api_examples.profiling import Stage, StageProfiler, iterate, timed
+from bigquery_storage_write_api_examples.row_encoder import RowEncoder, encode_varint
+
+# AppendRows requests are capped at 10 MB. Keep headroom for the writer schema and stream name,
+# which the AppendRowsStream adds to the first request of a connection.
+DEFAULT_MAX_REQUEST_BYTES = 9 * 1024 * 1024
+DEFAULT_MAX_ROWS_PER_REQUEST = 10_000
+
+
+def serialized_row_size(row: bytes) -> int:
+    """Number of bytes a serialized row takes inside ``ProtoRows.serialized_rows`` (tag + length + payload)"""
+    # Field 1 with wire type 2 is a single byte tag
+    return 1 + len(encode_varint(len(row))) + len(row)
+
+
+def frame_row(row: bytes) -> bytes:
+    """Frame a serialized row the way it is stored in ``ProtoRows``, concatenated frames form a ProtoRows message"""
+    return b"\x0a" + encode_varint(len(row)) + row
+
+
+def build_request(serialized_rows: list[bytes], offset: int | None = None) -> types.AppendRowsRequest:
+    """Wrap serialized rows in an AppendRowsRequest
+
+    Args:
+        serialized_rows (list[bytes]): Rows serialized with the writer schema of the stream
+        offset (int | None): Offset of the first row in the stream, ``None`` to append without offset checks
+    """
+    proto_rows = types.ProtoRows(serialized_rows=serialized_rows)
+    request = types.AppendRowsRequest(proto_rows=types.AppendRowsRequest.ProtoData(rows=proto_rows))
+    if offset is not None:
+        request.offset = offset
+    return request
+
+
+def build_request_from_proto_rows(
+    proto_rows: bytes | memoryview, offset: int | None = None
+) -> types.AppendRowsRequest:
+    """Wrap rows that are already in the ``ProtoRows`` wire format (see ``frame_row``) in an AppendRowsRequest
+
+    The rows are parsed in one go by the protobuf runtime, instead of appending them one by one. Buffers like a
+    memoryview of shared memory or of a memory-mapped file are parsed in place, without a copy to bytes first.
+    """
+    request = types.AppendRowsRequest()
+    request._pb.proto_rows.rows.ParseFromString(proto_rows)
+    if offset is not None:
+        request.offset = offset
+    return request
+
+
+def request_row_count(request: types.AppendRowsRequest) -> int:
+    """Number of rows in an AppendRowsRequest, with protobuf rows or an Arrow record batch"""
+    if request._pb.HasField("arrow_rows"):
+        return request._pb.arrow_rows.rows.row_count
+    return len(request._pb.proto_rows.rows.serialized_rows)
+
+
+class BatchSizer(Protocol):
+    """Decides the rows per request of a batcher at runtime, like the BatchSizeController"""
+
+    rows_per_request: int
+
+    def record_request(self, row_count: int, byte_count: int): ...
+
+
+class RequestBatcher:
+    """
+    Packs rows into AppendRowsRequests, cutting a new request when the row count or encoded byte size limit is hit.
+
+    Rows can be dictionaries (encoded with the given RowEncoder) or already serialized bytes, from any iterable.
+    The batcher is lazy, so it only holds one request worth of rows at a time.
+
+    With a ``batch_sizer`` the row limit of every request is taken from it instead of ``max_rows``, and it is told
+    the size of every request that is cut. The byte limit always applies.
+
+    With a ``profiler`` the generate, encode and build request stages of ``requests`` are timed.
+    """
+
+    def __init__(
+        self,
+        row_encoder: RowEncoder | None = None,
+        max_rows: int = DEFAULT_MAX_ROWS_PER_REQUEST,
+        max_bytes: int = DEFAULT_MAX_REQUEST_BYTES,
+        batch_sizer: BatchSizer | None = None,
+        profiler: StageProfiler | None = None,
+    ):
+        if max_rows < 1 or max_bytes < 1:
+            raise ValueError("🛑 max_rows and max_bytes must be positive")
+        self.row_encoder = row_encoder
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.batch_sizer = batch_sizer
+        self.profiler = profiler
+        self._build_request = timed(profiler, Stage.BUILD_REQUEST, build_request)
+
+    def batches(self, rows: Iterable[dict]) -> Iterator[list[bytes]]:
+        """Encode rows and group them into lists of serialized rows that fit in one request"""
+        if self.row_encoder is None:
+            raise ValueError("🛑 A RowEncoder is required to batch row dictionaries")
+        encode = self.row_encoder.encode
+        return self.serialized_batches(encode(row) for row in rows)
+
+    def serialized_batches(self, serialized_rows: Iterable[bytes]) -> Iterator[list[bytes]]:
+        """Group serialized rows into lists that fit in one request"""
+        batch_sizer = self.batch_sizer
+        max_rows = self.max_rows if batch_sizer is None else batch_sizer.rows_per_request
+        batch: list[bytes] = []
+        batch_bytes = 0
+        for row in serialized_rows:
+            row_bytes = serialized_row_size(row)
+            if row_bytes > self.max_bytes:
+                raise ValueError(
+                    f"🛑 Row of {row_bytes} bytes exceeds the request limit of {self.max_bytes} bytes"
+                )
+            if batch and (len(batch) >= max_rows or batch_bytes + row_bytes > self.max_bytes):
+                if batch_sizer is not None:
+                    batch_sizer.record_request(len(batch), batch_bytes)
+                    max_rows = batch_sizer.rows_per_request
+                yield batch
+                batch, batch_bytes = [], 0
+            batch.append(row)
+            batch_bytes += row_bytes
+        if batch:
+            if batch_sizer is not None:
+                batch_sizer.record_request(len(batch), batch_bytes)
+            yield batch
+
+    def requests(self, rows: Iterable[dict], offset: int | None = None) -> Iterator[types.AppendRowsRequest]:
+        """Encode rows and yield AppendRowsRequests
+
+        Args:
+            rows (Iterable[dict]): Rows to encode
+            offset (int | None): Offset of the first row. Every following request gets an offset equal to the
+                number of rows previously sent, which allows the stream to be resumed. ``None`` for the default
+                stream, which doesn't support offsets.
+        """
+        rows = iterate(self.profiler, Stage.GENERATE, rows)
+        return self._requests(iterate(self.profiler, Stage.ENCODE, self.batches(rows)), offset)
+
+    def serialized_requests(
+        self, serialized_rows: Iterable[bytes], offset: int | None = None
+    ) -> Iterator[types.AppendRowsRequest]:
+        """Same as ``requests`` but for rows that are already serialized"""
+        rows = iterate(self.profiler, Stage.GENERATE, serialized_rows)
+        return self._requests(iterate(self.profiler, Stage.ENCODE, self.serialized_batches(rows)), offset)
+
+    def _requests(
+        self, batches: Iterable[list[bytes]], offset: int | None
+    ) -> Iterator[types.AppendRowsRequest]:
+        build = self._build_request
+        for batch in batches:
+            yield build(batch, offset)
+            if offset is not None:
+                offset += len(batch)
@@ -0,0 +1,153 @@
+import logging
+import mmap
+import struct
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from typing import NamedTuple, Self
+
+from google.cloud.bigquery_storage_v1 import types
+
+from bigquery_storage_write_api_examples import Config
+from bigquery_storage_write_api_examples.request_batcher import (
+    DEFAULT_MAX_REQUEST_BYTES,
+    DEFAULT_MAX_ROWS_PER_REQUEST,
+    build_request_from_proto_rows,
+    frame_row,
+)
+from bigquery_storage_write_api_examples.row_encoder import decode_varint
+
+CORPUS_MAGIC = b"BQWCRP01"
+# Magic, row count, length of the table id, followed by the table id itself
+_HEADER = struct.Struct("<8sQH")
+
+
+class CorpusBatch(NamedTuple):
+    """Consecutive rows of a corpus, ``proto_rows`` is a ProtoRows message and a view into the mapped file"""
+
+    proto_rows: memoryview
+    row_count: int
+
+
+def write_corpus(path: str | Path, table_id: str, serialized_rows: Iterable[bytes]) -> int:
+    """Write serialized rows to a corpus file, streaming, so the rows can come from a generator
+
+    The file has a small header with the table id and row count, followed by the rows framed the way they are
+    stored in ``ProtoRows.serialized_rows``: a tag, a varint length and the row. Any run of consecutive rows is a
+    valid ProtoRows message, which is what lets the RowCorpus replay them without decoding.
+
+    Returns:
+        int: Number of rows written
+    """
+    encoded_table_id = table_id.encode()
+    row_count = 0
+    with open(path, "wb") as f:
+        # The row count is only known at the end, it is patched in once all rows are written
+        f.write(_HEADER.pack(CORPUS_MAGIC, 0, len(encoded_table_id)) + encoded_table_id)
+        for row in serialized_rows:
+            f.write(frame_row(row))
+            row_count += 1
+        f.seek(0)
+        f.write(_HEADER.pack(CORPUS_MAGIC, row_count, len(encoded_table_id)))
+    return row_count
+
+
+class RowCorpus:
+    """
+    Replays the rows of a corpus file written by ``write_corpus``.
+
+    The file is memory-mapped and cut into batches of consecutive rows by walking the frame lengths, every batch
+    is a memoryview of the mapping, so no rows are copied or decoded in Python. The writers take the batches
+    through their ``append_proto_rows`` (or ``write_proto_rows``) methods, where the protobuf runtime parses the
+    view straight into the request.
+
+        with RowCorpus("students.corpus") as corpus:
+            for batch in corpus.batches(max_rows=1_000):
+                session.append_proto_rows(batch.proto_rows)
+
+    The mapping stays alive while batches reference it, even after the corpus is closed.
+    """
+
+    def __init__(self, path: str | Path):
+        self.logger = logging.getLogger(__name__)
+        self.path = Path(path)
+        with self.path.open("rb") as f:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size or not header.startswith(CORPUS_MAGIC):
+                raise ValueError(f"🛑 '{self.path}' is not a row corpus")
+            _, self.row_count, table_id_length = _HEADER.unpack(header)
+            self.table_id = f.read(table_id_length).decode()
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        self._rows_start = _HEADER.size + table_id_length
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def size(self) -> int:
+        """Size of the rows in bytes, as they are sent in requests"""
+        return len(self._view) - self._rows_start
+
+    def batches(
+        self,
+        max_rows: int = DEFAULT_MAX_ROWS_PER_REQUEST,
+        max_bytes: int = DEFAULT_MAX_REQUEST_BYTES,
+    ) -> Iterator[CorpusBatch]:
+        """Cut the rows into batches that fit in one request, with the same limits as the RequestBatcher"""
+        if max_rows < 1 or max_bytes < 1:
+            raise ValueError("🛑 max_rows and max_bytes must be positive")
+        view = self._view
+        end = len(view)
+        start = position = self._rows_start
+        row_count = 0
+        while position < end:
+            # Skip the one byte tag of field 1, the length follows
+            length, payload_start = decode_varint(view, position + 1)
+            row_end = payload_start + length
+            if row_end - position > max_bytes:
+                raise ValueError(
+                    f"🛑 Row of {row_end - position} bytes exceeds the request limit of {max_bytes} bytes"
+                )
+            if row_count and (row_count >= max_rows or row_end - start > max_bytes):
+                yield CorpusBatch(view[start:position], row_count)
+                start, row_count = position, 0
+            position = row_end
+            row_count += 1
+        if row_count:
+            yield CorpusBatch(view[start:position], row_count)
+
+    def requests(
+        self,
+        max_rows: int = DEFAULT_MAX_ROWS_PER_REQUEST,
+        max_bytes: int = DEFAULT_MAX_REQUEST_BYTES,
+        offset: int | None = None,
+    ) -> Iterator[types.AppendRowsRequest]:
+        """Yield AppendRowsRequests, with offsets continuing from ``offset`` like ``RequestBatcher.requests``"""
+        for batch in self.batches(max_rows, max_bytes):
+            yield build_request_from_proto_rows(batch.proto_rows, offset)
+            if offset is not None:
+                offset += batch.row_count
+
+    def close(self):
+        self._view.release()
+        try:
+            self._mmap.close()
+        except BufferError:
+            # Batches are still referenced, the file is unmapped when the last of them is garbage collected
+            self.logger.debug(f"Corpus '{self.path}' stays mapped until its batches are released")
+
+
+def configured_corpus(config: Config, table_id: str) -> RowCorpus | None:
+    """Open the corpus of ``table_id`` in the ``corpus_dir`` set in the config, if any"""
+    if config.corpus_dir is None:
+        return None
+    if config.row_format != "proto":
+        raise ValueError("🛑 A corpus holds protobuf rows, set row_format: proto to replay it")
+    corpus = RowCorpus(Path(config.corpus_dir) / f"{table_id}.corpus")
+    if corpus.table_id != table_id:
+        corpus.close()
+        raise ValueError(f"🛑 '{corpus.path}' holds {corpus.table_id} rows, not {table_id}")
+    return corpus
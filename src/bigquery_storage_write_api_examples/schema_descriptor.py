@@ -0,0 +1,177 @@
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+
+from google.protobuf import descriptor_pb2, descriptor_pool, message_factory
+from google.protobuf.descriptor_pb2 import FieldDescriptorProto
+from google.protobuf.message import DecodeError, Message
+
+SCHEMAS_DIR = Path("./misc/schemas")
+DESCRIPTOR_CACHE_DIR = Path("./.cache/descriptors")
+
+# Bump when the generated descriptors change, so stale cache entries are not picked up
+_GENERATOR_VERSION = 1
+
+# Same mapping as the ProtoFileGenerator, the runtime messages are wire compatible with the compiled ones
+_PROTO_TYPES = {
+    "STRING": FieldDescriptorProto.TYPE_STRING,
+    "BYTES": FieldDescriptorProto.TYPE_BYTES,
+    "INTEGER": FieldDescriptorProto.TYPE_INT64,
+    "INT64": FieldDescriptorProto.TYPE_INT64,
+    "FLOAT": FieldDescriptorProto.TYPE_DOUBLE,
+    "FLOAT64": FieldDescriptorProto.TYPE_DOUBLE,
+    "BOOLEAN": FieldDescriptorProto.TYPE_BOOL,
+    "BOOL": FieldDescriptorProto.TYPE_BOOL,
+    "TIMESTAMP": FieldDescriptorProto.TYPE_INT64,
+    "DATE": FieldDescriptorProto.TYPE_STRING,
+    "TIME": FieldDescriptorProto.TYPE_STRING,
+    "DATETIME": FieldDescriptorProto.TYPE_STRING,
+    "GEOGRAPHY": FieldDescriptorProto.TYPE_STRING,
+    "NUMERIC": FieldDescriptorProto.TYPE_STRING,
+    "BIGNUMERIC": FieldDescriptorProto.TYPE_DOUBLE,
+    "JSON": FieldDescriptorProto.TYPE_STRING,
+}
+
+logger = logging.getLogger(__name__)
+
+# Message classes built by this process, keyed by schema hash
+_message_classes: dict[str, type[Message]] = {}
+
+
+def load_table_schema(table_id: str, schemas_dir: str | Path = SCHEMAS_DIR) -> list[dict]:
+    """Read the BigQuery schema JSON of a table from ``misc/schemas``"""
+    path = Path(schemas_dir) / f"{table_id}.json"
+    if not path.is_file():
+        raise FileNotFoundError(f"🛑 Schema file not found: {path.resolve()}")
+    with path.open("r") as f:
+        return json.load(f)
+
+
+def schema_hash(table_id: str, bigquery_schema: list[dict]) -> str:
+    """Hash of a table schema, independent of key order and formatting of the JSON"""
+    canonical = json.dumps(
+        [_GENERATOR_VERSION, table_id, bigquery_schema], sort_keys=True, separators=(",", ":")
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def message_name(table_id: str) -> str:
+    """Name of the top level message of a table, e.g. ``RawStudents``, as ``generate-proto`` names it"""
+    return f"Raw{table_id.title().replace('_', '')}"
+
+
+def descriptor_proto(table_id: str, bigquery_schema: list[dict]) -> descriptor_pb2.DescriptorProto:
+    """Build the DescriptorProto of a table from its BigQuery schema JSON
+
+    Fields are numbered in schema order and RECORD fields become nested messages, exactly like the proto files
+    written by ``generate-proto``.
+    """
+    return _message_proto(message_name(table_id), bigquery_schema, f".{message_name(table_id)}")
+
+
+def _message_proto(name: str, fields: list[dict], full_name: str) -> descriptor_pb2.DescriptorProto:
+    message = descriptor_pb2.DescriptorProto(name=name)
+    for number, field in enumerate(fields, start=1):
+        field_type = field["type"].upper()
+        field_proto = message.field.add(name=field["name"], number=number)
+        repeated = field.get("mode", "NULLABLE").upper() == "REPEATED"
+        field_proto.label = (
+            FieldDescriptorProto.LABEL_REPEATED if repeated else FieldDescriptorProto.LABEL_OPTIONAL
+        )
+        if field_type in ("RECORD", "STRUCT"):
+            nested_name = field["name"].capitalize()
+            message.nested_type.append(
+                _message_proto(nested_name, field["fields"], f"{full_name}.{nested_name}")
+            )
+            field_proto.type = FieldDescriptorProto.TYPE_MESSAGE
+            field_proto.type_name = f"{full_name}.{nested_name}"
+        elif field_type in _PROTO_TYPES:
+            field_proto.type = _PROTO_TYPES[field_type]
+        else:
+            raise ValueError(f"🛑 Unsupported BigQuery type {field['type']} of field {field['name']}")
+    return message
+
+
+def message_class_for_schema(
+    table_id: str, bigquery_schema: list[dict], cache_dir: str | Path | None = DESCRIPTOR_CACHE_DIR
+) -> type[Message]:
+    """Return a message class for a table schema, without protoc or generated code
+
+    The file descriptor is cached on disk under ``cache_dir`` keyed by the schema hash, so a changed schema gets a
+    new descriptor and an unchanged one is loaded as is on the next start.
+
+    Args:
+        table_id (str): Table the message is named after
+        bigquery_schema (list[dict]): Schema as in ``misc/schemas`` or ``SchemaField.to_api_repr()``
+        cache_dir (str | Path | None): Directory of the cached descriptors, None to skip the disk cache
+    """
+    key = schema_hash(table_id, bigquery_schema)
+    message_class = _message_classes.get(key)
+    if message_class is not None:
+        return message_class
+
+    file_proto = _load_cached(cache_dir, table_id, key)
+    if file_proto is None:
+        file_proto = descriptor_pb2.FileDescriptorProto(name=f"{table_id}_{key[:16]}.proto", syntax="proto3")
+        file_proto.message_type.append(descriptor_proto(table_id, bigquery_schema))
+        _store_cached(cache_dir, table_id, key, file_proto)
+
+    # A pool per schema, so two versions of a table's message can live side by side
+    pool = descriptor_pool.DescriptorPool()
+    pool.Add(file_proto)
+    message_class = message_factory.GetMessageClass(pool.FindMessageTypeByName(message_name(table_id)))
+    _message_classes[key] = message_class
+    return message_class
+
+
+def _cache_path(cache_dir: str | Path, table_id: str, key: str) -> Path:
+    return Path(cache_dir) / f"{table_id}-{key[:32]}.pb"
+
+
+def _load_cached(
+    cache_dir: str | Path | None, table_id: str, key: str
+) -> descriptor_pb2.FileDescriptorProto | None:
+    if cache_dir is None:
+        return None
+    path = _cache_path(cache_dir, table_id, key)
+    try:
+        return descriptor_pb2.FileDescriptorProto.FromString(path.read_bytes())
+    except FileNotFoundError:
+        return None
+    except (OSError, DecodeError) as e:
+        logger.warning(f"⚠️ Ignoring unreadable cached descriptor {path}: {e}")
+        return None
+
+
+def _store_cached(
+    cache_dir: str | Path | None, table_id: str, key: str, file_proto: descriptor_pb2.FileDescriptorProto
+):
+    if cache_dir is None:
+        return
+    path = _cache_path(cache_dir, table_id, key)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Written next to its final name and renamed, so concurrent writers never see half a file
+        temporary = path.with_suffix(f".{os.getpid()}.tmp")
+        temporary.write_bytes(file_proto.SerializeToString())
+        os.replace(temporary, path)
+        logger.debug(f"💾 Cached descriptor of '{table_id}' in {path}")
+    except OSError as e:
+        logger.warning(f"⚠️ Could not cache the descriptor of '{table_id}' in {path}: {e}")
+
+
+def schema_file_message_class(
+    table_id: str, schemas_dir: str | Path = SCHEMAS_DIR, cache_dir: str | Path | None = DESCRIPTOR_CACHE_DIR
+) -> type[Message]:
+    """Message class of a table from its schema JSON in ``misc/schemas``"""
+    return message_class_for_schema(table_id, load_table_schema(table_id, schemas_dir), cache_dir)
+
+
+def live_table_schema(project_id: str, dataset_id: str, table_id: str) -> list[dict]:
+    """Fetch the schema of an existing BigQuery table, in the JSON form of ``misc/schemas``"""
+    from google.cloud import bigquery
+
+    table = bigquery.Client(project=project_id).get_table(f"{project_id}.{dataset_id}.{table_id}")
+    return [field.to_api_repr() for field in table.schema]
@@ -0,0 +1,220 @@
+import itertools
+import logging
+import queue
+import threading
+import zlib
+from collections.abc import Iterable
+from typing import Self
+
+from google.protobuf.descriptor import Descriptor
+
+from bigquery_storage_write_api_examples.append_sender import DEFAULT_MAX_IN_FLIGHT
+from bigquery_storage_write_api_examples.compression import Compression
+from bigquery_storage_write_api_examples.request_batcher import (
+    DEFAULT_MAX_REQUEST_BYTES,
+    RequestBatcher,
+)
+from bigquery_storage_write_api_examples.row_encoder import RowEncoder
+from bigquery_storage_write_api_examples.write_client import create_write_client
+from bigquery_storage_write_api_examples.write_session import StreamType, WriteSession
+
+_STOP = object()
+
+
+class _Shard(threading.Thread):
+    """Worker owning one COMMITTED stream on its own connection, fed with chunks of rows through a bounded queue"""
+
+    def __init__(
+        self,
+        index: int,
+        table_path: str,
+        descriptor: Descriptor,
+        batcher: RequestBatcher,
+        max_in_flight: int,
+        queue_size: int,
+        endpoint: str | None,
+        compression: Compression,
+    ):
+        super().__init__(name=f"committed-shard-{index}", daemon=True)
+        self.batcher = batcher
+        self.rows: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.error: Exception | None = None
+        # A dedicated connection per shard, a single connection caps the throughput of its streams
+        self.session = WriteSession(
+            create_write_client(endpoint, dedicated_connection=True, compression=compression),
+            table_path,
+            StreamType.COMMITTED,
+            descriptor,
+            max_in_flight=max_in_flight,
+        )
+
+    def run(self):
+        for chunk in iter(self.rows.get, _STOP):
+            if self.error is not None:
+                # Keep consuming so producers never block on a failed shard, the error is raised to them instead
+                continue
+            try:
+                if isinstance(chunk, list):
+                    for batch in self.batcher.batches(chunk):
+                        self.session.append(batch)
+                else:
+                    self.session.append_proto_rows(chunk)
+            except Exception as e:  # noqa: BLE001
+                # Whatever failed in this thread is raised to the producer on its next put, or from close
+                self.error = e
+        if self.error is None:
+            try:
+                self.session.sender.drain()
+            except Exception as e:  # noqa: BLE001
+                self.error = e
+
+    def put(self, chunk: list[dict] | bytes | memoryview):
+        if self.error is not None:
+            raise self.error
+        self.rows.put(chunk)
+
+
+class ShardedCommittedWriter:
+    """
+    Writes rows to one table through several COMMITTED streams in parallel.
+
+    Every shard owns a write stream on a dedicated gRPC connection and a worker thread that encodes, batches and
+    pipelines the rows it receives. Rows are spread round-robin in chunks of ``max_rows_per_request`` rows, or by
+    the value of ``shard_key`` so that rows with the same key always go to the same stream (in order).
+    Every stream keeps its own offsets, and all streams are finalized when the writer is closed.
+
+    Use it as a context manager:
+
+        with ShardedCommittedWriter(table_path, RawEnrollments.DESCRIPTOR, shard_count=4) as writer:
+            writer.write(enrollments)
+    """
+
+    def __init__(
+        self,
+        table_path: str,
+        descriptor: Descriptor,
+        shard_count: int = 4,
+        shard_key: str | None = None,
+        max_rows_per_request: int = 500,
+        max_request_bytes: int = DEFAULT_MAX_REQUEST_BYTES,
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+        queue_size: int = 4,
+        endpoint: str | None = None,
+        compression: Compression = Compression.NONE,
+    ):
+        if shard_count < 1:
+            raise ValueError("🛑 shard_count must be positive")
+        self.logger = logging.getLogger(__name__)
+        self.table_path = table_path
+        self.shard_key = shard_key
+        self.max_rows_per_request = max_rows_per_request
+
+        batcher = RequestBatcher(
+            RowEncoder.for_descriptor(descriptor), max_rows=max_rows_per_request, max_bytes=max_request_bytes
+        )
+        self.shards = [
+            _Shard(
+                i,
+                table_path,
+                descriptor,
+                batcher,
+                max_in_flight=max_in_flight,
+                queue_size=queue_size,
+                endpoint=endpoint,
+                compression=compression,
+            )
+            for i in range(shard_count)
+        ]
+        for shard in self.shards:
+            shard.start()
+        self._round_robin = itertools.cycle(self.shards)
+        self.closed = False
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, rows: Iterable[dict]):
+        """Hand rows to the shards, blocking when their queues are full"""
+        if self.shard_key is None:
+            for batch in itertools.batched(rows, self.max_rows_per_request):
+                next(self._round_robin).put(list(batch))
+            return
+
+        shard_count = len(self.shards)
+        chunks: list[list[dict]] = [[] for _ in self.shards]
+        for row in rows:
+            # A stable hash, the built-in hash() of strings changes between processes
+            index = zlib.crc32(str(row[self.shard_key]).encode()) % shard_count
+            shard_rows = chunks[index]
+            shard_rows.append(row)
+            if len(shard_rows) >= self.max_rows_per_request:
+                self.shards[index].put(shard_rows)
+                chunks[index] = []
+        for index, shard_rows in enumerate(chunks):
+            if shard_rows:
+                self.shards[index].put(shard_rows)
+
+    def write_proto_rows(self, proto_rows: Iterable[bytes | memoryview]):
+        """Hand requests worth of rows in the ``ProtoRows`` wire format (e.g. RowCorpus slices) to the shards
+
+        Every slice becomes one request on the next shard, round-robin. The rows are not decoded, so they can't be
+        routed by ``shard_key``.
+        """
+        if self.shard_key is not None:
+            raise ValueError(
+                "🛑 Serialized rows can't be sharded by key, create the writer without shard_key"
+            )
+        for chunk in proto_rows:
+            next(self._round_robin).put(chunk)
+
+    def offsets(self) -> dict[str, int]:
+        """Offset after the last acknowledged row of every stream"""
+        return {shard.session.stream_name: shard.session.sender.acked_offset or 0 for shard in self.shards}
+
+    def close(self) -> dict[str, int]:
+        """Wait for every shard, then finalize all streams
+
+        Returns:
+            dict[str, int]: Finalized row count per stream name
+        """
+        if self.closed:
+            return {}
+        self.closed = True
+        for shard in self.shards:
+            shard.rows.put(_STOP)
+        for shard in self.shards:
+            shard.join()
+
+        errors = [shard.error for shard in self.shards if shard.error is not None]
+        row_counts = {}
+        for shard in self.shards:
+            try:
+                if shard.error is not None:
+                    # Streams of failed shards are closed without finalizing, so they can be inspected or resumed
+                    self._close_failed(shard)
+                    continue
+                row_count = shard.session.close()
+                if row_count is not None:
+                    row_counts[shard.session.stream_name] = row_count
+                    self.logger.info(
+                        f"🏁 Finalized stream '{shard.session.stream_name}' with {row_count} rows"
+                    )
+            finally:
+                # The dedicated connection of the shard
+                shard.session.write_client.transport.close()
+        if errors:
+            raise errors[0]
+        return row_counts
+
+    def _close_failed(self, shard: _Shard):
+        self.logger.error(f"🚨 Stream '{shard.session.stream_name}' failed: {shard.error}")
+        try:
+            shard.session.close(finalize=False)
+        except Exception as e:  # noqa: BLE001
+            # The appends still in flight after the first failure fail as well
+            self.logger.debug(
+                f"Ignoring error while closing failed stream '{shard.session.stream_name}': {e}"
+            )
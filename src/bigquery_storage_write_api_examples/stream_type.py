@@ -0,0 +1,8 @@
+from enum import Enum
+
+
+class StreamType(Enum):
+    DEFAULT = "default"
+    COMMITTED = "committed"
+    PENDING = "pending"
+    BUFFERED = "buffered"
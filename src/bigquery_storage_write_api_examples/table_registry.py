@@ -0,0 +1,58 @@
+from google.protobuf.message import Message
+
+from bigquery_storage_write_api_examples import Config
+from bigquery_storage_write_api_examples.entities.classes.classes_pb2 import RawClasses
+from bigquery_storage_write_api_examples.entities.courses.courses_pb2 import RawCourses
+from bigquery_storage_write_api_examples.entities.enrollments.enrollments_pb2 import (
+    RawEnrollments,
+)
+from bigquery_storage_write_api_examples.entities.students.students_pb2 import (
+    RawStudents,
+)
+from bigquery_storage_write_api_examples.schema_descriptor import (
+    SCHEMAS_DIR,
+    live_table_schema,
+    message_class_for_schema,
+    schema_file_message_class,
+)
+
+# Compiled protobuf message of every table in misc/schemas
+MESSAGE_CLASSES: dict[str, type[Message]] = {
+    "students": RawStudents,
+    "courses": RawCourses,
+    "enrollments": RawEnrollments,
+    "classes": RawClasses,
+}
+
+
+def message_class(table_id: str) -> type[Message]:
+    """Return the compiled protobuf message class of a table, or one built at runtime from its schema JSON
+
+    Tables without a compiled message only need their schema in ``misc/schemas``.
+
+    Raises:
+        ValueError: If there is neither a compiled message nor a schema file for the table
+    """
+    compiled = MESSAGE_CLASSES.get(table_id)
+    if compiled is not None:
+        return compiled
+    if not (SCHEMAS_DIR / f"{table_id}.json").is_file():
+        raise ValueError(
+            f"🛑 No message class for table '{table_id}', expected one of {list(MESSAGE_CLASSES)} "
+            f"or a schema file in {SCHEMAS_DIR}"
+        )
+    return schema_file_message_class(table_id)
+
+
+def configured_message_class(config: Config, table_id: str) -> type[Message]:
+    """Return the message class of a table from the source set by ``descriptor_source`` in the config"""
+    match config.descriptor_source:
+        case "compiled":
+            return message_class(table_id)
+        case "schema":
+            return schema_file_message_class(table_id)
+        case "table":
+            schema = live_table_schema(config.gcp_project_id, config.gcp_dataset_id, table_id)
+            return message_class_for_schema(table_id, schema)
+        case _:
+            raise ValueError(f"🛑 Unknown descriptor source: {config.descriptor_source}")
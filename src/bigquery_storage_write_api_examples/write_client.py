@@ -0,0 +1,74 @@
+import grpc
+from google.cloud.bigquery_storage_v1 import BigQueryWriteClient
+from google.cloud.bigquery_storage_v1.services.big_query_write import (
+    BigQueryWriteAsyncClient,
+)
+from google.cloud.bigquery_storage_v1.services.big_query_write.transports import (
+    BigQueryWriteGrpcAsyncIOTransport,
+    BigQueryWriteGrpcTransport,
+)
+
+from bigquery_storage_write_api_examples.compression import Compression
+
+# Same message size limits as the channels the BigQueryWriteGrpcTransport creates itself
+_CHANNEL_OPTIONS = [("grpc.max_send_message_length", -1), ("grpc.max_receive_message_length", -1)]
+
+
+def create_write_client(
+    endpoint: str | None = None,
+    dedicated_connection: bool = False,
+    compression: Compression = Compression.NONE,
+) -> BigQueryWriteClient:
+    """Create a BigQueryWriteClient
+
+    Args:
+        endpoint (str | None): ``host:port`` of a Write API compatible server without TLS or credentials, e.g. the
+            local stand-in server. None for BigQuery.
+        dedicated_connection (bool): gRPC shares TCP connections between channels with the same target and arguments
+            through a global subchannel pool. Set this to give the client a connection of its own, e.g. when every
+            stream of a parallel writer should get its own socket.
+        compression (Compression): Compression of the requests the channel sends, trades CPU for bandwidth
+    """
+    extra_options = [("grpc.use_local_subchannel_pool", 1)] if dedicated_connection else []
+    if endpoint is not None:
+        channel = grpc.insecure_channel(
+            endpoint, options=[*_CHANNEL_OPTIONS, *extra_options], compression=compression.grpc
+        )
+        return BigQueryWriteClient(transport=BigQueryWriteGrpcTransport(channel=channel))
+    if not dedicated_connection and compression is Compression.NONE:
+        return BigQueryWriteClient()
+
+    def create_channel(*args, options=(), **kwargs):
+        return BigQueryWriteGrpcTransport.create_channel(
+            *args, options=[*options, *extra_options], compression=compression.grpc, **kwargs
+        )
+
+    def create_transport(**kwargs) -> BigQueryWriteGrpcTransport:
+        return BigQueryWriteGrpcTransport(channel=create_channel, **kwargs)
+
+    return BigQueryWriteClient(transport=create_transport)
+
+
+def create_async_write_client(
+    endpoint: str | None = None, compression: Compression = Compression.NONE
+) -> BigQueryWriteAsyncClient:
+    """Create a BigQueryWriteAsyncClient, its calls must be awaited in the event loop it was created in
+
+    Args:
+        endpoint (str | None): ``host:port`` of a Write API compatible server without TLS or credentials, e.g. the
+            local stand-in server. None for BigQuery.
+        compression (Compression): Compression of the requests the channel sends, trades CPU for bandwidth
+    """
+    if endpoint is not None:
+        channel = grpc.aio.insecure_channel(endpoint, options=_CHANNEL_OPTIONS, compression=compression.grpc)
+        return BigQueryWriteAsyncClient(transport=BigQueryWriteGrpcAsyncIOTransport(channel=channel))
+    if compression is Compression.NONE:
+        return BigQueryWriteAsyncClient()
+
+    def create_channel(*args, **kwargs):
+        return BigQueryWriteGrpcAsyncIOTransport.create_channel(*args, compression=compression.grpc, **kwargs)
+
+    def create_transport(**kwargs) -> BigQueryWriteGrpcAsyncIOTransport:
+        return BigQueryWriteGrpcAsyncIOTransport(channel=create_channel, **kwargs)
+
+    return BigQueryWriteAsyncClient(transport=create_transport)
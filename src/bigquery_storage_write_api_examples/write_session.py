@@ -0,0 +1,188 @@
+import logging
+from collections.abc import Sequence
+
+from google.cloud.bigquery_storage_v1 import BigQueryWriteClient, types
+from google.cloud.bigquery_storage_v1.writer import AppendRowsStream
+from google.protobuf.descriptor import Descriptor
+from google.protobuf.descriptor_pb2 import DescriptorProto
+
+from bigquery_storage_write_api_examples.append_sender import (
+    DEFAULT_MAX_IN_FLIGHT,
+    AckCallback,
+    PendingAppend,
+    PipelinedAppendSender,
+)
+from bigquery_storage_write_api_examples.compression import Compression
+from bigquery_storage_write_api_examples.metrics import WriterMetrics
+from bigquery_storage_write_api_examples.request_batcher import (
+    build_request,
+    build_request_from_proto_rows,
+    request_row_count,
+)
+from bigquery_storage_write_api_examples.stream_type import StreamType
+
+WRITE_STREAM_TYPES = {
+    StreamType.COMMITTED: types.WriteStream.Type.COMMITTED,
+    StreamType.PENDING: types.WriteStream.Type.PENDING,
+    StreamType.BUFFERED: types.WriteStream.Type.BUFFERED,
+}
+
+
+class WriteSession:
+    """
+    One write stream on a table, for any stream type.
+
+    Creates the write stream (or uses ``_default``), opens an AppendRowsStream with the writer schema of the given
+    message descriptor and appends serialized rows through a PipelinedAppendSender, assigning offsets for the
+    stream types that support them. ``close`` drains the sender and finalizes the stream, pending streams still
+    need to be committed with ``WriteSession.commit``.
+
+    Pass ``resume_stream`` and ``resume_offset`` (e.g. from a CheckpointLog) to continue writing an existing
+    COMMITTED, PENDING or BUFFERED stream after a crash instead of creating a new one. With ``metrics`` the appends
+    are recorded under the table and stream name, pass the ``compression`` of the client's channel to record their
+    compressed size as well.
+
+    The examples spell these steps out one by one, this class packages them for the writers that run many streams.
+    """
+
+    def __init__(
+        self,
+        write_client: BigQueryWriteClient,
+        table_path: str,
+        stream_type: StreamType,
+        descriptor: Descriptor,
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+        on_ack: AckCallback | None = None,
+        resume_stream: str | None = None,
+        resume_offset: int = 0,
+        metrics: WriterMetrics | None = None,
+        compression: Compression = Compression.NONE,
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.write_client = write_client
+        self.table_path = table_path
+        self.stream_type = stream_type
+
+        if stream_type is StreamType.DEFAULT:
+            if resume_stream is not None:
+                raise ValueError("🛑 The default stream has no offsets, it can't be resumed")
+            self.stream_name = f"{table_path}/streams/_default"
+            # The default stream doesn't support offsets
+            self.next_offset: int | None = None
+        elif resume_stream is not None:
+            write_stream = write_client.get_write_stream(name=resume_stream)
+            if write_stream.type_ != WRITE_STREAM_TYPES[stream_type]:
+                raise ValueError(
+                    f"🛑 Stream '{resume_stream}' is a {write_stream.type_.name} stream, not {stream_type.value}"
+                )
+            self.stream_name = write_stream.name
+            # Continue at the first row that wasn't acknowledged, rows that were written anyway are skipped
+            # by the server with ALREADY_EXISTS
+            self.next_offset = resume_offset
+            self.logger.info(f"⏩ Resuming stream '{self.stream_name}' at offset {resume_offset}")
+        else:
+            write_stream = types.WriteStream(type_=WRITE_STREAM_TYPES[stream_type])
+            write_stream = write_client.create_write_stream(parent=table_path, write_stream=write_stream)
+            self.stream_name = write_stream.name
+            # The first request must always have an offset of 0
+            self.next_offset = 0
+
+        proto_descriptor = DescriptorProto()
+        descriptor.CopyToProto(proto_descriptor)
+        request_template = types.AppendRowsRequest(
+            write_stream=self.stream_name,
+            proto_rows=types.AppendRowsRequest.ProtoData(
+                writer_schema=types.ProtoSchema(proto_descriptor=proto_descriptor)
+            ),
+        )
+        self.append_rows_stream = AppendRowsStream(write_client, request_template)
+        self.sender = PipelinedAppendSender(
+            self.append_rows_stream,
+            max_in_flight=max_in_flight,
+            on_ack=on_ack,
+            metrics=metrics.stream(table_path, self.stream_name) if metrics else None,
+            compression=compression,
+        )
+        if resume_stream is not None:
+            self.sender.acked_offset = resume_offset
+        self.closed = False
+
+    def append(self, serialized_rows: list[bytes]) -> PendingAppend:
+        """Send one request with the given rows, blocking only when the in-flight window is full"""
+        request = build_request(serialized_rows, self.next_offset)
+        if self.next_offset is not None:
+            # Offset must equal the number of rows that were previously sent
+            self.next_offset += len(serialized_rows)
+        return self.sender.send(request)
+
+    def append_proto_rows(self, proto_rows: bytes | memoryview) -> PendingAppend:
+        """Send one request with rows in the ``ProtoRows`` wire format, e.g. a slice of a RowCorpus"""
+        request = build_request_from_proto_rows(proto_rows, self.next_offset)
+        if self.next_offset is not None:
+            self.next_offset += request_row_count(request)
+        return self.sender.send(request)
+
+    def send(self, request: types.AppendRowsRequest) -> PendingAppend:
+        """Send a prepared request, its offset (if any) must continue where the previous request ended"""
+        if self.next_offset is not None and request._pb.HasField("offset"):
+            self.next_offset = request.offset + request_row_count(request)
+        return self.sender.send(request)
+
+    def flush(self, offset: int | None = None) -> int:
+        """Make the rows of a BUFFERED stream visible up to and including ``offset``
+
+        Args:
+            offset (int | None): Last row to flush, by default every row that was sent (waiting for the acks)
+
+        Returns:
+            int: The flushed offset, -1 when there is nothing to flush
+        """
+        if self.stream_type is not StreamType.BUFFERED:
+            raise ValueError(
+                f"🛑 Only BUFFERED streams can be flushed, this is a {self.stream_type.value} stream"
+            )
+        if offset is None:
+            self.sender.drain()
+            if not self.sender.acked_offset:
+                return -1
+            offset = self.sender.acked_offset - 1
+        request = types.FlushRowsRequest(write_stream=self.stream_name, offset=offset)
+        response = self.write_client.flush_rows(request)
+        return response.offset
+
+    def close(self, finalize: bool = True) -> int | None:
+        """Wait for the in-flight requests, close the connection and finalize the stream
+
+        Returns:
+            int | None: Row count of the finalized stream, None for the default stream or when not finalizing
+        """
+        if self.closed:
+            return None
+        self.closed = True
+        try:
+            self.sender.drain()
+        finally:
+            if self.append_rows_stream.is_active:
+                self.append_rows_stream.close()
+
+        if not finalize or self.stream_type is StreamType.DEFAULT:
+            return None
+        response = self.write_client.finalize_write_stream(name=self.stream_name)
+        self.logger.debug(f"🏁 Finalized stream '{self.stream_name}' with {response.row_count} rows")
+        return response.row_count
+
+    @staticmethod
+    def commit(
+        write_client: BigQueryWriteClient, table_path: str, sessions: Sequence["WriteSession | str"]
+    ) -> types.BatchCommitWriteStreamsResponse:
+        """Atomically commit finalized PENDING streams of one table, given as sessions or stream names"""
+        request = types.BatchCommitWriteStreamsRequest(
+            parent=table_path,
+            write_streams=[
+                session if isinstance(session, str) else session.stream_name for session in sessions
+            ],
+        )
+        response = write_client.batch_commit_write_streams(request)
+        if response.stream_errors:
+            raise RuntimeError(f"🛑 Committing the streams failed: {list(response.stream_errors)}")
+        return response